@@ -0,0 +1,131 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import multiprocessing
+import os
+import threading
+
+DEFAULT_MIN = 2
+DEFAULT_MAX = 16
+DEFAULT_MAX_LOAD = 1.0
+DEFAULT_MAX_STORE_WAIT = 0.2
+DEFAULT_LATENCY_TOLERANCE = 2.0
+
+# Weight of the latest task in the moving averages of the latency of the
+# operations
+_LATENCY_WEIGHT = 0.3
+
+
+def load_per_cpu():
+    """
+    The 1 minute load average of the manager, per CPU.
+    """
+    return os.getloadavg()[0] / multiprocessing.cpu_count()
+
+
+class ConcurrencyLimit(object):
+    """
+    The number of tasks of a workflow allowed to run at once, adapted to the
+    manager as its tasks end.
+
+    The limit starts at `minimum`, and is decided upon again once every
+    window of as many tasks as the limit end. It is halved (down to
+    `minimum`) when the manager is congested: the load per CPU is above
+    `max_load`, the status of a task took more than `max_store_wait` seconds
+    on average to be stored (mostly waiting for the lock of the SQLite store
+    of the tenant), or the tasks of the window were on average more than
+    `latency_tolerance` times slower than their operations used to be.
+    Otherwise, it is doubled until the first congestion, and then raised by
+    one (up to `maximum`).
+
+    The latency of every operation is compared with its own lowest moving
+    average only, as the operations of a workflow may take from seconds to
+    minutes regardless of the manager.
+    """
+
+    def __init__(self, minimum=DEFAULT_MIN, maximum=DEFAULT_MAX,
+                 max_load=DEFAULT_MAX_LOAD,
+                 max_store_wait=DEFAULT_MAX_STORE_WAIT,
+                 latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                 load=load_per_cpu):
+        if not 1 <= minimum <= maximum:
+            raise ValueError('Invalid task concurrency bounds: {0}..{1}'
+                             .format(minimum, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self._max_load = max_load
+        self._max_store_wait = max_store_wait
+        self._latency_tolerance = latency_tolerance
+        self._load = load
+
+        self._lock = threading.Lock()
+        self._limit = minimum
+        self._slow_start = True
+        # The moving average of the latency of every operation, and its
+        # lowest value, by operation
+        self._latencies = {}
+        self._window_tasks = 0
+        self._window_store_wait = 0.0
+        self._window_slowdown = 0.0
+        # The limits in the order they were picked
+        self.picked = [minimum]
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def task_ended(self, operation, latency, store_wait):
+        """
+        Accounts for a task of an operation which ran for `latency` seconds,
+        and whose status took `store_wait` seconds to be stored.
+
+        :param operation: any key of the operation of the task, the tasks of
+         which are expected to take alike times.
+        :return: the limit.
+        """
+        with self._lock:
+            average, lowest = self._latencies.get(operation, (latency, None))
+            average = _LATENCY_WEIGHT * latency + \
+                (1 - _LATENCY_WEIGHT) * average
+            lowest = min(lowest, average) if lowest is not None else average
+            self._latencies[operation] = (average, lowest)
+            self._window_tasks += 1
+            self._window_store_wait += store_wait
+            self._window_slowdown += average / lowest if lowest else 1.0
+            if self._window_tasks >= self._limit:
+                self._adapt()
+            return self._limit
+
+    def _adapt(self):
+        if self._congested():
+            limit = max(self.minimum, self._limit // 2)
+            self._slow_start = False
+        elif self._slow_start:
+            limit = min(self.maximum, self._limit * 2)
+        else:
+            limit = min(self.maximum, self._limit + 1)
+        self._window_tasks = 0
+        self._window_store_wait = 0.0
+        self._window_slowdown = 0.0
+        if limit != self._limit:
+            self._limit = limit
+            self.picked.append(limit)
+
+    def _congested(self):
+        return (self._load() > self._max_load or
+                self._window_store_wait / self._window_tasks >
+                self._max_store_wait or
+                self._window_slowdown / self._window_tasks >
+                self._latency_tolerance)
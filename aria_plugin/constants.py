@@ -16,11 +16,35 @@
 CSAR_PATH_PROPERTY = 'csar_path'
 PLUGINS_PROPERTY = 'plugins'
 INPUTS_PROPERTY = 'inputs'
+INPUTS_FILE_PROPERTY = 'inputs_file'
+PROFILING_PROPERTY = 'profiling'
+METRICS_PROPERTY = 'metrics'
+RETENTION_PROPERTY = 'retention'
+PARSE_CACHE_PROPERTY = 'parse_cache'
+DAEMON_PROPERTY = 'daemon'
+STORAGE_PROPERTY = 'storage'
+PLUGIN_STORE_PROPERTY = 'plugin_store'
+LOGGING_PROPERTY = 'logging'
+CONCURRENCY_PROPERTY = 'concurrency'
+TRACING_PROPERTY = 'tracing'
 
 ARIA_PLUGINS_DIR = 'plugins'
 ARIA_MODELS_DIR = 'models'
 ARIA_RESOURCES_DIR = 'resources'
+ARIA_PROFILES_DIR = 'profiles'
+ARIA_TRACES_DIR = 'traces'
+ARIA_CSAR_CACHE_DIR = 'csar-cache'
+EXTRACTED_CSARS_DIR = 'extracted'
+ARIA_PARSE_CACHE_DIR = '.aria-parse-cache'
+ARIA_PLUGIN_STORE_DIR = '.aria-plugin-store'
+ARIA_RESOURCE_BLOBS_DIR = '.aria-resource-blobs'
+ARIA_SNAPSHOTS_DIR_FORMAT = 'aria-{tenant_name}-snapshots'
+
+MODEL_STORAGE_FILENAME = 'db.sqlite'
+MAINTENANCE_STAMP_FILENAME = '.last-maintenance'
+REGISTRY_FILENAME = 'registry.json'
 
 WAGON_EXTENSION = '.wgn'
 
 SERVICE_TEMPLATE_NAME_FORMAT = '{tenant}-{dep_id}'
+STAGING_SERVICE_TEMPLATE_NAME_FORMAT = '{name}~update'
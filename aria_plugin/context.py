@@ -0,0 +1,61 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+from collections import namedtuple
+
+Entity = namedtuple('Entity', 'id')
+Node = namedtuple('Node', 'properties')
+Instance = namedtuple('Instance', 'runtime_properties')
+
+
+class LocalContext(object):
+    """
+    A stand-in for the Cloudify operation context, holding only what the
+    plugin operations use of it.
+
+    It lets the operations run outside of a Cloudify agent, e.g. in the
+    plugin daemon or from command line tools.
+    """
+
+    def __init__(self, tenant_name, blueprint_id, deployment_id,
+                 properties, runtime_properties=None, logger=None):
+        self.tenant_name = tenant_name
+        self.blueprint = Entity(blueprint_id)
+        self.deployment = Entity(deployment_id)
+        self.node = Node(properties)
+        self.instance = Instance(runtime_properties or {})
+        self.logger = logger or logging.getLogger(
+            'aria_plugin.{0}'.format(deployment_id))
+
+    @classmethod
+    def from_ctx(cls, ctx, logger=None):
+        return cls(tenant_name=ctx.tenant_name,
+                   blueprint_id=ctx.blueprint.id,
+                   deployment_id=ctx.deployment.id,
+                   properties=dict(ctx.node.properties),
+                   runtime_properties=dict(ctx.instance.runtime_properties),
+                   logger=logger)
+
+    @classmethod
+    def from_dict(cls, context, logger=None):
+        return cls(logger=logger, **context)
+
+    def to_dict(self):
+        return dict(tenant_name=self.tenant_name,
+                    blueprint_id=self.blueprint.id,
+                    deployment_id=self.deployment.id,
+                    properties=self.node.properties,
+                    runtime_properties=self.instance.runtime_properties)
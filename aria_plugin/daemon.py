@@ -0,0 +1,214 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+A long-lived process serving the plugin operations over a Unix socket.
+
+The daemon keeps the ARIA extensions, and the storages and plugin managers
+of the tenants, resident across operations. The operations of a deployment
+are served one at a time, while those of different deployments run
+concurrently, as they would in their deployment agents.
+
+Run it with `python -m aria_plugin.daemon --socket <path>`, and set the
+`daemon.socket` property of the service nodes to the same path.
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+import SocketServer
+from collections import defaultdict
+from contextlib import closing
+
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+from cloudify.state import current_ctx
+
+from .constants import DAEMON_PROPERTY
+from .context import LocalContext
+from .environment import Environment
+from .exceptions import DaemonUnavailableException
+
+OPERATIONS = ('create', 'update', 'start', 'stop', 'execute_workflow',
+              'delete', 'prune', 'compact', 'archive', 'teardown_tenant',
+              'prewarm_blueprint')
+
+# By tenant and deployment, the tenant-wide operations having no deployment
+_deployment_locks = defaultdict(threading.Lock)
+_deployment_locks_lock = threading.Lock()
+
+
+def socket_path(properties):
+    """
+    The socket of the daemon the operations are sent to, or None if they run
+    in the calling process.
+    """
+    return (properties.get(DAEMON_PROPERTY) or {}).get('socket') or None
+
+
+def request(path, operation_name, ctx, **inputs):
+    """
+    Runs an operation in the daemon, forwarding its logs to the logger of the
+    context and its runtime properties to the node instance.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except socket.error as e:
+        connection.close()
+        raise DaemonUnavailableException(
+            'Could not connect to the plugin daemon at {0}: {1}'
+            .format(path, e))
+
+    with closing(connection):
+        _send(connection.makefile('wb'),
+              operation=operation_name,
+              inputs=inputs,
+              context=LocalContext.from_ctx(ctx).to_dict(),
+              log_level=ctx.logger.getEffectiveLevel())
+        for line in connection.makefile('rb'):
+            message = json.loads(line)
+            if 'log' in message:
+                log = message['log']
+                getattr(ctx.logger, log['level'].lower())(log['message'])
+            elif 'error' in message:
+                raise _operation_error(message['error'], ctx.logger)
+            elif 'result' in message:
+                ctx.instance.runtime_properties.update(
+                    message['result']['runtime_properties'])
+                return
+    raise NonRecoverableError(
+        'The plugin daemon closed the connection before operation {0} ended'
+        .format(operation_name))
+
+
+def run_operation(operation_name, local_ctx, inputs=None):
+    """
+    Runs an operation in the calling thread, with the given context.
+    """
+    # operations send their requests through this module
+    from . import operations
+
+    if operation_name not in OPERATIONS:
+        raise NonRecoverableError(
+            'Unknown operation: {0}'.format(operation_name))
+    with _deployment_lock(local_ctx.tenant_name, local_ctx.deployment.id), \
+            current_ctx.push(local_ctx):
+        getattr(operations, operation_name)(**(inputs or {}))
+
+
+def serve(path):
+    if os.path.exists(path):
+        os.remove(path)
+    Environment.resident = {}
+    server = _Server(path, _RequestHandler)
+    os.chmod(path, 0o600)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Serves the ARIA plugin operations over a Unix socket.')
+    parser.add_argument('--socket', required=True,
+                        help='path of the Unix socket to listen on')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    serve(args.socket)
+
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        write_lock = threading.Lock()
+
+        def send(**message):
+            with write_lock:
+                _send(self.wfile, **message)
+
+        request = json.loads(self.rfile.readline())
+        # The operations run here, rather than being sent on again
+        request['context']['properties'].pop(DAEMON_PROPERTY, None)
+        local_ctx = LocalContext.from_dict(
+            request['context'],
+            logger=_request_logger(send, request.get('log_level',
+                                                     logging.DEBUG)))
+        logging.info('Running operation %s of deployment %s',
+                     request['operation'], local_ctx.deployment.id)
+        try:
+            run_operation(request['operation'], local_ctx,
+                          request.get('inputs'))
+        except Exception as e:
+            logging.exception('Operation %s of deployment %s failed',
+                              request['operation'], local_ctx.deployment.id)
+            send(error=dict(type=type(e).__name__,
+                            message=str(e),
+                            recoverable=not isinstance(e, NonRecoverableError),
+                            traceback=traceback.format_exc()))
+        else:
+            send(result=dict(
+                runtime_properties=local_ctx.instance.runtime_properties))
+
+
+class _SocketLogHandler(logging.Handler):
+
+    def __init__(self, send):
+        super(_SocketLogHandler, self).__init__()
+        self._send = send
+
+    def emit(self, record):
+        self._send(log=dict(level=record.levelname,
+                            message=self.format(record)))
+
+
+def _request_logger(send, level):
+    # Logs the caller would drop are not sent back
+    logger = logging.Logger('aria_plugin.daemon.request', level)
+    logger.addHandler(_SocketLogHandler(send))
+    return logger
+
+
+def _send(stream, **message):
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+
+def _operation_error(error, logger):
+    logger.debug(error['traceback'])
+    message = '{type}: {message}'.format(**error)
+    if error['recoverable']:
+        return RecoverableError(message)
+    return NonRecoverableError(message)
+
+
+def _deployment_lock(tenant_name, deployment_id):
+    with _deployment_locks_lock:
+        return _deployment_locks[(tenant_name, deployment_id)]
+
+
+if __name__ == '__main__':
+    main()
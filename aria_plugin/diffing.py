@@ -0,0 +1,111 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+from collections import namedtuple
+
+from . import workflows
+
+ServiceDiff = namedtuple('ServiceDiff', 'added, removed, changed, unchanged')
+
+
+def diff_services(old_service, new_service):
+    """
+    Compares the nodes of two services by their names.
+
+    A node is changed if its type, properties, interfaces or relationships
+    differ, or if it has a relationship to a changed node, since its
+    relationship operations have to run again once the target is replaced.
+    """
+    old_signatures = dict((name, _signature(node))
+                          for name, node in _nodes(old_service).items())
+    new_nodes = _nodes(new_service)
+    new_signatures = dict((name, _signature(node))
+                          for name, node in new_nodes.items())
+
+    added = set(new_signatures) - set(old_signatures)
+    removed = set(old_signatures) - set(new_signatures)
+    changed = set(name for name in set(new_signatures) & set(old_signatures)
+                  if new_signatures[name] != old_signatures[name])
+
+    replaced = added | changed
+    while True:
+        dependents = set(
+            name for name, node in new_nodes.items()
+            if name not in replaced and any(
+                relationship.target_node.name in replaced
+                for relationship in node.outbound_relationships))
+        if not dependents:
+            break
+        changed |= dependents
+        replaced |= dependents
+
+    unchanged = set(new_signatures) - replaced
+    return ServiceDiff(*(sorted(names) for names in
+                         (added, removed, changed, unchanged)))
+
+
+def installed_changes(service, staging_service):
+    """
+    The names of the added and changed nodes of a staging service which are
+    installed, e.g. by a failed update. Its unchanged nodes only hold the
+    states of those of the service.
+    """
+    diff = diff_services(service, staging_service)
+    installed_nodes = workflows.remaining_nodes(staging_service,
+                                                workflows.UNINSTALLED_STATES)
+    return [name for name in diff.added + diff.changed
+            if name in installed_nodes]
+
+
+def copy_node_states(old_service, new_service, node_names, model_storage):
+    """
+    Carries the state and attributes of the named nodes over to the new
+    service, so they are treated as already installed.
+    """
+    old_nodes = _nodes(old_service)
+    new_nodes = _nodes(new_service)
+    for name in node_names:
+        old_node, new_node = old_nodes[name], new_nodes[name]
+        new_node.state = old_node.state
+        for attribute_name, attribute in old_node.attributes.items():
+            if attribute_name in new_node.attributes:
+                new_node.attributes[attribute_name].value = attribute.value
+        model_storage.node.update(new_node)
+
+
+def _nodes(service):
+    return dict((node.name, node) for node in service.nodes.values())
+
+
+def _signature(node):
+    return _dumps(_canonical(node.as_raw))
+
+
+def _dumps(raw):
+    return json.dumps(raw, sort_keys=True, default=repr)
+
+
+def _canonical(raw):
+    # The order of named items (interfaces, operations, relationships...)
+    # depends on the order the parser met them in, so it is ignored.
+    if isinstance(raw, dict):
+        return dict((key, _canonical(value)) for key, value in raw.items())
+    if isinstance(raw, (list, tuple)):
+        items = [_canonical(item) for item in raw]
+        if all(isinstance(item, dict) and 'name' in item for item in items):
+            return sorted(items, key=_dumps)
+        return items
+    return raw
@@ -13,15 +13,19 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import errno
+import logging
 import os
+import threading
 
 import aria
 from aria.core import Core
 from aria.orchestrator.plugin import PluginManager
 from aria.storage.sql_mapi import SQLAlchemyModelAPI
-from aria.storage.filesystem_rapi import FileSystemResourceAPI
 
-from . import constants, utils
+from . import (concurrency, constants, ephemeral, metrics, parsing,
+               plugin_store, profiling, registry, resources, tracing,
+               utils)
 from .exceptions import MissingServiceException
 
 
@@ -31,8 +35,17 @@ class Environment(object):
     BLUEPRINTS_DIR = os.path.join(MANAGER_RESOURCES_DIR, 'blueprints')
     CLOUDIFY_PLUGINS_DIR = os.path.join(MANAGER_RESOURCES_DIR, 'plugins')
 
+    # The storages and plugin managers kept by a long-lived process across
+    # operations, by working dir and name; None if they are not kept.
+    resident = None
+    # Held while they are created, as the operations of several deployments
+    # of a tenant run at once. Reentrant, as some are created from others.
+    _resident_lock = threading.RLock()
+
     def __init__(self, ctx):
         self._ctx = ctx
+        self._storage_settings = ephemeral.StorageSettings.from_properties(
+            ctx.node.properties)
         self._workdir = self._mk_working_dir()
         utils.silent_create(self.aria_plugins_dir)
         utils.silent_create(self.model_storage_dir)
@@ -45,6 +58,12 @@ class Environment(object):
         self._resource_storage = None
         self._plugin_manager = None
         self._core = None
+        self._profiler = None
+        self._tracer = None
+        self._metrics = None
+        self._parse_cache = None
+        self._plugin_store = None
+        self._registry = None
 
     @property
     def ctx_logger(self):
@@ -54,6 +73,43 @@ class Environment(object):
     def workdir(self):
         return self._workdir
 
+    @property
+    def log_level(self):
+        """
+        The lowest level of the ARIA logs worth forwarding to the operation
+        logger.
+        """
+        settings = self._ctx.node.properties.get(
+            constants.LOGGING_PROPERTY) or {}
+        level = logging.getLevelName(settings.get('level', 'debug').upper())
+        if not isinstance(level, int):
+            raise ValueError('Unknown log level: {0}'
+                             .format(settings['level']))
+        return max(level, self.ctx_logger.getEffectiveLevel())
+
+    @property
+    def task_concurrency(self):
+        """
+        A new adaptive limit of the tasks of a workflow running at once, or
+        None if the tasks are not limited.
+        """
+        settings = self._ctx.node.properties.get(
+            constants.CONCURRENCY_PROPERTY) or {}
+        if not settings.get('enabled', False):
+            return None
+        return concurrency.ConcurrencyLimit(
+            minimum=settings.get('min', concurrency.DEFAULT_MIN),
+            maximum=settings.get('max', concurrency.DEFAULT_MAX),
+            max_load=settings.get('max_load', concurrency.DEFAULT_MAX_LOAD),
+            max_store_wait=settings.get('max_store_wait',
+                                        concurrency.DEFAULT_MAX_STORE_WAIT),
+            latency_tolerance=settings.get(
+                'latency_tolerance', concurrency.DEFAULT_LATENCY_TOLERANCE))
+
+    @property
+    def storage_settings(self):
+        return self._storage_settings
+
     @property
     def blueprint_dir(self):
         return os.path.join(self.BLUEPRINTS_DIR,
@@ -63,34 +119,178 @@ class Environment(object):
     @property
     def model_storage(self):
         if not self._model_storage:
-            initiator_kwargs = {'base_dir': self.model_storage_dir}
-            self._model_storage = aria.application_model_storage(
-                api=SQLAlchemyModelAPI, initiator_kwargs=initiator_kwargs)
+            self._model_storage = self._resident(
+                'model_storage', self._create_model_storage)
         return self._model_storage
 
+    def _create_model_storage(self):
+        initiator_kwargs = {'base_dir': self.model_storage_dir}
+        if self.storage_settings.ephemeral:
+            return aria.application_model_storage(
+                api=SQLAlchemyModelAPI, initiator=ephemeral.init_storage,
+                initiator_kwargs=initiator_kwargs)
+        return aria.application_model_storage(
+            api=SQLAlchemyModelAPI, initiator_kwargs=initiator_kwargs)
+
     @property
     def resource_storage(self):
         if not self._resource_storage:
-            api_kwargs = {'directory': self.resource_storage_dir}
-            self._resource_storage = aria.application_resource_storage(
-                api=FileSystemResourceAPI, api_kwargs=api_kwargs)
+            self._resource_storage = self._resident(
+                'resource_storage', self._create_resource_storage)
         return self._resource_storage
 
+    def _create_resource_storage(self):
+        api_kwargs = {'directory': self.resource_storage_dir,
+                      'blobs_dir': self.resource_blobs_dir}
+        return aria.application_resource_storage(
+            api=resources.ResourceAPI, api_kwargs=api_kwargs)
+
     @property
     def plugin_manager(self):
         if not self._plugin_manager:
-            self._plugin_manager = PluginManager(
-                model=self.model_storage, plugins_dir=self.aria_plugins_dir)
+            self._plugin_manager = self._resident(
+                'plugin_manager', self._create_plugin_manager)
         return self._plugin_manager
 
+    def _create_plugin_manager(self):
+        if self.plugin_store:
+            return plugin_store.SharedPluginManager(
+                model=self.model_storage,
+                plugins_dir=self.aria_plugins_dir,
+                store=self.plugin_store,
+                workdir=self.workdir)
+        return PluginManager(
+            model=self.model_storage, plugins_dir=self.aria_plugins_dir)
+
+    @property
+    def plugin_store(self):
+        """
+        The plugin store shared by all the tenants, or None if it is disabled.
+        """
+        if not self._plugin_store:
+            settings = self._ctx.node.properties.get(
+                constants.PLUGIN_STORE_PROPERTY) or {}
+            if settings.get('enabled', True):
+                self._plugin_store = plugin_store.PluginStore(
+                    self.plugin_store_dir)
+        return self._plugin_store
+
+    @property
+    def registry(self):
+        """
+        The registry of the deployments of the tenant.
+        """
+        if not self._registry:
+            self._registry = registry.Registry(
+                path=self.registry_path, bootstrap=self._registry_entries)
+        return self._registry
+
+    def _registry_entries(self):
+        # A tenant with no model store has no deployments, and it is not
+        # worth creating one for
+        if not os.path.exists(self.model_storage_path):
+            return {}
+        return registry.entries_from_model_storage(self.model_storage,
+                                                   self._ctx.tenant_name)
+
+    def _resident(self, name, create):
+        if self.resident is None:
+            return create()
+        key = (self.workdir, name)
+        with self._resident_lock:
+            if key not in self.resident:
+                self.resident[key] = create()
+            return self.resident[key]
+
     @property
     def core(self):
         if not self._core:
-            self._core = Core(model_storage=self.model_storage,
-                              resource_storage=self.resource_storage,
-                              plugin_manager=self.plugin_manager)
+            kwargs = dict(model_storage=self.model_storage,
+                          resource_storage=self.resource_storage,
+                          plugin_manager=self.plugin_manager)
+            if self.parse_cache:
+                self._core = parsing.CachingCore(
+                    parse_cache=self.parse_cache, **kwargs)
+            else:
+                self._core = Core(**kwargs)
         return self._core
 
+    @property
+    def profiler(self):
+        """
+        The profiler of this operation, or None if profiling is disabled.
+        """
+        if not self._profiler:
+            settings = self._ctx.node.properties.get(
+                constants.PROFILING_PROPERTY) or {}
+            if settings.get('enabled'):
+                self._profiler = profiling.Profiler(
+                    directory=os.path.join(self.profiles_dir,
+                                           self.service_template_name),
+                    retain=settings.get('retain', profiling.DEFAULT_RETAIN))
+        return self._profiler
+
+    @property
+    def tracer(self):
+        """
+        The tracer of the workflow tasks of this operation, or None if tracing
+        is disabled.
+        """
+        if not self._tracer:
+            settings = self._ctx.node.properties.get(
+                constants.TRACING_PROPERTY) or {}
+            if settings.get('enabled'):
+                self._tracer = tracing.Tracer(
+                    directory=os.path.join(self.traces_dir,
+                                           self.service_template_name),
+                    retain=settings.get('retain', tracing.DEFAULT_RETAIN))
+        return self._tracer
+
+    @property
+    def metrics(self):
+        if not self._metrics:
+            settings = self._ctx.node.properties.get(
+                constants.METRICS_PROPERTY) or {}
+            self._metrics = metrics.Metrics(
+                textfile=settings.get('textfile'),
+                tenant=self._ctx.tenant_name)
+        return self._metrics
+
+    @property
+    def parse_cache(self):
+        """
+        The parse cache shared by all the tenants, or None if it is disabled.
+        """
+        if not self._parse_cache:
+            settings = self._ctx.node.properties.get(
+                constants.PARSE_CACHE_PROPERTY) or {}
+            if settings.get('enabled', False):
+                self._parse_cache = parsing.ParseCache(
+                    directory=self.parse_cache_dir,
+                    processes=settings.get('processes'))
+        return self._parse_cache
+
+    @property
+    def model_storage_size(self):
+        if not self.workdir:
+            return 0
+        try:
+            names = os.listdir(self.model_storage_dir)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return 0
+        size = 0
+        for name in names:
+            try:
+                size += os.path.getsize(
+                    os.path.join(self.model_storage_dir, name))
+            except OSError as e:
+                # e.g. a journal of SQLite, removed once it is committed
+                if e.errno != errno.ENOENT:
+                    raise
+        return size
+
     @property
     def aria_plugins_dir(self):
         return os.path.join(self.workdir, 'plugins')
@@ -99,21 +299,82 @@ class Environment(object):
     def model_storage_dir(self):
         return os.path.join(self.workdir, 'models')
 
+    @property
+    def model_storage_path(self):
+        return os.path.join(self.model_storage_dir,
+                            constants.MODEL_STORAGE_FILENAME)
+
+    @property
+    def maintenance_stamp_path(self):
+        return os.path.join(self.model_storage_dir,
+                            constants.MAINTENANCE_STAMP_FILENAME)
+
+    @property
+    def registry_path(self):
+        return os.path.join(self.workdir, constants.REGISTRY_FILENAME)
+
     @property
     def resource_storage_dir(self):
         return os.path.join(self.workdir, 'resources')
 
+    @property
+    def resource_blobs_dir(self):
+        # Next to the working dirs, so that resources can be linked to blobs
+        return os.path.join(os.path.dirname(self.workdir),
+                            constants.ARIA_RESOURCE_BLOBS_DIR)
+
+    @property
+    def csar_cache_dir(self):
+        return os.path.join(self.workdir, constants.ARIA_CSAR_CACHE_DIR)
+
+    @property
+    def parse_cache_dir(self):
+        return os.path.join(self.CLOUDIFY_PLUGINS_DIR,
+                            constants.ARIA_PARSE_CACHE_DIR)
+
+    @property
+    def plugin_store_dir(self):
+        return os.path.join(self.CLOUDIFY_PLUGINS_DIR,
+                            constants.ARIA_PLUGIN_STORE_DIR)
+
+    @property
+    def snapshots_dir(self):
+        return os.path.join(
+            self.CLOUDIFY_PLUGINS_DIR,
+            constants.ARIA_SNAPSHOTS_DIR_FORMAT.format(
+                tenant_name=self._ctx.tenant_name))
+
+    @property
+    def profiles_dir(self):
+        return os.path.join(self.workdir, constants.ARIA_PROFILES_DIR)
+
+    @property
+    def traces_dir(self):
+        return os.path.join(self.workdir, constants.ARIA_TRACES_DIR)
+
     def _mk_working_dir(self):
         dir_name = 'aria-{tenant_name}'.format(
             tenant_name=self._ctx.tenant_name)
-        abs_path = os.path.join(self.CLOUDIFY_PLUGINS_DIR, dir_name)
+        # Ephemeral storages are kept in memory, apart from the persistent
+        # working dir of the tenant
+        root_dir = ephemeral.memory_dir() if self.storage_settings.ephemeral \
+            else self.CLOUDIFY_PLUGINS_DIR
+        abs_path = os.path.join(root_dir, dir_name)
 
         workdir_path = utils.silent_create(abs_path)
 
         return workdir_path
 
     def rm_working_dir(self):
+        if self.plugin_store:
+            self.plugin_store.release(self.workdir)
+        if self.resident is not None:
+            for key in [key for key in self.resident
+                        if key[0] == self.workdir]:
+                del self.resident[key]
+        blobs_dir = self.resource_blobs_dir
         utils.silent_remove(self.workdir)
+        resources.collect_garbage(blobs_dir)
         self._workdir = None
 
     @property
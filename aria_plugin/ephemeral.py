@@ -0,0 +1,98 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from aria.storage import sql_mapi
+from sqlalchemy import event
+
+from . import constants, maintenance, utils
+
+SNAPSHOT_NEVER = 'never'
+SNAPSHOT_ON_FAILURE = 'on_failure'
+SNAPSHOT_ALWAYS = 'always'
+SNAPSHOT_MODES = (SNAPSHOT_NEVER, SNAPSHOT_ON_FAILURE, SNAPSHOT_ALWAYS)
+
+# A RAM backed filesystem, where one is available
+MEMORY_DIR = '/dev/shm'
+
+
+class StorageSettings(object):
+    """
+    How the ARIA storages of the tenant are kept.
+
+    :param ephemeral: keep the model store and the resources in memory, with
+     no durability guarantees, rather than in the working dir.
+    :param snapshot: when to copy the ephemeral storages to disk, after an
+     operation: `never`, `on_failure` or `always`.
+    :param keep_snapshots: number of most recent snapshots to keep.
+    """
+
+    def __init__(self, ephemeral=False, snapshot=SNAPSHOT_NEVER,
+                 keep_snapshots=5):
+        if snapshot not in SNAPSHOT_MODES:
+            raise ValueError('Unknown snapshot mode: {0}'.format(snapshot))
+        self.ephemeral = ephemeral
+        self.snapshot = snapshot
+        self.keep_snapshots = keep_snapshots
+
+    @classmethod
+    def from_properties(cls, properties):
+        return cls(**(properties.get(constants.STORAGE_PROPERTY) or {}))
+
+    def snapshot_due(self, failed):
+        return self.ephemeral and (
+            self.snapshot == SNAPSHOT_ALWAYS or
+            (self.snapshot == SNAPSHOT_ON_FAILURE and failed))
+
+
+def memory_dir():
+    return MEMORY_DIR if os.path.isdir(MEMORY_DIR) \
+        else tempfile.gettempdir()
+
+
+def init_storage(base_dir, filename=constants.MODEL_STORAGE_FILENAME):
+    """
+    ARIA model storage initiator of an ephemeral model store, which is never
+    synced to disk.
+
+    It is passed on to the task worker processes, which use the same store.
+    """
+    storage = sql_mapi.init_storage(base_dir, filename)
+    event.listen(storage['engine'], 'connect', _no_sync)
+    return storage
+
+
+def snapshot(model_storage_path, resource_storage_dir, snapshot_dir):
+    """
+    Copies the model store and the resources to a new snapshot dir.
+    """
+    utils.silent_create(snapshot_dir)
+    maintenance.snapshot(
+        model_storage_path,
+        os.path.join(snapshot_dir, constants.MODEL_STORAGE_FILENAME))
+    shutil.copytree(
+        resource_storage_dir,
+        os.path.join(snapshot_dir, constants.ARIA_RESOURCES_DIR))
+    return snapshot_dir
+
+
+def _no_sync(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('PRAGMA journal_mode = MEMORY')
+    cursor.close()
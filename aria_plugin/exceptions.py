@@ -32,5 +32,33 @@ class AriaWorkflowError(NonRecoverableError):
     pass
 
 
+class InvalidWorkflowException(NonRecoverableError):
+    pass
+
+
 class ServiceTemplateAlreadyExistsException(NonRecoverableError):
     pass
+
+
+class InvalidCSARException(NonRecoverableError):
+    pass
+
+
+class InvalidInputsException(NonRecoverableError):
+    pass
+
+
+class DaemonUnavailableException(Exception):
+    pass
+
+
+class TenantTeardownException(NonRecoverableError):
+    pass
+
+
+class InvalidTenantArchiveException(NonRecoverableError):
+    pass
+
+
+class TenantNotEmptyException(NonRecoverableError):
+    pass
@@ -13,49 +13,242 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import logging
+import threading
+from collections import namedtuple
 from threading import Thread
 
-from aria.orchestrator import execution_preparer
+from aria import logger as aria_logger
 from aria.orchestrator.workflows.core import engine
-from aria.orchestrator.workflows.executor import process
 from aria.cli import logger
+from sqlalchemy import func
 
+from . import resources, tracing, workflows
 from .exceptions import AriaWorkflowError
+from .workers import WorkerProcessExecutor
 
+LOG_EVENT = 'log'
+PROGRESS_EVENT = 'progress'
 
-def execute(env, workflow_name):
+# A log of the execution, or the counts of its tasks by status once they
+# change
+WorkflowEvent = namedtuple('WorkflowEvent', 'kind, data')
 
-    ctx = execution_preparer.ExecutionPreparer(
-        env.model_storage,
-        env.resource_storage,
-        env.plugin_manager,
-        env.service,
-        workflow_name
-    ).prepare()
-    eng = engine.Engine(
-            process.ProcessExecutor(env.plugin_manager, strict_loading=False)
+# The log level of the workflow engine running in the current thread
+_engine_log_level = threading.local()
+
+
+class _EngineLogFilter(logging.Filter):
+    """
+    Drops the logs of the workflow engines below their levels, before ARIA
+    stores them. The logger of the tasks is shared by all the engines of the
+    process.
+    """
+
+    def filter(self, record):
+        return record.levelno >= getattr(_engine_log_level, 'level',
+                                         logging.NOTSET)
+
+
+_engine_log_filter = _EngineLogFilter()
+
+
+def execute(env, workflow_name, inputs=None, service=None):
+    """
+    Executes a workflow, forwarding its logs to the operation logger.
+    """
+    run = start(env, workflow_name, inputs, service)
+    for _, event in supervise([run]):
+        if event.kind == LOG_EVENT:
+            _forward_log(env, event.data)
+    run.result()
+
+
+def start(env, workflow_name, inputs=None, service=None):
+    """
+    Starts executing a workflow in the background.
+
+    :return: the WorkflowRun of the execution.
+    """
+    service = service or env.service
+    if resources.rehydrate_service(env.resource_storage, service):
+        env.ctx_logger.info('Rehydrated the archived resources of service '
+                            '{0}'.format(service.name))
+    profiler = env.profiler
+    task_executor = WorkerProcessExecutor(
+        plugin_manager=env.plugin_manager,
+        strict_loading=False,
+        worker_env=profiler.worker_env if profiler else None,
+        log_level=env.log_level,
+        concurrency=env.task_concurrency,
+        trace=tracing.TaskTrace() if env.tracer else None
     )
+    try:
+        return WorkflowRun(env, workflow_name, task_executor, profiler,
+                           inputs, service)
+    except BaseException:
+        task_executor.close()
+        raise
+
+
+def supervise(runs, interval=0.1):
+    """
+    Yields the events of workflow runs started by the calling thread, as
+    pairs of a run and an event, until they all end.
+    """
+    pending = list(runs)
+    while pending:
+        for run in list(pending):
+            # Checked first, so that no event of an ended run is missed
+            done = run.done()
+            for event in run.events():
+                yield run, event
+            if done:
+                pending.remove(run)
+        if pending:
+            pending[0].wait(interval)
+
+
+class WorkflowRun(object):
+    """
+    A workflow executing in an engine thread of its own. Its events are read
+    from the model store by the thread which started it, so that one thread
+    can supervise many runs.
+    """
+
+    def __init__(self, env, workflow_name, task_executor, profiler, inputs,
+                 service):
+        self._env = env
+        self._workflow_name = workflow_name
+        env.metrics.workflow_started(workflow_name)
+        self._task_executor = task_executor
+        self._ctx = workflows.ExecutionPreparer(
+            env.model_storage,
+            env.resource_storage,
+            env.plugin_manager,
+            service,
+            workflow_name
+        ).prepare(execution_inputs=inputs, executor=task_executor)
+        eng = engine.Engine(task_executor)
+        execute_workflow = eng.execute
+        if profiler:
+            execute_workflow = profiler.wrap(execute_workflow)
+        # The logs of the tasks below the level are dropped by the task
+        # workers, and those of the engine by the filter
+        execute_workflow = _leveled(execute_workflow, env.log_level)
+        logging.getLogger(aria_logger.TASK_LOGGER_NAME).addFilter(
+            _engine_log_filter)
+
+        self._log_iterator = logger.ModelLogIterator(
+            env.model_storage, self._ctx.execution.id)
+        self._progress = {}
+        self._thread = Thread(target=self._execute, args=(execute_workflow,))
+        self._thread.start()
+
+    @property
+    def workflow_name(self):
+        return self._workflow_name
+
+    @property
+    def execution(self):
+        return self._ctx.execution
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the workflow to end, or for `timeout` seconds.
+
+        :return: whether it ended.
+        """
+        self._thread.join(timeout)
+        return self.done()
+
+    def events(self):
+        """
+        Yields the events of the execution since they were last read, without
+        waiting for new ones.
+        """
+        for log in self._log_iterator:
+            yield WorkflowEvent(LOG_EVENT, log)
+        progress = self._read_progress()
+        if progress != self._progress:
+            self._progress = progress
+            yield WorkflowEvent(PROGRESS_EVENT, progress)
+
+    def result(self):
+        """
+        Waits for the workflow to end.
+
+        :return: the ARIA execution.
+        :raises AriaWorkflowError: if it was not successful.
+        """
+        self.wait()
+        aria_execution = self.execution
+        self._env.metrics.workflow_tasks(self._workflow_name,
+                                         aria_execution.tasks)
+        concurrency = self._task_executor.concurrency
+        if concurrency:
+            self._env.ctx_logger.info(
+                'Task concurrency limits picked for workflow {0} (within '
+                '{1}..{2}): {3}'.format(
+                    self._workflow_name, concurrency.minimum,
+                    concurrency.maximum,
+                    ', '.join(str(limit) for limit in concurrency.picked)))
+            self._env.metrics.task_concurrency(self._workflow_name,
+                                               concurrency)
+        if self._env.tracer:
+            self._write_trace(aria_execution)
+        if aria_execution.status != aria_execution.SUCCEEDED:
+            raise AriaWorkflowError(
+                'ARIA workflow {aria_execution.workflow_name} was not '
+                'successful\n'
+                'status: {aria_execution.status}\n'
+                'error message: {aria_execution.error}'
+                .format(aria_execution=aria_execution))
+        return aria_execution
+
+    def _write_trace(self, aria_execution):
+        trace_path, path_steps = self._env.tracer.write(
+            self._task_executor.trace, self._workflow_name,
+            aria_execution.tasks)
+        self._env.ctx_logger.info(
+            'Critical path of workflow {0} ({1:.3f}s, trace in {2}): {3}'
+            .format(self._workflow_name,
+                    sum(step.waited + step.duration for step in path_steps),
+                    trace_path,
+                    ', '.join('{0} ({1:.3f}s)'.format(step.name,
+                                                      step.duration)
+                              for step in path_steps) or 'no tasks'))
+
+    def _execute(self, execute_workflow):
+        try:
+            execute_workflow(ctx=self._ctx)
+        finally:
+            self._task_executor.close()
+
+    def _read_progress(self):
+        # The statuses are queried rather than loaded as tasks, which the
+        # session of this thread would not refresh
+        task_api = self._ctx.model.task
+        task_cls = task_api.model_cls
+        return dict(task_api._session
+                    .query(task_cls.status, func.count(task_cls.id))
+                    .filter(task_cls.execution_fk == self._ctx.execution.id)
+                    .group_by(task_cls.status))
+
+
+def _leveled(execute_workflow, log_level):
+    def _execute_workflow(**kwargs):
+        _engine_log_level.level = log_level
+        return execute_workflow(**kwargs)
+    return _execute_workflow
+
 
-    # Since we want a live log feed, we need to execute the workflow
-    # while simultaneously printing the logs into the CFY logger. This Thread
-    # executes the workflow, while the main process thread writes the logs.
-    thread = Thread(target=eng.execute, kwargs=dict(ctx=ctx))
-    thread.start()
-
-    log_iterator = logger.ModelLogIterator(env.model_storage, ctx.execution.id)
-
-    while thread.is_alive():
-        for log in log_iterator:
-            leveled_log = getattr(env.ctx_logger, log.level.lower())
-            leveled_log(log)
-            if log.traceback:
-                leveled_log(log.traceback)
-        thread.join(0.1)
-
-    aria_execution = ctx.execution
-    if aria_execution.status != aria_execution.SUCCEEDED:
-        raise AriaWorkflowError(
-            'ARIA workflow {aria_execution.workflow_name} was not successful\n'
-            'status: {aria_execution.status}\n'
-            'error message: {aria_execution.error}'
-            .format(aria_execution=aria_execution))
+def _forward_log(env, log):
+    leveled_log = getattr(env.ctx_logger, log.level.lower())
+    leveled_log(log)
+    if log.traceback:
+        leveled_log(log.traceback)
+    env.metrics.log_forwarded(log.level)
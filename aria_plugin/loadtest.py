@@ -0,0 +1,447 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Runs simulated deployments of one tenant concurrently through the plugin
+operations, measuring their throughput, latencies and errors as concurrency
+goes up.
+
+Run it with `python -m aria_plugin.loadtest --concurrency 1,2,4,8`. By
+default, the deployments use a generated service template whose nodes run a
+no-op script, along with a trivial plugin which every deployment installs,
+and the working dirs are kept under a temporary root dir.
+"""
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import stat
+import tempfile
+import time
+import zipfile
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from aria.cli import csar
+from aria.orchestrator.exceptions import (InvalidPluginError,
+                                          PluginAlreadyExistsError)
+from aria.storage.exceptions import StorageError
+from cloudify.state import current_ctx
+from sqlalchemy.exc import SQLAlchemyError
+from wagon import WagonError
+
+from . import constants, metrics, operations
+from .context import LocalContext
+from .environment import Environment
+from .exceptions import (AriaWorkflowError, MissingPluginsException,
+                         PluginsAlreadyExistException)
+
+DEFAULT_OPERATIONS = ('create', 'start', 'stop', 'delete')
+PERCENTILES = (50, 90, 99)
+BLUEPRINT_ID = 'loadtest'
+CSAR_NAME = 'service.csar'
+
+SERVICE_TEMPLATE = """\
+tosca_definitions_version: tosca_simple_yaml_1_0
+
+topology_template:
+  node_templates:
+{node_templates}
+"""
+NODE_TEMPLATE = """\
+    node_{index}:
+      type: tosca.nodes.Root
+      interfaces:
+        Standard:
+          create: scripts/noop.sh
+          start: scripts/noop.sh
+"""
+NOOP_SCRIPT = '#!/bin/sh\ntrue\n'
+
+PLUGIN_NAME = 'loadtest_plugin'
+PLUGIN_VERSION = '1.0'
+WHEEL_NAME = '{0}-{1}-py2.py3-none-any.whl'.format(PLUGIN_NAME,
+                                                   PLUGIN_VERSION)
+WAGON_NAME = '{0}-{1}-py27-none-any{2}'.format(PLUGIN_NAME, PLUGIN_VERSION,
+                                               constants.WAGON_EXTENSION)
+INSTALL_PHASE = 'install_plugins'
+
+_SQLITE_ERROR_CATEGORIES = (
+    ('database is locked', 'sqlite_locked'),
+    # concurrent first operations of a tenant creating the model store
+    ('already exists', 'sqlite_schema'),
+    # the working dir removed with the last service of the tenant
+    ('unable to open database file', 'sqlite_missing'),
+)
+
+LevelResult = namedtuple(
+    'LevelResult',
+    'concurrency, deployments, duration, latencies, errors, logs, '
+    'plugin_installs')
+
+# attempts counts the plugin installation steps of the operations, each of
+# which installs all the plugins of its deployment, and seconds their average
+PluginInstalls = namedtuple('PluginInstalls',
+                            'attempts, seconds, installed, cached, failed')
+
+
+def run(root_dir, csar_path, concurrency_levels, deployments=None,
+        operation_names=DEFAULT_OPERATIONS, plugins=()):
+    """
+    Runs the operations of `deployments` simulated deployments of a tenant,
+    by default twice as many as the concurrency, at each concurrency level.
+    Every level uses a tenant of its own.
+
+    :param plugins: the wagons of the CSAR which the deployments install.
+    :return: a LevelResult per concurrency level.
+    """
+    results = []
+    with _rooted(root_dir):
+        for concurrency in concurrency_levels:
+            results.append(_run_level(csar_path, concurrency,
+                                      deployments or concurrency * 2,
+                                      operation_names, list(plugins)))
+    return results
+
+
+def write_csar(directory, nodes=1):
+    """
+    Writes a CSAR of a service template with no-op nodes, with the wagon of
+    a trivial plugin, named WAGON_NAME, under its plugins dir.
+    """
+    plugins_dir = os.path.join(directory, 'plugins')
+    os.makedirs(plugins_dir)
+    write_wagon(os.path.join(plugins_dir, WAGON_NAME))
+    scripts_dir = os.path.join(directory, 'scripts')
+    os.makedirs(scripts_dir)
+    script_path = os.path.join(scripts_dir, 'noop.sh')
+    with open(script_path, 'w') as f:
+        f.write(NOOP_SCRIPT)
+    os.chmod(script_path, os.stat(script_path).st_mode | stat.S_IXUSR)
+    service_template_path = os.path.join(directory, 'service.yaml')
+    with open(service_template_path, 'w') as f:
+        f.write(SERVICE_TEMPLATE.format(node_templates=''.join(
+            NODE_TEMPLATE.format(index=index) for index in range(nodes))))
+    csar_path = os.path.join(directory, CSAR_NAME)
+    csar.write(service_template_path, csar_path, logging.getLogger(__name__))
+    return csar_path
+
+
+def write_wagon(path):
+    """
+    Writes the wagon of a trivial plugin, which can be installed offline.
+    """
+    dist_info = '{0}-{1}.dist-info'.format(PLUGIN_NAME, PLUGIN_VERSION)
+    wheel_files = {
+        '{0}/__init__.py'.format(PLUGIN_NAME): '',
+        '{0}/METADATA'.format(dist_info):
+            'Metadata-Version: 2.1\nName: {0}\nVersion: {1}\n'.format(
+                PLUGIN_NAME, PLUGIN_VERSION),
+        '{0}/WHEEL'.format(dist_info):
+            'Wheel-Version: 1.0\nGenerator: {0}\nRoot-Is-Purelib: true\n'
+            'Tag: py2-none-any\nTag: py3-none-any\n'.format(__name__)}
+    wheel_files['{0}/RECORD'.format(dist_info)] = ''.join(
+        '{0},,\n'.format(name)
+        for name in sorted(wheel_files) + ['{0}/RECORD'.format(dist_info)])
+    wheel = io.BytesIO()
+    with zipfile.ZipFile(wheel, 'w') as wheel_zip:
+        for name, content in sorted(wheel_files.items()):
+            wheel_zip.writestr(name, content)
+    package_json = dict(
+        archive_name=WAGON_NAME,
+        build_server_os_properties=dict(distribution=None,
+                                        distribution_release=None,
+                                        distribution_version=None),
+        package_name=PLUGIN_NAME,
+        package_source=PLUGIN_NAME,
+        package_version=PLUGIN_VERSION,
+        supported_platform='any',
+        supported_python_versions=['py27'],
+        wheels=[WHEEL_NAME])
+    # package.json comes first, ARIA looks for it under the first dir
+    with zipfile.ZipFile(path, 'w') as wagon:
+        wagon.writestr('{0}/package.json'.format(PLUGIN_NAME),
+                       json.dumps(package_json, indent=4, sort_keys=True))
+        wagon.writestr('{0}/wheels/{1}'.format(PLUGIN_NAME, WHEEL_NAME),
+                       wheel.getvalue())
+
+
+def percentile(values, percent):
+    """
+    The nearest-rank percentile of the values, or None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def summarize(result):
+    operation_count = sum(len(latencies)
+                          for latencies in result.latencies.values())
+    return dict(
+        concurrency=result.concurrency,
+        deployments=result.deployments,
+        duration=result.duration,
+        operations_per_second=operation_count / result.duration,
+        latencies=dict(
+            (operation_name, dict(
+                ('p{0}'.format(percent), percentile(latencies, percent))
+                for percent in PERCENTILES))
+            for operation_name, latencies in result.latencies.items()),
+        errors=dict(result.errors),
+        logs=result.logs,
+        plugin_installs=result.plugin_installs._asdict())
+
+
+def format_report(results, operation_names=DEFAULT_OPERATIONS):
+    header = ['concurrency', 'deploys', 'seconds', 'ops/s'] + \
+        ['{0} p{1}'.format(operation_name, percent)
+         for operation_name in operation_names for percent in PERCENTILES] + \
+        ['installs', 'install s', 'install fails', 'logs', 'errors']
+    rows = [header]
+    for result in results:
+        summary = summarize(result)
+        rows.append(
+            [str(result.concurrency), str(result.deployments),
+             '{0:.1f}'.format(result.duration),
+             '{0:.2f}'.format(summary['operations_per_second'])] +
+            [_format_seconds(summary['latencies'].get(operation_name, {})
+                             .get('p{0}'.format(percent)))
+             for operation_name in operation_names
+             for percent in PERCENTILES] +
+            [str(result.plugin_installs.attempts),
+             _format_seconds(result.plugin_installs.seconds),
+             str(result.plugin_installs.failed),
+             str(result.logs),
+             ', '.join('{0}={1}'.format(category, count)
+                       for category, count in sorted(result.errors.items()))
+             or '-'])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(width)
+                               for cell, width in zip(row, widths)).rstrip()
+                     for row in rows)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Measures the concurrent deployments a tenant takes.')
+    parser.add_argument('--concurrency', default='1,2,4,8',
+                        help='comma separated concurrency levels')
+    parser.add_argument('--deployments', type=int,
+                        help='deployments per level, by default twice the '
+                             'concurrency')
+    parser.add_argument('--operations', default=','.join(DEFAULT_OPERATIONS),
+                        help='comma separated operations of each deployment')
+    parser.add_argument('--csar',
+                        help='CSAR of the deployments, by default one of '
+                             'no-op nodes and a trivial plugin')
+    parser.add_argument('--plugins',
+                        help='comma separated wagons of the CSAR which the '
+                             'deployments install, by default the trivial '
+                             'plugin of the default CSAR')
+    parser.add_argument('--nodes', type=int, default=5,
+                        help='nodes of the default service template')
+    parser.add_argument('--root',
+                        help='dir of the working dirs, by default a '
+                             'temporary dir which is removed at the end')
+    parser.add_argument('--output', help='path of a JSON report')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    # ARIA sets the levels of its own loggers
+    for handler in logging.root.handlers:
+        handler.setLevel(args.log_level)
+    operation_names = args.operations.split(',')
+    if args.plugins is not None:
+        plugins = [plugin for plugin in args.plugins.split(',') if plugin]
+    else:
+        plugins = [] if args.csar else [WAGON_NAME]
+
+    root_dir = args.root or tempfile.mkdtemp(prefix='aria-loadtest-')
+    try:
+        csar_path = args.csar or write_csar(
+            tempfile.mkdtemp(dir=root_dir), args.nodes)
+        results = run(root_dir, os.path.abspath(csar_path),
+                      [int(level) for level in args.concurrency.split(',')],
+                      args.deployments, operation_names, plugins)
+    finally:
+        if not args.root:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    print(format_report(results, operation_names))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([summarize(result) for result in results], f,
+                      indent=2)
+
+
+def _run_level(csar_path, concurrency, deployments, operation_names,
+               plugins):
+    tenant_name = 'loadtest-{0}'.format(concurrency)
+    blueprint_dir = os.path.join(Environment.BLUEPRINTS_DIR, tenant_name,
+                                 BLUEPRINT_ID)
+    os.makedirs(blueprint_dir)
+    shutil.copy(csar_path, os.path.join(blueprint_dir, CSAR_NAME))
+    # The plugin installations are timed by the metrics of the operations
+    textfile = os.path.join(Environment.MANAGER_RESOURCES_DIR, 'metrics',
+                            '{0}.prom'.format(tenant_name))
+
+    pool = ThreadPool(concurrency)
+    start = time.time()
+    try:
+        deployment_results = pool.map(
+            partial(_deploy, tenant_name, operation_names, plugins,
+                    textfile),
+            range(deployments))
+    finally:
+        pool.close()
+        pool.join()
+    duration = time.time() - start
+
+    latencies = defaultdict(list)
+    errors = Counter()
+    logs = 0
+    for operation_results, deployment_logs in deployment_results:
+        for operation_name, seconds, error in operation_results:
+            if error:
+                errors[error] += 1
+            else:
+                latencies[operation_name].append(seconds)
+        logs += deployment_logs
+    return LevelResult(concurrency=concurrency,
+                       deployments=deployments,
+                       duration=duration,
+                       latencies=dict(latencies),
+                       errors=errors,
+                       logs=logs,
+                       plugin_installs=_plugin_installs(textfile, errors))
+
+
+def _plugin_installs(textfile, errors):
+    samples = metrics.load_state(textfile)[metrics.COUNTERS]
+    install_phase = 'phase="{0}"'.format(INSTALL_PHASE)
+    attempts = _sum_samples(samples,
+                            'aria_plugin_operation_duration_seconds_count',
+                            install_phase)
+    seconds = _sum_samples(samples,
+                           'aria_plugin_operation_duration_seconds_sum',
+                           install_phase)
+    return PluginInstalls(
+        attempts=attempts,
+        seconds=seconds / attempts if attempts else None,
+        installed=_sum_samples(samples, 'aria_plugin_plugin_installs_total',
+                               'result="installed"'),
+        cached=_sum_samples(samples, 'aria_plugin_plugin_installs_total',
+                            'result="cached"'),
+        failed=errors.get('plugin_install', 0))
+
+
+def _sum_samples(samples, name, label):
+    return sum(value for sample, value in samples.items()
+               if sample.split('{', 1)[0] == name and label in sample)
+
+
+def _deploy(tenant_name, operation_names, plugins, textfile, index):
+    deployment_id = 'deployment-{0}'.format(index)
+    log_counter = _LogCounter()
+    logger = logging.getLogger('{0}.{1}.{2}'.format(
+        __name__, tenant_name, deployment_id))
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(log_counter)
+    local_ctx = LocalContext(tenant_name=tenant_name,
+                             blueprint_id=BLUEPRINT_ID,
+                             deployment_id=deployment_id,
+                             properties={constants.CSAR_PATH_PROPERTY:
+                                         CSAR_NAME,
+                                         constants.PLUGINS_PROPERTY: plugins,
+                                         constants.INPUTS_PROPERTY: {},
+                                         constants.METRICS_PROPERTY:
+                                         {'textfile': textfile}},
+                             logger=logger)
+    results = []
+    try:
+        with current_ctx.push(local_ctx):
+            for operation_name in operation_names:
+                start = time.time()
+                try:
+                    getattr(operations, operation_name)()
+                except Exception as e:
+                    results.append((operation_name, time.time() - start,
+                                    _error_category(e)))
+                    # The next operations of the deployment depend on it
+                    break
+                results.append((operation_name, time.time() - start, None))
+    finally:
+        logger.removeHandler(log_counter)
+    return results, log_counter.count
+
+
+def _error_category(error):
+    if isinstance(error, (SQLAlchemyError, StorageError)):
+        for message, category in _SQLITE_ERROR_CATEGORIES:
+            if message in str(error):
+                return category
+    if isinstance(error, (PluginsAlreadyExistException,
+                          PluginAlreadyExistsError, InvalidPluginError,
+                          MissingPluginsException, WagonError)):
+        return 'plugin_install'
+    if isinstance(error, AriaWorkflowError):
+        return 'workflow'
+    return type(error).__name__
+
+
+def _format_seconds(seconds):
+    return '-' if seconds is None else '{0:.2f}'.format(seconds)
+
+
+@contextmanager
+def _rooted(root_dir):
+    # The deployments are kept apart from the working dirs of the manager
+    original_dirs = (Environment.MANAGER_RESOURCES_DIR,
+                     Environment.BLUEPRINTS_DIR,
+                     Environment.CLOUDIFY_PLUGINS_DIR)
+    Environment.MANAGER_RESOURCES_DIR = root_dir
+    Environment.BLUEPRINTS_DIR = os.path.join(root_dir, 'blueprints')
+    Environment.CLOUDIFY_PLUGINS_DIR = os.path.join(root_dir, 'plugins')
+    try:
+        yield
+    finally:
+        (Environment.MANAGER_RESOURCES_DIR,
+         Environment.BLUEPRINTS_DIR,
+         Environment.CLOUDIFY_PLUGINS_DIR) = original_dirs
+
+
+class _LogCounter(logging.Handler):
+
+    def __init__(self):
+        super(_LogCounter, self).__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from . import constants, utils
+
+FINISHED_EXECUTION_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# SQLite limits the number of host parameters of a single statement
+_CHUNK_SIZE = 500
+
+# The first SQLite version with VACUUM INTO
+_VACUUM_INTO_VERSION = (3, 27, 0)
+
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class RetentionPolicy(object):
+    """
+    Which rows of the model store to prune, and which resources to archive.
+    A zero value disables the respective rule.
+
+    :param keep_executions: number of finished executions to keep per
+     service, along with their tasks and logs.
+    :param max_execution_age_days: finished executions which ended before
+     this many days are removed, along with their tasks and logs.
+    :param max_log_age_days: log rows older than this many days are removed,
+     even those of kept executions.
+    :param archive_idle_days: the resources of services which had no
+     execution for this many days are archived.
+    :param maintenance_interval_hours: how often to prune the model store
+     and archive resources automatically, after workflows run.
+
+    The most recent execution of every service is always kept.
+    """
+
+    def __init__(self,
+                 keep_executions=0,
+                 max_execution_age_days=0,
+                 max_log_age_days=0,
+                 archive_idle_days=0,
+                 maintenance_interval_hours=0):
+        self.keep_executions = keep_executions
+        self.max_execution_age_days = max_execution_age_days
+        self.max_log_age_days = max_log_age_days
+        self.archive_idle_days = archive_idle_days
+        self.maintenance_interval_hours = maintenance_interval_hours
+
+    @classmethod
+    def from_properties(cls, properties):
+        return cls(**(properties.get(constants.RETENTION_PROPERTY) or {}))
+
+
+def prune(db_path, policy, now=None):
+    """
+    Removes old executions, with their tasks and logs, and old logs from the
+    model store, according to the retention policy.
+
+    :return: a dict with the number of removed executions and logs.
+    """
+    now = now or datetime.utcnow()
+    with closing(_connect(db_path)) as connection:
+        execution_ids = _executions_to_prune(connection, policy, now)
+        with connection:
+            # Tasks, logs, arguments and inputs of the executions are
+            # removed by the database, but the task dependencies table has
+            # no cascading foreign keys.
+            for chunk in _chunks(execution_ids):
+                task_ids = 'SELECT id FROM task WHERE execution_fk IN ({0})' \
+                    .format(_placeholders(chunk))
+                connection.execute(
+                    'DELETE FROM task_task WHERE task_id IN ({0}) '
+                    'OR task_self_ref_id IN ({0})'.format(task_ids),
+                    chunk * 2)
+                connection.execute(
+                    'DELETE FROM execution WHERE id IN ({0})'
+                    .format(_placeholders(chunk)), chunk)
+            removed_logs = 0
+            if policy.max_log_age_days:
+                removed_logs = connection.execute(
+                    'DELETE FROM log WHERE created_at < ?',
+                    (_cutoff(now, policy.max_log_age_days),)).rowcount
+    return dict(executions=len(execution_ids), logs=removed_logs)
+
+
+def compact(db_path):
+    """
+    Rebuilds the model store file, reclaiming the space of removed rows, and
+    refreshes the statistics used by the query planner.
+
+    :return: the number of reclaimed bytes.
+    """
+    size_before = os.path.getsize(db_path)
+    with closing(_connect(db_path)) as connection:
+        connection.execute('VACUUM')
+        reclaimed = size_before - os.path.getsize(db_path)
+        connection.execute('ANALYZE')
+    return reclaimed
+
+
+def idle_services(db_path, policy, now=None):
+    """
+    The services which were neither updated nor had an execution running
+    within the last `archive_idle_days` days.
+
+    :return: a list of pairs of the ids of the services and of their
+     templates.
+    """
+    if not policy.archive_idle_days:
+        return []
+    cutoff = _cutoff(now or datetime.utcnow(), policy.archive_idle_days)
+    with closing(_connect(db_path)) as connection:
+        rows = connection.execute(
+            'SELECT service.id, service.service_template_fk, '
+            'MAX(COALESCE(service.updated_at, service.created_at), '
+            '    COALESCE(MAX(COALESCE(execution.ended_at, '
+            '                          execution.created_at)), \'\')), '
+            'COUNT(CASE WHEN execution.status NOT IN ({0}) THEN 1 END) '
+            'FROM service LEFT JOIN execution '
+            'ON execution.service_fk = service.id '
+            'GROUP BY service.id'
+            .format(_placeholders(FINISHED_EXECUTION_STATUSES)),
+            FINISHED_EXECUTION_STATUSES)
+        return [(service_id, service_template_id)
+                for service_id, service_template_id, active, running in rows
+                if not running and active < cutoff]
+
+
+def snapshot(db_path, snapshot_path):
+    """
+    Writes a consistent copy of the model store, which may be in use by other
+    connections, to a new file.
+    """
+    with closing(_connect(db_path)) as connection:
+        if sqlite3.sqlite_version_info >= _VACUUM_INTO_VERSION:
+            connection.execute('VACUUM INTO ?', (snapshot_path,))
+            return
+        # The file is copied in a read transaction, whose shared lock keeps
+        # the other connections from writing to it
+        connection.isolation_level = None
+        connection.execute('BEGIN')
+        try:
+            connection.execute('SELECT count(*) FROM sqlite_master').fetchone()
+            shutil.copyfile(db_path, snapshot_path)
+        finally:
+            connection.execute('ROLLBACK')
+
+
+def maintenance_due(stamp_path, policy, now=None):
+    if not policy.maintenance_interval_hours:
+        return False
+    if not os.path.exists(stamp_path):
+        return True
+    now = now or time.time()
+    return now - os.path.getmtime(stamp_path) >= \
+        policy.maintenance_interval_hours * 3600
+
+
+def mark_maintained(stamp_path):
+    utils.atomic_write(stamp_path, datetime.utcnow().isoformat())
+
+
+def _executions_to_prune(connection, policy, now):
+    if not (policy.keep_executions or policy.max_execution_age_days):
+        return []
+    cutoff = _cutoff(now, policy.max_execution_age_days) \
+        if policy.max_execution_age_days else None
+    rows = connection.execute(
+        'SELECT id, service_fk, COALESCE(ended_at, created_at) AS ended '
+        'FROM execution WHERE status IN ({0}) '
+        'ORDER BY service_fk, ended DESC, id DESC'
+        .format(_placeholders(FINISHED_EXECUTION_STATUSES)),
+        FINISHED_EXECUTION_STATUSES)
+    to_prune = []
+    kept_per_service = {}
+    for execution_id, service_id, ended in rows:
+        kept = kept_per_service.get(service_id, 0)
+        if kept and ((policy.keep_executions and
+                      kept >= policy.keep_executions) or
+                     (cutoff and ended < cutoff)):
+            to_prune.append(execution_id)
+        else:
+            kept_per_service[service_id] = kept + 1
+    return to_prune
+
+
+def _connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=60)
+    connection.execute('PRAGMA foreign_keys = ON')
+    return connection
+
+
+def _cutoff(now, days):
+    return (now - timedelta(days=days)).strftime(_DATETIME_FORMAT)
+
+
+def _chunks(items):
+    for i in range(0, len(items), _CHUNK_SIZE):
+        yield items[i:i + _CHUNK_SIZE]
+
+
+def _placeholders(items):
+    return ', '.join('?' * len(items))
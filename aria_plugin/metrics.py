@@ -0,0 +1,194 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import errno
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from . import utils
+
+# name: (type, help)
+METRICS = {
+    'aria_plugin_operation_duration_seconds': (
+        'summary', 'Duration of the plugin operations, by phase.'),
+    'aria_plugin_workflow_tasks': (
+        'gauge', 'ARIA tasks of the last workflow run, by status.'),
+    'aria_plugin_task_concurrency_limit': (
+        'gauge', 'Task concurrency limits picked for the last workflow run: '
+                 'the lowest, the highest and the last one.'),
+    'aria_plugin_forwarded_log_lines_total': (
+        'counter', 'ARIA log lines forwarded to the Cloudify logger.'),
+    'aria_plugin_plugin_installs_total': (
+        'counter', 'Plugin installations, by whether the plugin was already '
+                   'installed (cached).'),
+    'aria_plugin_model_store_bytes': (
+        'gauge', 'Size of the ARIA model store of the tenant.'),
+}
+
+COUNTERS = 'counters'
+GAUGES = 'gauges'
+
+
+class Metrics(object):
+    """
+    Collects the metrics of a single plugin operation.
+
+    The collected metrics are merged into the metrics of all the previous
+    operations of the manager on `flush`, which then rewrites the
+    Prometheus textfile. Without a textfile, nothing is written.
+    """
+
+    def __init__(self, textfile=None, tenant=None):
+        self._textfile = textfile
+        self._tenant = tenant
+        self._counters = Counter()
+        self._gauges = {}
+        # The gauges to remove from the merged metrics, as (name, labels)
+        self._resets = []
+
+    @contextmanager
+    def phase(self, operation, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            labels = dict(operation=operation, phase=phase)
+            self._inc('aria_plugin_operation_duration_seconds_sum',
+                      time.time() - start, **labels)
+            self._inc('aria_plugin_operation_duration_seconds_count',
+                      **labels)
+
+    def workflow_started(self, workflow_name):
+        # Statuses the tasks of the previous run had are no longer exported
+        self._reset('aria_plugin_workflow_tasks', workflow=workflow_name)
+
+    def workflow_tasks(self, workflow_name, tasks):
+        for status, count in Counter(task.status for task in tasks).items():
+            self._set('aria_plugin_workflow_tasks', count,
+                      workflow=workflow_name, status=status)
+
+    def task_concurrency(self, workflow_name, limit):
+        for picked, value in (('lowest', min(limit.picked)),
+                              ('highest', max(limit.picked)),
+                              ('last', limit.limit)):
+            self._set('aria_plugin_task_concurrency_limit', value,
+                      workflow=workflow_name, picked=picked)
+
+    def log_forwarded(self, level):
+        self._inc('aria_plugin_forwarded_log_lines_total', level=level)
+
+    def plugin_installs(self, installed, cached):
+        self._inc('aria_plugin_plugin_installs_total', installed,
+                  result='installed')
+        self._inc('aria_plugin_plugin_installs_total', cached,
+                  result='cached')
+
+    def model_store_size(self, size):
+        self._set('aria_plugin_model_store_bytes', size)
+
+    def flush(self):
+        if not self._textfile:
+            return
+        utils.silent_create(os.path.dirname(self._textfile))
+        with utils.file_lock(self._textfile + '.lock'):
+            state = load_state(self._textfile)
+            for key, value in self._counters.items():
+                state[COUNTERS][key] = state[COUNTERS].get(key, 0) + value
+            for name, labels in self._resets:
+                _remove_samples(state[GAUGES], name, labels)
+            state[GAUGES].update(self._gauges)
+            utils.atomic_write(_state_file(self._textfile),
+                               json.dumps(state, indent=2, sort_keys=True))
+            utils.atomic_write(self._textfile, render(state).encode('utf-8'))
+        self._counters.clear()
+        self._gauges.clear()
+        del self._resets[:]
+
+    def _inc(self, name, value=1, **labels):
+        self._counters[self._sample(name, labels)] += value
+
+    def _set(self, name, value, **labels):
+        self._gauges[self._sample(name, labels)] = value
+
+    def _reset(self, name, **labels):
+        labels['tenant'] = self._tenant
+        self._resets.append((name, labels))
+        _remove_samples(self._gauges, name, labels)
+
+    def _sample(self, name, labels):
+        labels['tenant'] = self._tenant
+        return u'{0}{{{1}}}'.format(name, u','.join(
+            _label(key, value) for key, value in sorted(labels.items())))
+
+
+def load_state(textfile):
+    """
+    Loads the metrics state merged into a textfile, of no metrics if nothing
+    was.
+    """
+    try:
+        with open(_state_file(textfile)) as f:
+            state = json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        state = {}
+    state.setdefault(COUNTERS, {})
+    state.setdefault(GAUGES, {})
+    return state
+
+
+def render(state):
+    """
+    Renders the metrics state in the Prometheus text exposition format, as
+    unicode.
+    """
+    samples = dict(state[COUNTERS])
+    samples.update(state[GAUGES])
+    lines = []
+    for name, (type_, help_) in sorted(METRICS.items()):
+        lines.append(u'# HELP {0} {1}'.format(name, help_))
+        lines.append(u'# TYPE {0} {1}'.format(name, type_))
+        for sample in sorted(samples):
+            if sample.split('{', 1)[0] in (name, name + '_sum',
+                                           name + '_count'):
+                lines.append(u'{0} {1}'.format(sample, samples[sample]))
+    return u'\n'.join(lines) + u'\n'
+
+
+def _state_file(textfile):
+    return textfile + '.json'
+
+
+def _remove_samples(samples, name, labels):
+    label_texts = [_label(key, value) for key, value in labels.items()]
+    for sample in list(samples):
+        if sample.split('{', 1)[0] == name and \
+                all(label_text in sample for label_text in label_texts):
+            del samples[sample]
+
+
+def _label(key, value):
+    return u'{0}="{1}"'.format(key, _escape(value))
+
+
+def _escape(value):
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    return unicode(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
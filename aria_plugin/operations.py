@@ -14,100 +14,381 @@
 #    * limitations under the License.
 
 import os
+import sqlite3
+import time
+from functools import wraps
 
-import aria
+from aria.modeling.exceptions import ParameterException
+from aria.orchestrator.exceptions import (UndeclaredWorkflowError,
+                                          WorkflowImplementationNotFoundError)
+from aria.storage.exceptions import StorageError
 from cloudify import ctx
 from cloudify.decorators import operation
 
-from .constants import (CSAR_PATH_PROPERTY, INPUTS_PROPERTY, PLUGINS_PROPERTY)
+from .constants import (CSAR_PATH_PROPERTY, PLUGINS_PROPERTY,
+                        STAGING_SERVICE_TEMPLATE_NAME_FORMAT)
 from .environment import Environment
-from .exceptions import (PluginsAlreadyExistException,
-                         ServiceTemplateAlreadyExistsException)
+from .exceptions import (DaemonUnavailableException,
+                         InvalidInputsException,
+                         InvalidWorkflowException,
+                         PluginsAlreadyExistException,
+                         ServiceTemplateAlreadyExistsException,
+                         TenantTeardownException)
 from .utils import (generate_resource_path, extract_csar, install_plugins,
-                    cleanup_files)
-from . import executor
+                    install_aria_extensions, cleanup_files, prune_entries,
+                    cached_csar, load_inputs, describe_inputs)
+from . import (daemon, diffing, ephemeral, executor, maintenance, prewarm,
+               registry, resources, teardown, workflows)
+from .parsing import cached_reads
+from .profiling import profiled
+from .validation import validate_csar
+
+
+def _with_env(func):
+    """
+    Runs the operation with the ARIA environment of the current context, or
+    sends it to the plugin daemon if one is configured.
+    """
+    @wraps(func)
+    def _operation(**kwargs):
+        socket_path = daemon.socket_path(ctx.node.properties)
+        if socket_path:
+            # The context is injected by the dispatcher, and sent apart from
+            # the inputs of the operation
+            inputs = dict((name, value) for name, value in kwargs.items()
+                          if name != 'ctx')
+            try:
+                return daemon.request(socket_path, func.__name__, ctx,
+                                      **inputs)
+            except DaemonUnavailableException as e:
+                ctx.logger.warning('{0}, running the operation in the agent'
+                                   .format(e))
+        env = Environment(ctx)
+        try:
+            with profiled(env.profiler, func.__name__), \
+                    env.metrics.phase(func.__name__, 'total'):
+                result = func(env, **kwargs)
+        except Exception:
+            _snapshot_if_due(env, func.__name__, failed=True)
+            raise
+        else:
+            _snapshot_if_due(env, func.__name__, failed=False)
+            return result
+        finally:
+            _flush_metrics(env)
+    return _operation
+
+
+def _snapshot_if_due(env, operation_name, failed):
+    settings = env.storage_settings
+    # The storages are gone once the last service of the tenant is deleted
+    if not settings.snapshot_due(failed) or not env.workdir:
+        return
+    snapshot_dir = os.path.join(
+        env.snapshots_dir,
+        '{0}-{1}-{2}'.format(time.strftime('%Y%m%d-%H%M%S'),
+                             env.service_template_name, operation_name))
+    try:
+        ephemeral.snapshot(env.model_storage_path, env.resource_storage_dir,
+                           snapshot_dir)
+    except Exception as e:
+        ctx.logger.warning('Failed to snapshot the ephemeral storages to {0}: '
+                           '{1}'.format(snapshot_dir, e))
+        return
+    finally:
+        prune_entries(env.snapshots_dir, settings.keep_snapshots)
+    ctx.logger.info('Snapshot of the ephemeral storages saved to {0}'
+                    .format(snapshot_dir))
+
+
+def _flush_metrics(env):
+    try:
+        env.metrics.model_store_size(env.model_storage_size)
+        env.metrics.flush()
+    except (IOError, OSError) as e:
+        # Metrics are not worth failing the operation for
+        ctx.logger.warning('Failed writing plugin metrics: {0}'.format(e))
 
 
 @operation
-def create(**_):
-    env = Environment(ctx)
+@_with_env
+def create(env, **_):
     # Make sure there is no other stored service template with the same name.
     # We check this here, and not catching the exception that ARIA raises in
     # this case since we want to preform this check before any 'heavy-lifting'
-    # operations.
-    if env.model_storage.service_template.list(
-            filters={'name': env.service_template_name}):
+    # operations. The registry answers it without opening the model store,
+    # unless a previous create of the deployment did not complete.
+    entry = env.registry.get(ctx.deployment.id)
+    if entry and (entry['status'] != registry.STATUS_CREATING or
+                  env.model_storage.service_template.list(
+                      filters={'name': env.service_template_name})):
         raise ServiceTemplateAlreadyExistsException(
             '`Install` workflow already ran on deployment(id={deployment.id}).'
             ' In order to run it again, please first run the `Uninstall` '
             'workflow for deployment(id={deployment.id})'.format(
                 deployment=ctx.deployment))
+    env.registry.put(ctx.deployment.id, status=registry.STATUS_CREATING,
+                     service_template_id=None, service_id=None,
+                     csar_digest=None)
+
+    csar_digest = _store_service_template(env, 'create',
+                                          env.service_template_name)
+
+    # create service
+    service_template = env.core.model_storage.service_template.get_by_name(
+        env.service_template_name)
+    inputs = _service_inputs(env, service_template)
+    ctx.logger.info('Creating service {0} with {1}...'
+                    .format(env.service_template_name,
+                            describe_inputs(inputs)))
+    with env.metrics.phase('create', 'create_service'):
+        service = _create_service(env, service_template, inputs)
+    env.registry.put(ctx.deployment.id, status=registry.STATUS_CREATED,
+                     service_template_id=service_template.id,
+                     service_id=service.id, csar_digest=csar_digest)
+    ctx.logger.info('Successfully created service')
+
+
+@operation
+@_with_env
+def update(env, **_):
+    # The updated CSAR is stored aside as a staging service, which replaces
+    # the current one once only its added, removed and changed nodes were
+    # installed and uninstalled.
+    service = env.service
+    staging_name = STAGING_SERVICE_TEMPLATE_NAME_FORMAT.format(
+        name=env.service_template_name)
+    with env.metrics.phase('update', 'workflow'):
+        _uninstall_staging_nodes(env, service, staging_name)
+    _discard_service_template(env, staging_name)
+    csar_digest = _store_service_template(env, 'update', staging_name)
+
+    staging_template = env.model_storage.service_template.get_by_name(
+        staging_name)
+    inputs = _service_inputs(env, staging_template)
+    ctx.logger.info('Creating updated service {0} with {1}...'
+                    .format(staging_name, describe_inputs(inputs)))
+    with env.metrics.phase('update', 'create_service'):
+        staging_service = _create_service(env, staging_template, inputs,
+                                          service_name=staging_name)
+
+    diff = diffing.diff_services(service, staging_service)
+    ctx.logger.info('Updating service {0}: added nodes {1.added}, removed '
+                    'nodes {1.removed}, changed nodes {1.changed}'
+                    .format(env.service_template_name, diff))
 
-    # extract csar
+    with env.metrics.phase('update', 'workflow'):
+        # Nodes may have been uninstalled by a failed update already
+        installed_nodes = workflows.remaining_nodes(
+            service, workflows.UNINSTALLED_STATES)
+        removed_nodes = [name for name in diff.removed + diff.changed
+                         if name in installed_nodes]
+        if removed_nodes:
+            executor.execute(env, workflows.UNINSTALL_NODES,
+                             inputs={'node_names': removed_nodes},
+                             service=service)
+        diffing.copy_node_states(service, staging_service, diff.unchanged,
+                                 env.model_storage)
+        added_nodes = diff.added + diff.changed
+        if added_nodes:
+            executor.execute(env, workflows.INSTALL_NODES,
+                             inputs={'node_names': added_nodes},
+                             service=staging_service)
+
+    # replace the service and its template with the updated ones
+    with env.metrics.phase('update', 'replace_service'):
+        _discard_service_template(env, env.service_template_name)
+        staging_template.name = env.service_template_name
+        env.model_storage.service_template.update(staging_template)
+        staging_service.name = '{0}_{1}'.format(env.service_template_name,
+                                                staging_service.id)
+        env.model_storage.service.update(staging_service)
+    env.registry.put(ctx.deployment.id,
+                     service_template_id=staging_template.id,
+                     service_id=staging_service.id, csar_digest=csar_digest)
+    ctx.logger.info('Successfully updated service {0}'
+                    .format(env.service_template_name))
+
+    ctx.instance.runtime_properties.update(
+        (k, o.value) for k, o in staging_service.outputs.items())
+    _maintain_if_due(env)
+
+
+def _uninstall_staging_nodes(env, service, staging_name):
+    # A staging service left by a failed update may have installed some of
+    # its added and changed nodes, which are uninstalled before it is
+    # discarded. Its unchanged nodes hold the states of those of the service.
+    staging_templates = env.model_storage.service_template.list(
+        filters={'name': staging_name})
+    if not staging_templates:
+        return
+    for staging_service in list(staging_templates[0].services.values()):
+        node_names = diffing.installed_changes(service, staging_service)
+        if not node_names:
+            continue
+        ctx.logger.info('Uninstalling nodes {0} of the service left by a '
+                        'failed update of service {1}...'
+                        .format(node_names, env.service_template_name))
+        executor.execute(env, workflows.UNINSTALL_NODES,
+                         inputs={'node_names': node_names},
+                         service=staging_service)
+
+
+def _service_inputs(env, service_template):
+    service_template_dir = os.path.join(
+        env.resource_storage.service_template.base_path,
+        str(service_template.id))
+    return load_inputs(ctx.node.properties, service_template_dir,
+                       env.blueprint_dir)
+
+
+def _create_service(env, service_template, inputs, **kwargs):
+    try:
+        return env.core.create_service(service_template.id, inputs, **kwargs)
+    except ParameterException as e:
+        raise InvalidInputsException(
+            'Invalid inputs to service template {0}: {1}'
+            .format(service_template.name, e))
+
+
+def _discard_service_template(env, service_template_name):
+    service_templates = env.model_storage.service_template.list(
+        filters={'name': service_template_name})
+    if not service_templates:
+        return
+    service_template = service_templates[0]
+    for service in list(service_template.services.values()):
+        env.core.delete_service(service.id, force=True)
+    env.core.delete_service_template(service_template.id)
+
+
+def _store_service_template(env, operation_name, service_template_name):
+    """
+    :return: the digest of the CSAR, or None if it is not a local file.
+    """
+    # validate the csar, before extracting it
     csar_path = ctx.node.properties[CSAR_PATH_PROPERTY]
     csar_source = generate_resource_path(csar_path, env.blueprint_dir)
-    csar = extract_csar(csar_source, ctx.logger)
-    files_to_remove = [csar.destination]
+    plugins_to_install = ctx.node.properties[PLUGINS_PROPERTY]
+    with env.metrics.phase(operation_name, 'validate_csar'):
+        csar_index = validate_csar(csar_source, plugins_to_install,
+                                   env.csar_cache_dir)
+
+    # extract csar, unless it was extracted ahead of time
+    files_to_remove = []
+    with env.metrics.phase(operation_name, 'extract_csar'):
+        csar = cached_csar(env.csar_cache_dir, csar_index)
+        if not csar:
+            csar = extract_csar(csar_source, ctx.logger)
+            files_to_remove.append(csar.destination)
     csar_plugins_dir = os.path.join(csar.destination, 'plugins')
 
     # install plugins
-    plugins_to_install = ctx.node.properties[PLUGINS_PROPERTY]
     ctx.logger.info('Installing required plugins for ARIA: {0}...'
                     .format(plugins_to_install))
-    try:
-        install_plugins(csar_plugins_dir, plugins_to_install,
-                        env.plugin_manager, ctx.logger)
-    except PluginsAlreadyExistException as e:
-        ctx.logger.debug(e.message)
+    cached_plugins = []
+    with env.metrics.phase(operation_name, 'install_plugins'):
+        try:
+            install_plugins(csar_plugins_dir, plugins_to_install,
+                            env.plugin_manager, ctx.logger)
+        except PluginsAlreadyExistException as e:
+            ctx.logger.debug(e.message)
+            cached_plugins = e.args[0] if e.args else []
+    env.metrics.plugin_installs(
+        installed=len(plugins_to_install) - len(cached_plugins),
+        cached=len(cached_plugins))
     ctx.logger.info('Successfully installed required plugins')
 
     # store service template
-    aria.install_aria_extensions(strict=False)
+    install_aria_extensions()
     service_template_path = os.path.join(csar.destination,
                                          csar.entry_definitions)
     ctx.logger.info('Storing service template {0}...'
-                    .format(env.service_template_name))
-    env.core.create_service_template(
-        service_template_path=service_template_path,
-        service_template_dir=os.path.dirname(service_template_path),
-        service_template_name=env.service_template_name)
+                    .format(service_template_name))
+    with env.metrics.phase(operation_name, 'store_service_template'), \
+            cached_reads(env.parse_cache,
+                         os.path.dirname(service_template_path)):
+        env.core.create_service_template(
+            service_template_path=service_template_path,
+            service_template_dir=os.path.dirname(service_template_path),
+            service_template_name=service_template_name)
     ctx.logger.info('Successfully stored service template')
 
-    # create service
-    inputs = ctx.node.properties[INPUTS_PROPERTY]
-    ctx.logger.info('Creating service {0} with inputs {1}...'
-                    .format(env.service_template_name, inputs))
-    service_template = env.core.model_storage.service_template.get_by_name(
-        env.service_template_name)
-    env.core.create_service(service_template.id, inputs)
-    ctx.logger.info('Successfully created service')
-
     cleanup_files(files_to_remove)
+    return csar_index.digest if csar_index else None
 
 
 @operation
-def start(**_):
-    env = Environment(ctx)
-    executor.execute(env, 'install')
+@_with_env
+def start(env, **_):
+    with env.metrics.phase('start', 'workflow'):
+        _converge(env, 'install', workflows.INSTALL_NODES,
+                  workflows.INSTALLED_STATES)
+    env.registry.put(ctx.deployment.id, status=registry.STATUS_STARTED)
     ctx.instance.runtime_properties.update(
         (k, o.value) for k, o in env.service.outputs.items())
+    _maintain_if_due(env)
 
 
 @operation
-def stop(**_):
-    env = Environment(ctx)
-    executor.execute(env, 'uninstall')
+@_with_env
+def stop(env, **_):
+    with env.metrics.phase('stop', 'workflow'):
+        _converge(env, 'uninstall', workflows.UNINSTALL_NODES,
+                  workflows.UNINSTALLED_STATES)
+    env.registry.put(ctx.deployment.id, status=registry.STATUS_STOPPED)
+    _maintain_if_due(env)
+
+
+def _converge(env, workflow_name, nodes_workflow_name, states):
+    # Retried operations only run the workflow for the nodes a previous
+    # execution did not bring to the states, if any
+    service = env.service
+    node_names = workflows.remaining_nodes(service, states)
+    if not node_names:
+        ctx.logger.info('Service {0} is already {1}ed, skipping workflow {1}'
+                        .format(env.service_template_name, workflow_name))
+    elif len(node_names) < len(service.nodes):
+        ctx.logger.info('Service {0} is partially {1}ed, running workflow '
+                        '{1} for nodes {2}'
+                        .format(env.service_template_name, workflow_name,
+                                node_names))
+        executor.execute(env, nodes_workflow_name,
+                         inputs={'node_names': node_names})
+    else:
+        executor.execute(env, workflow_name)
 
 
 @operation
-def delete(**_):
-    env = Environment(ctx)
+@_with_env
+def execute_workflow(env, workflow, parameters=None, **_):
+    ctx.logger.info('Executing workflow {0} of service {1} with parameters '
+                    '{2}...'.format(workflow, env.service_template_name,
+                                    parameters))
+    try:
+        with env.metrics.phase('execute_workflow', 'workflow'):
+            executor.execute(env, workflow, inputs=parameters)
+    except (UndeclaredWorkflowError, WorkflowImplementationNotFoundError,
+            ParameterException) as e:
+        raise InvalidWorkflowException(
+            'Cannot execute workflow {0} of service {1}: {2}'
+            .format(workflow, env.service_template_name, e))
+    ctx.logger.info('Successfully executed workflow {0} of service {1}'
+                    .format(workflow, env.service_template_name))
+    ctx.instance.runtime_properties.update(
+        (k, o.value) for k, o in env.service.outputs.items())
+    _maintain_if_due(env)
+
 
+@operation
+@_with_env
+def delete(env, **_):
     # delete the service
     service_id = env.service.id
     ctx.logger.info('Deleting service {0}...'
                     .format(env.service_template_name))
-    env.core.delete_service(service_id)
+    with env.metrics.phase('delete', 'delete_service'):
+        env.core.delete_service(service_id)
     ctx.logger.info('Successfully deleted service {0}...'
                     .format(env.service_template_name))
 
@@ -116,12 +397,117 @@ def delete(**_):
         env.service_template_name).id
     ctx.logger.info('Deleting service template {0}...'
                     .format(env.service_template_name))
-    env.core.delete_service_template(service_template_id)
+    with env.metrics.phase('delete', 'delete_service_template'):
+        env.core.delete_service_template(service_template_id)
     ctx.logger.info('Successfully deleted service template {0}...'
                     .format(env.service_template_name))
 
+    env.registry.remove(ctx.deployment.id)
+
     # if there are no more stored service templates,
     # then remove the aria working dir
     service_templates = env.model_storage.service_template.list()
     if len(service_templates) == 0:
         env.rm_working_dir()
+
+
+@operation
+@_with_env
+def teardown_tenant(env, parallelism=teardown.DEFAULT_PARALLELISM, **_):
+    ctx.logger.info('Tearing down the services of tenant {0}...'
+                    .format(ctx.tenant_name))
+    with env.metrics.phase('teardown_tenant', 'teardown'):
+        report = teardown.teardown(env, parallelism)
+    failures = sorted((name, error) for name, error in report.items()
+                      if error)
+    if failures:
+        raise TenantTeardownException(
+            'Failed to tear down {0} of the {1} services of tenant {2}:\n{3}'
+            .format(len(failures), len(report), ctx.tenant_name,
+                    '\n'.join('{0}: {1}'.format(*failure)
+                              for failure in failures)))
+    ctx.logger.info('Successfully tore down the {0} services of tenant {1}'
+                    .format(len(report), ctx.tenant_name))
+
+
+@operation
+@_with_env
+def prewarm_blueprint(env, **_):
+    ctx.logger.info('Pre-warming the caches of blueprint {0}...'
+                    .format(ctx.blueprint.id))
+    with env.metrics.phase('prewarm_blueprint', 'prewarm'):
+        csar = prewarm.prewarm(env, ctx.node.properties[CSAR_PATH_PROPERTY],
+                               ctx.node.properties[PLUGINS_PROPERTY])
+    if csar:
+        ctx.logger.info('Successfully pre-warmed the caches of blueprint {0}'
+                        .format(ctx.blueprint.id))
+
+
+@operation
+@_with_env
+def prune(env, **_):
+    _prune(env)
+
+
+@operation
+@_with_env
+def compact(env, **_):
+    _compact(env)
+
+
+@operation
+@_with_env
+def archive(env, **_):
+    _archive(env)
+
+
+def _prune(env):
+    policy = maintenance.RetentionPolicy.from_properties(ctx.node.properties)
+    ctx.logger.info('Pruning the ARIA model store of tenant {0}...'
+                    .format(ctx.tenant_name))
+    with env.metrics.phase('maintenance', 'prune'):
+        removed = maintenance.prune(env.model_storage_path, policy)
+    ctx.logger.info('Successfully pruned {executions} executions and {logs} '
+                    'logs'.format(**removed))
+
+
+def _compact(env):
+    ctx.logger.info('Compacting the ARIA model store of tenant {0}...'
+                    .format(ctx.tenant_name))
+    with env.metrics.phase('maintenance', 'compact'):
+        reclaimed = maintenance.compact(env.model_storage_path)
+    ctx.logger.info('Successfully compacted the ARIA model store, reclaimed '
+                    '{0} bytes'.format(reclaimed))
+
+
+def _archive(env):
+    policy = maintenance.RetentionPolicy.from_properties(ctx.node.properties)
+    ctx.logger.info('Archiving the resources of the idle services of tenant '
+                    '{0}...'.format(ctx.tenant_name))
+    with env.metrics.phase('maintenance', 'archive'):
+        idle = maintenance.idle_services(env.model_storage_path, policy)
+        reclaimed = sum(
+            resources.archive_service(env.resource_storage,
+                                      service_template_id, service_id)
+            for service_id, service_template_id in idle)
+    ctx.logger.info('Successfully archived the resources of {0} idle '
+                    'services, reclaimed {1} bytes'
+                    .format(len(idle), reclaimed))
+
+
+def _maintain_if_due(env):
+    # Compacting rewrites the whole model store under an exclusive lock,
+    # failing the workflows of the other deployments of the tenant, so it is
+    # left to the compact operation
+    policy = maintenance.RetentionPolicy.from_properties(ctx.node.properties)
+    if not maintenance.maintenance_due(env.maintenance_stamp_path, policy):
+        return
+    try:
+        _prune(env)
+        _archive(env)
+    except (sqlite3.Error, StorageError, IOError, OSError) as e:
+        # Not worth failing the operation for, the next one retries it
+        ctx.logger.warning('Failed the scheduled maintenance of the ARIA '
+                           'model store: {0}'.format(e))
+        return
+    maintenance.mark_maintained(env.maintenance_stamp_path)
@@ -0,0 +1,237 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import cPickle
+import hashlib
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+import aria
+from aria import exceptions
+from aria.core import Core
+from aria.parser import consumption
+from aria.parser.loading import LoadingContext, UriLocation
+from aria.parser.reading import source, yaml
+
+from . import utils
+
+YAML_EXTENSION = '.yaml'
+CACHE_EXTENSION = '.pickle'
+DEFAULT_MAX_ENTRIES = 1024
+
+# The raw data structure may change between ARIA versions
+_DIGEST_PREFIX = aria.__version__ + '\0'
+
+
+class ParseCache(object):
+    """
+    An on-disk cache of the raw data ARIA reads from YAML documents, keyed by
+    the content of the documents.
+
+    The cache is shared by all the tenants of the manager, so a TOSCA profile
+    or a type library imported by many service templates is only read once.
+    """
+
+    def __init__(self, directory, processes=0,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self._directory = utils.silent_create(directory)
+        self._processes = processes or multiprocessing.cpu_count()
+        self._max_entries = max_entries
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def get(self, digest):
+        path = self._entry_path(digest)
+        try:
+            with open(path, 'rb') as f:
+                raw = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return None
+        # Keep recently used entries from being pruned
+        os.utime(path, None)
+        return raw
+
+    def put(self, digest, raw):
+        utils.atomic_write(self._entry_path(digest),
+                           cPickle.dumps(raw, cPickle.HIGHEST_PROTOCOL))
+
+    def warm(self, paths):
+        """
+        Reads the uncached documents in parallel, each in its own process.
+        """
+        missing = [path for path in paths
+                   if not os.path.exists(self._entry_path(_file_digest(path)))]
+        if len(missing) < 2:
+            return missing
+        try:
+            pool = multiprocessing.Pool(min(self._processes, len(missing)))
+        except AssertionError:
+            # Daemonic processes, such as celery workers, may not have
+            # children, ARIA would read the documents by itself.
+            return missing
+        try:
+            pool.map(_warm_entry,
+                     [(path, self._directory) for path in missing])
+        finally:
+            pool.close()
+            pool.join()
+        return missing
+
+    def prune(self):
+        utils.prune_entries(self._directory, self._max_entries)
+
+    def _entry_path(self, digest):
+        return os.path.join(self._directory, digest + CACHE_EXTENSION)
+
+
+class CachingCore(Core):
+    """
+    An ARIA core which parses service templates reading their YAML documents
+    through a parse cache.
+    """
+
+    def __init__(self, parse_cache, **kwargs):
+        super(CachingCore, self).__init__(**kwargs)
+        self._parse_cache = parse_cache
+
+    def _parse_service_template(self, service_template_path):
+        # As Core._parse_service_template, with a reader source of its own
+        context = consumption.ConsumptionContext()
+        context.presentation.location = UriLocation(service_template_path)
+        context.reading.reader_source = CachingReaderSource(
+            self._parse_cache)
+        consumption.ConsumerChain(
+            context,
+            (
+                consumption.Read,
+                consumption.Validate,
+                consumption.ServiceTemplate
+            )).consume()
+        if context.validation.dump_issues():
+            raise exceptions.ParsingError('Failed to parse service template')
+        return context
+
+
+class CachingReaderSource(source.DefaultReaderSource):
+    """
+    A reader source which reads the YAML documents of a single parse through
+    a parse cache.
+    """
+
+    def __init__(self, cache):
+        super(CachingReaderSource, self).__init__()
+        self._cache = cache
+
+    def get_reader(self, context, location, loader):
+        if isinstance(location, UriLocation) and \
+                location.uri.endswith(YAML_EXTENSION):
+            reader = CachingYamlReader(context, location, loader)
+            reader.cache = self._cache
+            return reader
+        return super(CachingReaderSource, self).get_reader(context, location,
+                                                           loader)
+
+
+class CachingYamlReader(yaml.YamlReader):
+    """
+    A YAML reader which first looks up the raw data of the read document in
+    its parse cache.
+    """
+
+    cache = None
+
+    def read(self):
+        if self.cache is None:
+            return super(CachingYamlReader, self).read()
+        data = self.load()
+        digest = _digest(data)
+        raw = self.cache.get(digest)
+        if raw is not None:
+            _relocate(raw._locator, self.loader.location)
+            return raw
+        raw = super(CachingYamlReader, self).read()
+        self.cache.put(digest, raw)
+        return raw
+
+    def load(self):
+        # The document is loaded once, for both hashing and reading it
+        if not hasattr(self, '_data'):
+            self._data = super(CachingYamlReader, self).load()
+        return self._data
+
+
+@contextmanager
+def cached_reads(cache, service_template_dir):
+    """
+    Warms the parse cache with the documents of the service template and the
+    TOSCA profiles before a `CachingCore` parses the service template, and
+    prunes it afterwards.
+
+    Does nothing if the cache is None.
+    """
+    if cache is None:
+        yield
+        return
+    cache.warm(_yaml_files(service_template_dir) +
+               _yaml_files(_profiles_dir()))
+    try:
+        yield
+    finally:
+        cache.prune()
+
+
+def _warm_entry(args):
+    path, directory = args
+    context = LoadingContext()
+    location = UriLocation(path)
+    loader = context.loader_source.get_loader(context, location, None)
+    reader = CachingYamlReader(None, location, loader)
+    reader.cache = ParseCache(directory)
+    reader.read()
+
+
+def _digest(data):
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return hashlib.sha256(_DIGEST_PREFIX + data).hexdigest()
+
+
+def _file_digest(path):
+    return utils.file_digest(path, prefix=_DIGEST_PREFIX)
+
+
+def _relocate(locator, location):
+    # Cached documents may have been read from another location
+    locator.location = location
+    children = locator.children
+    if isinstance(children, dict):
+        children = children.values()
+    for child in children or []:
+        _relocate(child, location)
+
+
+def _yaml_files(directory):
+    return [os.path.join(dirpath, filename)
+            for dirpath, _, filenames in os.walk(directory)
+            for filename in filenames if filename.endswith(YAML_EXTENSION)]
+
+
+def _profiles_dir():
+    import aria_extension_tosca
+    return os.path.join(os.path.dirname(aria_extension_tosca.__file__),
+                        'profiles')
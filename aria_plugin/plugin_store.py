@@ -0,0 +1,135 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from aria.orchestrator.plugin import PluginManager
+
+from . import utils
+
+REFS_FILENAME = 'refs.json'
+LOCK_EXTENSION = '.lock'
+
+
+class PluginStore(object):
+    """
+    A store of installed plugins shared by all the tenants of the manager,
+    keyed by the digests of their wagons.
+
+    Every installed plugin is referenced by the working dirs of the tenants
+    which use it, and is removed once none of them does.
+    """
+
+    def __init__(self, directory):
+        self._directory = utils.silent_create(directory)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def acquire(self, source, install, workdir, digest=None):
+        """
+        Installs a wagon in the store, unless it is already installed, and
+        references it by a working dir.
+
+        :param install: installs the wagon, given the dir to install it in.
+        :param digest: the key of the plugin in the store, by default the
+         digest of the wagon.
+        :return: the dir the plugin is installed in.
+        """
+        digest = digest or utils.file_digest(source)
+        path = os.path.join(self._directory, digest)
+        # Referenced first, so it is not removed while it is installed
+        with self._refs() as refs:
+            if workdir not in refs.setdefault(digest, []):
+                refs[digest].append(workdir)
+        try:
+            with utils.file_lock(path + LOCK_EXTENSION):
+                if not os.path.isdir(path):
+                    self._install(install, path)
+        except BaseException:
+            self.release(workdir, [digest])
+            raise
+        return path
+
+    def release(self, workdir, digests=None):
+        """
+        Drops the references of a working dir, and of working dirs which no
+        longer exist, to the plugins (by default, to all of them), and
+        removes the plugins which are no longer referenced.
+        """
+        with self._refs() as refs:
+            for digest in list(digests or refs):
+                workdirs = [referencing_workdir for referencing_workdir
+                            in refs.get(digest, [])
+                            if referencing_workdir != workdir and
+                            os.path.isdir(referencing_workdir)]
+                if workdirs:
+                    refs[digest] = workdirs
+                else:
+                    refs.pop(digest, None)
+                    utils.silent_remove(os.path.join(self._directory, digest))
+
+    def _install(self, install, path):
+        staging_dir = tempfile.mkdtemp(
+            prefix='.{0}-'.format(os.path.basename(path)),
+            dir=self._directory)
+        try:
+            install(staging_dir)
+            os.rename(staging_dir, path)
+        except BaseException:
+            utils.silent_remove(staging_dir)
+            raise
+
+    @contextmanager
+    def _refs(self):
+        refs_path = os.path.join(self._directory, REFS_FILENAME)
+        with utils.file_lock(refs_path + LOCK_EXTENSION):
+            try:
+                with open(refs_path) as f:
+                    refs = json.load(f)
+            except IOError:
+                refs = {}
+            yield refs
+            utils.atomic_write(refs_path, json.dumps(refs, indent=2,
+                                                     sort_keys=True))
+
+
+class SharedPluginManager(PluginManager):
+    """
+    An ARIA plugin manager which installs the plugins of a tenant in the
+    plugin store, linking them from the plugins dir of the tenant.
+    """
+
+    def __init__(self, model, plugins_dir, store, workdir):
+        super(SharedPluginManager, self).__init__(model, plugins_dir)
+        self._store = store
+        self._workdir = workdir
+
+    def _install_wagon(self, source, prefix):
+        installed_dir = self._store.acquire(
+            source,
+            lambda install_dir: super(SharedPluginManager, self)
+            ._install_wagon(source, install_dir),
+            self._workdir)
+        # Left behind by an installation which failed to be stored
+        if os.path.islink(prefix):
+            os.remove(prefix)
+        utils.silent_remove(prefix)
+        utils.silent_create(os.path.dirname(prefix))
+        os.symlink(installed_dir, prefix)
@@ -0,0 +1,115 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Does the expensive work of creating the deployments of a blueprint ahead of
+time: the CSAR of the blueprint is validated and extracted, its plugins are
+installed and, when the parse cache is enabled, its service template is
+parsed, filling the caches `create` takes them from.
+
+Run it with `python -m aria_plugin.prewarm --tenant <name> --blueprint <id>`
+once the blueprint is uploaded, or through the
+`aria.interfaces.maintenance.prewarm_blueprint` operation of any service node
+of the blueprint.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from . import constants, daemon, utils
+from .context import LocalContext
+from .exceptions import PluginsAlreadyExistException
+from .parsing import cached_reads
+from .validation import validate_csar
+
+
+def prewarm(env, csar_path, plugins_to_install):
+    """
+    Fills the caches of the extracted CSARs, installed plugins and parsed
+    documents (if the parse cache is enabled) of the tenant with a CSAR of
+    the blueprint.
+
+    :return: the `ExtractedCSAR`, or None if the CSAR is not a local file,
+     and can not be cached.
+    """
+    csar_source = utils.generate_resource_path(csar_path, env.blueprint_dir)
+    index = validate_csar(csar_source, plugins_to_install, env.csar_cache_dir)
+    if index is None:
+        env.ctx_logger.info('CSAR {0} is not a local file, it is fetched by '
+                            'every create'.format(csar_source))
+        return None
+    csar = utils.cache_csar(csar_source, env.csar_cache_dir, index,
+                            env.ctx_logger)
+
+    try:
+        utils.install_plugins(
+            os.path.join(csar.destination, 'plugins'), plugins_to_install,
+            env.plugin_manager, env.ctx_logger)
+    except PluginsAlreadyExistException as e:
+        env.ctx_logger.debug(e.message)
+
+    if not env.parse_cache:
+        env.ctx_logger.debug('The parse cache is disabled, the service '
+                             'template is parsed by every create')
+        return csar
+    utils.install_aria_extensions()
+    service_template_path = os.path.join(csar.destination,
+                                         csar.entry_definitions)
+    with cached_reads(env.parse_cache,
+                      os.path.dirname(service_template_path)):
+        env.core.validate_service_template(service_template_path)
+    return csar
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Prepares the deployments of an ARIA blueprint.')
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--blueprint', required=True)
+    parser.add_argument('--csar', default='service.csar',
+                        help='path of the CSAR, relative to the blueprint '
+                             'dir')
+    parser.add_argument('--plugins', default='',
+                        help='comma separated plugins of the CSAR to '
+                             'install')
+    parser.add_argument('--parse-cache', action='store_true',
+                        help='parse the service template into the parse '
+                             'cache, which the deployments use as well')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    properties = {
+        constants.CSAR_PATH_PROPERTY: args.csar,
+        constants.PLUGINS_PROPERTY: [plugin for plugin
+                                     in args.plugins.split(',') if plugin],
+        constants.INPUTS_PROPERTY: {},
+        constants.PARSE_CACHE_PROPERTY: {'enabled': args.parse_cache}}
+    local_ctx = LocalContext(tenant_name=args.tenant,
+                             blueprint_id=args.blueprint,
+                             deployment_id=None,
+                             properties=properties)
+    try:
+        daemon.run_operation('prewarm_blueprint', local_ctx)
+    except Exception as e:
+        logging.error('%s', e)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import atexit
+import cProfile
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from . import utils
+
+WORKER_PROFILE_DIR_ENV = 'ARIA_PLUGIN_PROFILE_DIR'
+
+OPERATION_PROFILE_NAME = 'operation'
+ENGINE_PROFILE_NAME = 'engine'
+WORKER_PROFILE_NAME_FORMAT = 'worker-{pid}'
+PROFILE_EXTENSION = '.pstats'
+
+DEFAULT_RETAIN = 10
+
+
+class Profiler(object):
+    """
+    Captures cProfile data for plugin operations.
+
+    Every profiled operation gets its own run directory under `directory`,
+    holding a `.pstats` file per profiled thread or process. Only the
+    `retain` most recent run directories are kept.
+    """
+
+    def __init__(self, directory, retain=DEFAULT_RETAIN):
+        self._directory = directory
+        self._retain = retain
+        self._run_dir = None
+
+    @property
+    def run_dir(self):
+        if not self._run_dir:
+            self._run_dir = self._mk_run_dir('run')
+        return self._run_dir
+
+    @property
+    def worker_env(self):
+        return {WORKER_PROFILE_DIR_ENV: self.run_dir}
+
+    @contextmanager
+    def session(self, name):
+        """
+        Profiles the calling thread, and groups every profile captured while
+        the session is open under a single run directory.
+        """
+        self._run_dir = self._mk_run_dir(name)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield self._run_dir
+        finally:
+            profile.disable()
+            self._dump(profile, OPERATION_PROFILE_NAME)
+            self._run_dir = None
+            utils.prune_entries(self._directory, self._retain)
+
+    def wrap(self, func, name=ENGINE_PROFILE_NAME):
+        """
+        Wraps `func`, so that the thread which calls it would be profiled.
+        """
+        def _profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                self._dump(profile, name)
+        return _profiled
+
+    def _mk_run_dir(self, name):
+        return utils.silent_create(os.path.join(
+            self._directory,
+            '{0}-{1}'.format(datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'),
+                             name)))
+
+    def _dump(self, profile, name):
+        # The run directory is gone if the operation removed the working dir
+        if os.path.isdir(self.run_dir):
+            profile.dump_stats(
+                os.path.join(self.run_dir, name + PROFILE_EXTENSION))
+
+
+def profiled(profiler, name):
+    """
+    Opens a profiling session if `profiler` is set, and does nothing
+    otherwise.
+    """
+    if profiler:
+        return profiler.session(name)
+    return _no_session()
+
+
+@contextmanager
+def _no_session():
+    yield
+
+
+def profile_worker(profile_dir):
+    """
+    Profiles the current (task worker) process until it exits.
+    """
+    profile = cProfile.Profile()
+
+    def _dump():
+        profile.disable()
+        profile.dump_stats(os.path.join(
+            profile_dir,
+            WORKER_PROFILE_NAME_FORMAT.format(pid=os.getpid()) +
+            PROFILE_EXTENSION))
+
+    atexit.register(_dump)
+    profile.enable()
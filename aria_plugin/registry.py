@@ -0,0 +1,120 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+from contextlib import contextmanager
+
+from . import utils
+from .constants import STAGING_SERVICE_TEMPLATE_NAME_FORMAT
+
+LOCK_EXTENSION = '.lock'
+
+STATUS_CREATING = 'creating'
+STATUS_CREATED = 'created'
+STATUS_STARTED = 'started'
+STATUS_STOPPED = 'stopped'
+
+
+class Registry(object):
+    """
+    A file of the deployments of a tenant, mapped to the ids of their service
+    templates and services, the digests of their CSARs and their lifecycle
+    statuses, so that they can be looked up without opening the model store.
+
+    The file is replaced atomically under a lock on every change. Where it is
+    missing, e.g. for a working dir which predates it, it is rebuilt by
+    `bootstrap` on first use.
+
+    :param bootstrap: returns the entries of the deployments, by id.
+    """
+
+    def __init__(self, path, bootstrap):
+        self._path = path
+        self._bootstrap = bootstrap
+
+    @property
+    def path(self):
+        return self._path
+
+    def get(self, deployment_id):
+        """
+        The entry of a deployment, or None if it is not registered.
+        """
+        return self.deployments().get(deployment_id)
+
+    def deployments(self):
+        with self._entries() as entries:
+            return dict(entries)
+
+    def put(self, deployment_id, **fields):
+        """
+        Registers a deployment, or updates the fields of its entry.
+        """
+        with self._entries() as entries:
+            entries.setdefault(deployment_id, {}).update(fields)
+
+    def remove(self, deployment_id):
+        """
+        Unregisters a deployment.
+
+        :return: the number of deployments left.
+        """
+        with self._entries() as entries:
+            entries.pop(deployment_id, None)
+            return len(entries)
+
+    def reset(self):
+        """
+        Drops the file, so that it is rebuilt on next use.
+        """
+        with utils.file_lock(self._path + LOCK_EXTENSION):
+            utils.silent_remove(self._path)
+
+    @contextmanager
+    def _entries(self):
+        with utils.file_lock(self._path + LOCK_EXTENSION):
+            try:
+                with open(self._path) as f:
+                    entries = json.load(f)
+                changed = False
+            except (IOError, ValueError):
+                entries = self._bootstrap()
+                changed = True
+            before = json.dumps(entries, sort_keys=True)
+            yield entries
+            if changed or json.dumps(entries, sort_keys=True) != before:
+                utils.atomic_write(self._path, json.dumps(
+                    entries, indent=2, sort_keys=True))
+
+
+def entries_from_model_storage(model_storage, tenant_name):
+    """
+    The registry entries of the service templates of a tenant's model store.
+    """
+    prefix = '{0}-'.format(tenant_name)
+    staging_suffix = STAGING_SERVICE_TEMPLATE_NAME_FORMAT.format(name='')
+    entries = {}
+    for service_template in model_storage.service_template.list():
+        name = service_template.name
+        # Staging service templates of updates are not deployments
+        if not name.startswith(prefix) or name.endswith(staging_suffix):
+            continue
+        services = list(service_template.services.values())
+        entries[name[len(prefix):]] = dict(
+            service_template_id=service_template.id,
+            service_id=services[0].id if services else None,
+            csar_digest=None,
+            status=STATUS_CREATED if services else STATUS_CREATING)
+    return entries
@@ -0,0 +1,277 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import errno
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+from contextlib import closing
+from distutils import dir_util
+
+from aria.storage.filesystem_rapi import FileSystemResourceAPI
+
+from . import utils
+
+STAGING_PREFIX = '.'
+ARCHIVE_SUFFIX = '.tar.gz'
+LOCK_SUFFIX = '.lock'
+
+
+class ResourceAPI(FileSystemResourceAPI):
+    """
+    A filesystem resource API which copies directories regardless of the
+    process-wide distutils cache of the directories it created before, since
+    they may have been removed along with the working dir or the resources of
+    deleted models, whose ids may be reused.
+
+    Given a blobs dir, uploaded files are hard linked to blobs named by their
+    content rather than copied, so that identical resources of several
+    models take the space of one. Linked files are replaced rather than
+    written to, and blobs which are no longer linked are removed when
+    resources are deleted.
+
+    The resources of an entry can be archived, i.e. packed into a compressed
+    archive in place of its directory. They are rehydrated as soon as they
+    are read, downloaded, uploaded to or partially deleted, including by the
+    task worker processes, which use this API as well.
+    """
+
+    def __init__(self, directory, blobs_dir=None, **kwargs):
+        super(ResourceAPI, self).__init__(directory=directory, **kwargs)
+        self._blobs_dir = blobs_dir
+
+    def create(self, **kwargs):
+        super(ResourceAPI, self).create(**kwargs)
+        if self._blobs_dir:
+            utils.silent_create(self._blobs_dir)
+
+    def read(self, entry_id, *args, **kwargs):
+        self.rehydrate(entry_id)
+        return super(ResourceAPI, self).read(entry_id, *args, **kwargs)
+
+    def download(self, entry_id, *args, **kwargs):
+        self.rehydrate(entry_id)
+        dir_util._path_created.clear()
+        return super(ResourceAPI, self).download(entry_id, *args, **kwargs)
+
+    def upload(self, entry_id, source, path=None, **kwargs):
+        self.rehydrate(entry_id)
+        self._upload(entry_id, source, path, **kwargs)
+
+    def _upload(self, entry_id, source, path=None, **kwargs):
+        if not self._blobs_dir:
+            dir_util._path_created.clear()
+            return super(ResourceAPI, self).upload(
+                entry_id, source, path=path, **kwargs)
+        destination = os.path.join(self.directory, self.name, entry_id,
+                                   path or '')
+        if os.path.isfile(source):
+            if os.path.isdir(destination):
+                destination = os.path.join(destination,
+                                           os.path.basename(source))
+            utils.silent_create(os.path.dirname(destination))
+            self._link(source, destination)
+            return
+        for dirpath, _, filenames in os.walk(source, followlinks=True):
+            target_dir = os.path.join(destination,
+                                      os.path.relpath(dirpath, source))
+            utils.silent_create(target_dir)
+            for filename in filenames:
+                self._link(os.path.join(dirpath, filename),
+                           os.path.join(target_dir, filename))
+
+    def delete(self, entry_id, path=None, **kwargs):
+        archived = False
+        if path:
+            self.rehydrate(entry_id)
+        elif os.path.exists(self._archive_path(entry_id)):
+            utils.silent_remove(self._archive_path(entry_id))
+            archived = True
+        deleted = super(ResourceAPI, self).delete(entry_id, path=path,
+                                                  **kwargs)
+        if not path:
+            utils.silent_remove(self._lock_path(entry_id))
+        if deleted and self._blobs_dir:
+            collect_garbage(self._blobs_dir)
+        return deleted or archived
+
+    def archive(self, entry_id):
+        """
+        Packs the resources of an entry into a compressed archive in place of
+        its directory.
+
+        The resources are left as they are when the archive would take as
+        much space as it reclaims, e.g. when their files are still linked by
+        the resources of other entries.
+
+        :return: the number of bytes reclaimed, not counting the files which
+         are still linked by the resources of other entries.
+        """
+        entry_dir = os.path.join(self.base_path, entry_id)
+        if not os.path.isdir(entry_dir):
+            return 0
+        archive_path = self._archive_path(entry_id)
+        with utils.file_lock(self._lock_path(entry_id)):
+            # Archived by another process in the meantime
+            if not os.path.isdir(entry_dir):
+                return 0
+            size = _unshared_size(entry_dir, 2 if self._blobs_dir else 1)
+            if not size:
+                return 0
+            fd, staging_path = tempfile.mkstemp(prefix=STAGING_PREFIX,
+                                                dir=self.base_path)
+            os.close(fd)
+            try:
+                with closing(tarfile.open(staging_path, 'w:gz')) as archive:
+                    archive.add(entry_dir, arcname='.')
+                archive_size = os.path.getsize(staging_path)
+                if archive_size >= size:
+                    return 0
+                os.rename(staging_path, archive_path)
+            finally:
+                utils.silent_remove(staging_path)
+            # The archive is complete before the directory is removed, and
+            # wins over any directory left by an interrupted archiving
+            utils.silent_remove(entry_dir)
+        if self._blobs_dir:
+            collect_garbage(self._blobs_dir)
+        return size - archive_size
+
+    def rehydrate(self, entry_id):
+        """
+        Unpacks the archived resources of an entry, if they were archived.
+
+        :return: whether they were archived.
+        """
+        archive_path = self._archive_path(entry_id)
+        if not os.path.exists(archive_path):
+            return False
+        with utils.file_lock(self._lock_path(entry_id)):
+            # Rehydrated by another process in the meantime
+            if not os.path.exists(archive_path):
+                return False
+            entry_dir = os.path.join(self.base_path, entry_id)
+            staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX,
+                                           dir=self.base_path)
+            try:
+                with closing(tarfile.open(archive_path)) as archive:
+                    archive.extractall(staging_dir)
+                utils.silent_remove(entry_dir)
+                if self._blobs_dir:
+                    self._upload(entry_id, staging_dir)
+                else:
+                    os.rename(staging_dir, entry_dir)
+                os.remove(archive_path)
+            finally:
+                utils.silent_remove(staging_dir)
+        return True
+
+    def _archive_path(self, entry_id):
+        return os.path.join(self.base_path, entry_id + ARCHIVE_SUFFIX)
+
+    def _lock_path(self, entry_id):
+        return os.path.join(self.base_path,
+                            STAGING_PREFIX + entry_id + LOCK_SUFFIX)
+
+    def _link(self, source, destination):
+        # Never written through, as the file may be linked by other models
+        if os.path.lexists(destination):
+            os.remove(destination)
+        blob_path = os.path.join(self._blobs_dir, _blob_name(source))
+        try:
+            os.link(blob_path, destination)
+            return
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                # e.g. another filesystem, or too many links
+                shutil.copy2(source, destination)
+                return
+        # The blob is linked before it is named, so it is never collected
+        # in between
+        fd, staging_path = tempfile.mkstemp(prefix=STAGING_PREFIX,
+                                            dir=self._blobs_dir)
+        os.close(fd)
+        try:
+            shutil.copy2(source, staging_path)
+            os.link(staging_path, destination)
+            os.rename(staging_path, blob_path)
+        finally:
+            utils.silent_remove(staging_path)
+
+
+def collect_garbage(blobs_dir):
+    """
+    Removes the blobs which are no longer linked by any resource.
+
+    :return: the number of removed blobs.
+    """
+    try:
+        names = os.listdir(blobs_dir)
+    except OSError:
+        return 0
+    removed = 0
+    for name in names:
+        if name.startswith(STAGING_PREFIX):
+            continue
+        path = os.path.join(blobs_dir, name)
+        try:
+            if os.stat(path).st_nlink == 1:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # Removed concurrently
+            pass
+    return removed
+
+
+def archive_service(resource_storage, service_template_id, service_id):
+    """
+    Archives the resources of a service and of its template.
+
+    :return: the number of bytes reclaimed.
+    """
+    return resource_storage.service_template.archive(
+        str(service_template_id)) + \
+        resource_storage.service.archive(str(service_id))
+
+
+def rehydrate_service(resource_storage, service):
+    """
+    Unpacks the archived resources of a service and of its template, which
+    the workflow engine reads directly rather than through the storage.
+
+    :return: whether any of them were archived.
+    """
+    rehydrated = resource_storage.service_template.rehydrate(
+        str(service.service_template.id))
+    return resource_storage.service.rehydrate(str(service.id)) or rehydrated
+
+
+def _unshared_size(directory, max_links):
+    size = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            file_stat = os.lstat(os.path.join(dirpath, filename))
+            if file_stat.st_nlink <= max_links:
+                size += file_stat.st_size
+    return size
+
+
+def _blob_name(path):
+    # Files of the same content but of other modes are kept apart
+    return '{0}-{1:o}'.format(utils.file_digest(path),
+                              stat.S_IMODE(os.stat(path).st_mode))
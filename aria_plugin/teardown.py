@@ -0,0 +1,155 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Tears down all the ARIA services of a tenant at once.
+
+Run it with `python -m aria_plugin.teardown --tenant <name>`, or through the
+`aria.interfaces.maintenance.teardown_tenant` operation of any service node
+of the tenant.
+"""
+
+import argparse
+import logging
+import sys
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from cloudify.state import current_ctx
+
+from . import daemon, diffing, executor, workflows
+from .constants import STAGING_SERVICE_TEMPLATE_NAME_FORMAT
+from .context import LocalContext
+
+DEFAULT_PARALLELISM = 4
+
+
+def teardown(env, parallelism=DEFAULT_PARALLELISM):
+    """
+    Uninstalls all the services of the tenant, up to `parallelism` at a time.
+    If they were all uninstalled, the working dir of the tenant is removed in
+    one step, otherwise only the uninstalled services are deleted.
+
+    The staging services left by failed updates are not uninstalled as such,
+    as their unchanged nodes hold the states of those of the services. Only
+    their nodes which the updates installed are, along with their services.
+
+    :return: a dict of the names of the service templates to the errors of
+     their uninstall workflows, or to None if they were uninstalled.
+    """
+    staging_names = set(_staging_name(service_template.name)
+                        for service_template
+                        in env.model_storage.service_template.list())
+    names = [service_template.name for service_template
+             in env.model_storage.service_template.list()
+             if service_template.name not in staging_names]
+    pool = ThreadPool(max(1, min(parallelism, len(names))))
+    try:
+        errors = pool.map(
+            partial(_uninstall, env, current_ctx.get_ctx()), names)
+    finally:
+        pool.close()
+        pool.join()
+    report = dict(zip(names, errors))
+
+    if any(errors):
+        for name, error in sorted(report.items()):
+            if error is None:
+                _delete(env, name)
+        # Rebuilt from the services which are left
+        env.registry.reset()
+    else:
+        env.rm_working_dir()
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Tears down all the ARIA services of a tenant.')
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--parallelism', type=int,
+                        default=DEFAULT_PARALLELISM,
+                        help='number of services to uninstall at a time')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    local_ctx = LocalContext(tenant_name=args.tenant,
+                             blueprint_id=None,
+                             deployment_id=None,
+                             properties={})
+    try:
+        daemon.run_operation('teardown_tenant', local_ctx,
+                             dict(parallelism=args.parallelism))
+    except Exception as e:
+        logging.error('%s', e)
+        return 1
+    return 0
+
+
+def _uninstall(env, ctx, service_template_name):
+    # The operation context is local to the thread of the operation
+    with current_ctx.push(ctx):
+        services = env.model_storage.service.list(
+            filters={'service_template_name': service_template_name})
+        try:
+            for service in services:
+                _uninstall_staging(env, service_template_name, service)
+                env.ctx_logger.info('Uninstalling service {0}...'
+                                    .format(service.name))
+                executor.execute(env, 'uninstall', service=service)
+        except Exception as e:
+            env.ctx_logger.error('Failed to uninstall service template {0}: '
+                                 '{1}'.format(service_template_name, e))
+            return '{0}: {1}'.format(type(e).__name__, e)
+    return None
+
+
+def _uninstall_staging(env, service_template_name, service):
+    for staging_template in env.model_storage.service_template.list(
+            filters={'name': _staging_name(service_template_name)}):
+        for staging_service in list(staging_template.services.values()):
+            node_names = diffing.installed_changes(service, staging_service)
+            if not node_names:
+                continue
+            env.ctx_logger.info('Uninstalling nodes {0} of the service left '
+                                'by a failed update of service {1}...'
+                                .format(node_names, service.name))
+            executor.execute(env, workflows.UNINSTALL_NODES,
+                             inputs={'node_names': node_names},
+                             service=staging_service)
+
+
+def _delete(env, service_template_name):
+    service_template = env.model_storage.service_template.get_by_name(
+        service_template_name)
+    for service in list(service_template.services.values()):
+        env.core.delete_service(service.id)
+    env.core.delete_service_template(service_template.id)
+    # The unchanged nodes of staging services seem installed
+    for staging_template in env.model_storage.service_template.list(
+            filters={'name': _staging_name(service_template_name)}):
+        for service in list(staging_template.services.values()):
+            env.core.delete_service(service.id, force=True)
+        env.core.delete_service_template(staging_template.id)
+
+
+def _staging_name(service_template_name):
+    return STAGING_SERVICE_TEMPLATE_NAME_FORMAT.format(
+        name=service_template_name)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from . import utils
+
+TRACE_NAME_FORMAT = '{time}-{workflow}.json'
+
+DEFAULT_RETAIN = 10
+
+# Categories of the trace events
+QUEUE_CATEGORY = 'queue'
+TASK_CATEGORY = 'task'
+CRITICAL_CATEGORY = 'critical'
+
+# A task on the critical path of a workflow. `waited` is the time between the
+# end of the previous task of the path and the start of this one.
+CriticalStep = namedtuple('CriticalStep',
+                          'task_id, name, attempts, waited, duration')
+
+
+class TaskTrace(object):
+    """
+    Records the attempts of the tasks of a workflow, as the task executor
+    queues, starts and ends them. Attempts are recorded by both the engine
+    thread and the listener thread of the executor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Lists of attempts of every task, by task id
+        self._attempts = {}
+
+    def attempts(self, task_id):
+        with self._lock:
+            return list(self._attempts.get(task_id, ()))
+
+    def queued(self, task_id):
+        with self._lock:
+            self._attempts.setdefault(task_id, []).append(
+                dict(queued=time.time(), started=None, ended=None, pid=None,
+                     succeeded=None))
+
+    def started(self, task_id, pid):
+        self._update(task_id, started=time.time(), pid=pid)
+
+    def ended(self, task_id, succeeded):
+        self._update(task_id, ended=time.time(), succeeded=succeeded)
+
+    def _update(self, task_id, **fields):
+        with self._lock:
+            attempts = self._attempts.get(task_id)
+            if attempts:
+                attempts[-1].update(fields)
+
+
+class Tracer(object):
+    """
+    Writes the traces of the tasks of workflows in the Trace Event Format,
+    which timeline viewers (chrome://tracing, Perfetto) load, along with the
+    critical path of the workflows. Only the `retain` most recent traces are
+    kept in `directory`.
+    """
+
+    def __init__(self, directory, retain=DEFAULT_RETAIN):
+        self._directory = directory
+        self._retain = retain
+
+    def write(self, trace, workflow_name, tasks):
+        """
+        Writes the trace of a workflow run.
+
+        :param tasks: the ARIA tasks of the workflow execution.
+        :return: the path of the trace file, and the critical path.
+        """
+        path_steps = critical_path(trace, tasks)
+        utils.silent_create(self._directory)
+        trace_path = os.path.join(self._directory, TRACE_NAME_FORMAT.format(
+            time=datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'),
+            workflow=workflow_name))
+        utils.atomic_write(trace_path, json.dumps(
+            _trace_document(trace, tasks, path_steps), indent=1,
+            sort_keys=True))
+        utils.prune_entries(self._directory, self._retain)
+        return trace_path, path_steps
+
+
+def critical_path(trace, tasks):
+    """
+    The chain of tasks which held back the end of a workflow: the task which
+    ended last, the dependency which ended last of that task, and so on.
+    Stub tasks, and tasks which ran nothing, are passed through.
+
+    :return: the list of `CriticalStep` in execution order.
+    """
+    ends = _ends(trace, tasks)
+
+    def _gating(candidates):
+        ended = [task for task in candidates if ends[task.id] is not None]
+        return max(ended, key=lambda task: ends[task.id]) if ended else None
+
+    steps = []
+    task = _gating(tasks)
+    while task is not None:
+        attempts = trace.attempts(task.id)
+        if attempts and attempts[-1]['ended'] is not None:
+            steps.append((task, attempts))
+        task = _gating(task.dependencies)
+    steps.reverse()
+
+    path_steps = []
+    previous_end = None
+    for task, attempts in steps:
+        started = attempts[0]['started'] or attempts[0]['queued']
+        path_steps.append(CriticalStep(
+            task_id=task.id,
+            name=_task_name(task),
+            attempts=len(attempts),
+            waited=started - previous_end if previous_end else 0.0,
+            duration=attempts[-1]['ended'] - started))
+        previous_end = attempts[-1]['ended']
+    return path_steps
+
+
+def _ends(trace, tasks):
+    # The end time of every task: that of its last attempt, or for a task
+    # with no attempts, the latest end of its dependencies. Resolved without
+    # recursion, as dependency chains are as long as the workflow.
+    ends = {}
+    for root in tasks:
+        stack = [root]
+        while stack:
+            task = stack[-1]
+            if task.id in ends:
+                stack.pop()
+                continue
+            attempts = trace.attempts(task.id)
+            if attempts and attempts[-1]['ended'] is not None:
+                ends[task.id] = attempts[-1]['ended']
+                stack.pop()
+                continue
+            unresolved = [dep for dep in task.dependencies
+                          if dep.id not in ends]
+            if unresolved:
+                stack.extend(unresolved)
+                continue
+            dependency_ends = [ends[dep.id] for dep in task.dependencies
+                               if ends[dep.id] is not None]
+            ends[task.id] = max(dependency_ends) if dependency_ends else None
+            stack.pop()
+    return ends
+
+
+def _trace_document(trace, tasks, path_steps):
+    critical_ids = set(step.task_id for step in path_steps)
+    traced = [(task, trace.attempts(task.id)) for task in tasks]
+    traced = [(task, attempts) for task, attempts in traced if attempts]
+    origin = min([attempts[0]['queued'] for _, attempts in traced] or [0])
+    engine_pid = os.getpid()
+
+    def _us(timestamp):
+        return int((timestamp - origin) * 1e6)
+
+    events = []
+    workers = set()
+    for task, attempts in traced:
+        name = _task_name(task)
+        categories = [TASK_CATEGORY]
+        if task.id in critical_ids:
+            categories.append(CRITICAL_CATEGORY)
+        for number, attempt in enumerate(attempts, 1):
+            args = dict(task_id=task.id,
+                        node=_actor_name(task),
+                        interface=task.interface_name,
+                        operation=task.operation_name,
+                        attempt=number,
+                        retries=len(attempts) - 1,
+                        worker_pid=attempt['pid'],
+                        succeeded=attempt['succeeded'])
+            # Attempts are laid out on the rows of their worker processes
+            tid = attempt['pid'] or 0
+            started = attempt['started'] or attempt['queued']
+            events.append(dict(
+                name=name, cat=QUEUE_CATEGORY, ph='X', pid=engine_pid,
+                tid=tid, ts=_us(attempt['queued']),
+                dur=_us(started) - _us(attempt['queued']), args=args))
+            if attempt['ended'] is not None:
+                events.append(dict(
+                    name=name, cat=','.join(categories), ph='X',
+                    pid=engine_pid, tid=tid, ts=_us(started),
+                    dur=_us(attempt['ended']) - _us(started), args=args))
+            if attempt['pid'] and attempt['pid'] not in workers:
+                workers.add(attempt['pid'])
+                events.append(dict(
+                    name='thread_name', ph='M', pid=engine_pid, tid=tid,
+                    args=dict(name='worker {0}'.format(attempt['pid']))))
+    return dict(
+        traceEvents=events,
+        displayTimeUnit='ms',
+        criticalPath=[step._asdict() for step in path_steps])
+
+
+def _actor_name(task):
+    if task.node:
+        return task.node.name
+    if task.relationship:
+        return '{0}->{1}'.format(task.relationship.source_node.name,
+                                 task.relationship.target_node.name)
+    return None
+
+
+def _task_name(task):
+    return '.'.join(str(part) for part in (_actor_name(task),
+                                           task.interface_name,
+                                           task.operation_name)
+                    if part)
@@ -0,0 +1,308 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Exports the ARIA state of a tenant (its model store, resources and installed
+plugins) into a single compressed archive, and imports it on another manager.
+
+Run it with `python -m aria_plugin.transfer export --tenant <name> > file`
+and `python -m aria_plugin.transfer import --tenant <name> < file`.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+import zlib
+from contextlib import closing, contextmanager
+from functools import partial
+
+from . import constants, maintenance, utils
+from .context import LocalContext
+from .environment import Environment
+from .exceptions import (InvalidTenantArchiveException,
+                         TenantNotEmptyException)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'MANIFEST.json'
+MODEL_STORAGE_NAME = '/'.join([constants.ARIA_MODELS_DIR,
+                               constants.MODEL_STORAGE_FILENAME])
+_TOP_LEVEL_DIRS = (constants.ARIA_MODELS_DIR,
+                   constants.ARIA_RESOURCES_DIR,
+                   constants.ARIA_PLUGINS_DIR)
+_CHUNK_SIZE = 1024 * 1024
+
+
+def export_tenant(env, stream):
+    """
+    Writes a gzipped tar archive of the ARIA state of the tenant to a stream.
+
+    The model store is copied consistently, even while it is in use. The
+    archive starts with a manifest of the SHA-256 digests of its files, and
+    of the keys of the plugins linked from the plugin store.
+
+    :return: the manifest.
+    """
+    snapshot_dir = tempfile.mkdtemp(prefix='aria-export-')
+    try:
+        files = {}
+        if os.path.exists(env.model_storage_path):
+            files[MODEL_STORAGE_NAME] = os.path.join(
+                snapshot_dir, constants.MODEL_STORAGE_FILENAME)
+            maintenance.snapshot(env.model_storage_path,
+                                 files[MODEL_STORAGE_NAME])
+        files.update(_tree_files(env.resource_storage_dir,
+                                 constants.ARIA_RESOURCES_DIR))
+        files.update(_tree_files(env.aria_plugins_dir,
+                                 constants.ARIA_PLUGINS_DIR))
+        manifest = dict(
+            version=FORMAT_VERSION,
+            files=dict((name, utils.file_digest(path))
+                       for name, path in files.items()),
+            plugins=_stored_plugins(env))
+
+        with closing(tarfile.open(fileobj=stream, mode='w|gz')) as archive:
+            content = json.dumps(manifest, indent=2, sort_keys=True)
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+            for name in sorted(files):
+                with open(files[name], 'rb') as f:
+                    archive.addfile(_file_info(files[name], name), f)
+        return manifest
+    finally:
+        utils.silent_remove(snapshot_dir)
+
+
+def import_tenant(env, stream):
+    """
+    Replaces the ARIA state of the tenant, which must have no services, with
+    the content of an archive written by `export_tenant`.
+
+    The digests of the files are checked against the manifest. The plugins
+    which were linked from the plugin store are acquired from the plugin
+    store, and only kept if it does not have them installed already.
+
+    :return: the numbers of imported files and of plugins in the store.
+    """
+    if os.path.exists(env.model_storage_path) and \
+            env.model_storage.service_template.list():
+        raise TenantNotEmptyException(
+            'Can not import into {0}, as it has service templates'
+            .format(env.workdir))
+    workdir = env.workdir
+    staging_dir = tempfile.mkdtemp(
+        prefix='.{0}-import-'.format(os.path.basename(workdir)),
+        dir=os.path.dirname(workdir))
+    try:
+        manifest = _extract(stream, staging_dir)
+        env.rm_working_dir()
+        os.rename(staging_dir, workdir)
+    except BaseException:
+        utils.silent_remove(staging_dir)
+        raise
+    # Once the plugins of the previous state are released
+    stored = _store_plugins(env, workdir, manifest.get('plugins', {}))
+    return dict(files=len(manifest['files']), stored_plugins=stored)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Exports and imports the ARIA state of a tenant.')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--file', default='-',
+                        help='path of the archive, by default it is written '
+                             'to stdout or read from stdin')
+    parser.add_argument('--ephemeral', action='store_true',
+                        help='the tenant uses ephemeral storages')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    properties = {constants.STORAGE_PROPERTY: {'ephemeral': args.ephemeral}}
+    env = Environment(LocalContext(tenant_name=args.tenant,
+                                   blueprint_id=None,
+                                   deployment_id=None,
+                                   properties=properties))
+
+    if args.command == 'export':
+        with _open(args.file, 'wb', sys.stdout) as stream:
+            manifest = export_tenant(env, stream)
+        logging.info('Exported %d files of tenant %s',
+                     len(manifest['files']), args.tenant)
+    else:
+        try:
+            with _open(args.file, 'rb', sys.stdin) as stream:
+                stats = import_tenant(env, stream)
+        except (InvalidTenantArchiveException,
+                TenantNotEmptyException) as e:
+            logging.error('%s', e)
+            return 1
+        logging.info('Imported %d files of tenant %s, with %d plugins in the '
+                     'plugin store',
+                     stats['files'], args.tenant, stats['stored_plugins'])
+    return 0
+
+
+def _extract(stream, target_dir):
+    try:
+        return _extract_archive(stream, target_dir)
+    except (tarfile.TarError, IOError, EOFError, ValueError, zlib.error) as e:
+        raise InvalidTenantArchiveException(
+            'Corrupt archive: {0}'.format(e))
+
+
+def _extract_archive(stream, target_dir):
+    manifest = None
+    extracted = set()
+    with closing(tarfile.open(fileobj=stream, mode='r|gz')) as archive:
+        for member in archive:
+            if manifest is None:
+                manifest = _read_manifest(archive, member)
+                continue
+            expected_digest = manifest['files'].get(member.name)
+            if expected_digest is None or not member.isfile() or \
+                    member.name in extracted:
+                raise InvalidTenantArchiveException(
+                    'Unexpected archive member: {0}'.format(member.name))
+            path = os.path.join(target_dir, *member.name.split('/'))
+            utils.silent_create(os.path.dirname(path))
+            _write(archive.extractfile(member), path, expected_digest)
+            os.chmod(path, member.mode & 0o755)
+            extracted.add(member.name)
+    if manifest is None:
+        raise InvalidTenantArchiveException('The archive is empty')
+    missing = set(manifest['files']) - extracted
+    if missing:
+        raise InvalidTenantArchiveException(
+            'Files missing from the archive: {0}'
+            .format(', '.join(sorted(missing))))
+    return manifest
+
+
+def _read_manifest(archive, member):
+    if member.name != MANIFEST_NAME:
+        raise InvalidTenantArchiveException(
+            'The archive does not start with a manifest')
+    manifest = json.load(archive.extractfile(member))
+    if manifest.get('version') != FORMAT_VERSION:
+        raise InvalidTenantArchiveException(
+            'Unsupported archive version: {0}'.format(manifest.get('version')))
+    for name in manifest['files']:
+        parts = name.split('/')
+        if parts[0] not in _TOP_LEVEL_DIRS or '..' in parts or '' in parts:
+            raise InvalidTenantArchiveException(
+                'Invalid file name in the manifest: {0}'.format(name))
+    for name, digest in manifest.get('plugins', {}).items():
+        prefix = '/'.join([constants.ARIA_PLUGINS_DIR, name, ''])
+        if '/' in name or name in ('.', '..') or not digest.isalnum() or \
+                not any(file_name.startswith(prefix)
+                        for file_name in manifest['files']):
+            raise InvalidTenantArchiveException(
+                'Invalid stored plugin in the manifest: {0}'.format(name))
+    return manifest
+
+
+def _write(source, path, expected_digest):
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: source.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    if digest.hexdigest() != expected_digest:
+        raise InvalidTenantArchiveException(
+            'Digest mismatch of {0}'.format(path))
+
+
+def _stored_plugins(env):
+    # The plugins dirs of the tenant linked from the plugin store, with their
+    # keys in it
+    plugins = {}
+    if not os.path.isdir(env.aria_plugins_dir):
+        return plugins
+    store_dir = os.path.realpath(env.plugin_store_dir)
+    for name in os.listdir(env.aria_plugins_dir):
+        path = os.path.join(env.aria_plugins_dir, name)
+        installed_dir = os.path.realpath(path)
+        if os.path.islink(path) and \
+                os.path.dirname(installed_dir) == store_dir:
+            plugins[name] = os.path.basename(installed_dir)
+    return plugins
+
+
+def _store_plugins(env, workdir, stored_plugins):
+    if not env.plugin_store:
+        return 0
+    plugins_dir = os.path.join(workdir, constants.ARIA_PLUGINS_DIR)
+    for name, digest in sorted(stored_plugins.items()):
+        plugin_dir = os.path.join(plugins_dir, name)
+        installed_dir = env.plugin_store.acquire(
+            None, partial(_move_contents, plugin_dir), workdir,
+            digest=digest)
+        # The imported files, unless they were moved to the store
+        utils.silent_remove(plugin_dir)
+        os.symlink(installed_dir, plugin_dir)
+    return len(stored_plugins)
+
+
+def _move_contents(source_dir, target_dir):
+    for name in os.listdir(source_dir):
+        shutil.move(os.path.join(source_dir, name),
+                    os.path.join(target_dir, name))
+
+
+def _tree_files(directory, name):
+    files = {}
+    # Plugins may be linked from the plugin store
+    for dirpath, _, filenames in os.walk(directory, followlinks=True):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.isfile(path) and not os.path.islink(path):
+                relative_path = os.path.relpath(path, directory)
+                files['/'.join([name] + relative_path.split(os.sep))] = path
+    return files
+
+
+def _file_info(path, name):
+    # Always a regular file member: resources linked to the same blob would
+    # otherwise be written as hard links to the first of them
+    file_stat = os.stat(path)
+    info = tarfile.TarInfo(name)
+    info.size = file_stat.st_size
+    info.mtime = file_stat.st_mtime
+    info.mode = stat.S_IMODE(file_stat.st_mode)
+    return info
+
+
+@contextmanager
+def _open(path, mode, standard_stream):
+    if path == '-':
+        yield standard_stream
+        standard_stream.flush()
+    else:
+        with open(path, mode) as f:
+            yield f
+
+
+if __name__ == '__main__':
+    sys.exit(main())
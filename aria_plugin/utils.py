@@ -14,16 +14,45 @@
 #    * limitations under the License.
 
 import errno
+import fcntl
+import hashlib
+import json
 import os
 import shutil
 import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from urlparse import urlparse
 
 
+import aria
 from aria.cli import csar
 from aria.orchestrator.exceptions import PluginAlreadyExistsError
-from .constants import WAGON_EXTENSION
-from .exceptions import MissingPluginsException, PluginsAlreadyExistException
+from aria.utils.yaml import yaml
+from .constants import (EXTRACTED_CSARS_DIR, INPUTS_FILE_PROPERTY,
+                        INPUTS_PROPERTY, WAGON_EXTENSION)
+from .exceptions import (InvalidInputsException, MissingPluginsException,
+                         PluginsAlreadyExistException)
+
+
+DEFAULT_EXTRACTED_CSARS_KEPT = 5
+
+_aria_extensions_installed = []
+_aria_extensions_lock = threading.Lock()
+
+ExtractedCSAR = namedtuple('ExtractedCSAR', 'destination, entry_definitions')
+
+
+def install_aria_extensions():
+    """
+    Installs the ARIA extensions, once per process, as ARIA refuses to install
+    them again.
+    """
+    with _aria_extensions_lock:
+        if not _aria_extensions_installed:
+            aria.install_aria_extensions(strict=False)
+            _aria_extensions_installed.append(True)
 
 
 def extract_csar(csar_source, logger):
@@ -31,6 +60,50 @@ def extract_csar(csar_source, logger):
     return csar.read(source=csar_source, destination=csar_dest, logger=logger)
 
 
+def cache_csar(csar_source, cache_dir, index, logger,
+               keep=DEFAULT_EXTRACTED_CSARS_KEPT):
+    """
+    Extracts a validated CSAR into the cache dir, unless it is there already,
+    keeping only the `keep` most recently used extracted CSARs.
+
+    :param index: the `CSARIndex` of the CSAR.
+    :return: the `ExtractedCSAR`.
+    """
+    extracted_csar = cached_csar(cache_dir, index)
+    if extracted_csar:
+        return extracted_csar
+    extracted_dir = silent_create(os.path.join(cache_dir, EXTRACTED_CSARS_DIR))
+    staging_dir = tempfile.mkdtemp(prefix='.{0}-'.format(index.digest),
+                                   dir=extracted_dir)
+    try:
+        csar.read(source=csar_source, destination=staging_dir, logger=logger)
+        os.rename(staging_dir, os.path.join(extracted_dir, index.digest))
+    except OSError:
+        # Extracted concurrently
+        if not cached_csar(cache_dir, index):
+            raise
+    finally:
+        silent_remove(staging_dir)
+    prune_entries(extracted_dir, keep)
+    return cached_csar(cache_dir, index)
+
+
+def cached_csar(cache_dir, index):
+    """
+    The `ExtractedCSAR` of a CSAR extracted by `cache_csar`, or None if it
+    was not.
+    """
+    if index is None:
+        return None
+    destination = os.path.join(cache_dir, EXTRACTED_CSARS_DIR, index.digest)
+    if not os.path.isdir(destination):
+        return None
+    # Keep recently used CSARs from being pruned
+    os.utime(destination, None)
+    return ExtractedCSAR(destination=destination,
+                         entry_definitions=index.entry_definitions)
+
+
 def generate_resource_path(resource_path, blueprint_dir):
     parsed_url = urlparse(resource_path)
     if not parsed_url.scheme:
@@ -39,6 +112,48 @@ def generate_resource_path(resource_path, blueprint_dir):
     return resource_path
 
 
+def load_inputs(properties, service_template_dir, blueprint_dir):
+    """
+    The inputs of a service: those of its inputs file if it has one,
+    overridden by its inline inputs. The inputs file is looked up relative to
+    the stored service template dir (the CSAR), and then to the blueprint dir.
+    """
+    inputs = {}
+    inputs_file = properties.get(INPUTS_FILE_PROPERTY)
+    if inputs_file:
+        candidates = [os.path.join(service_template_dir, inputs_file),
+                      generate_resource_path(inputs_file, blueprint_dir)]
+        path = next((candidate for candidate in candidates
+                     if os.path.isfile(candidate)), None)
+        if not path:
+            raise InvalidInputsException(
+                'Inputs file {0} was found neither in the CSAR nor in the '
+                'blueprint dir'.format(inputs_file))
+        try:
+            with open(path) as f:
+                inputs = yaml.load(f, Loader=yaml.SafeLoader) or {}
+        except yaml.YAMLError as e:
+            raise InvalidInputsException(
+                'Inputs file {0} is not valid YAML: {1}'
+                .format(inputs_file, e))
+        if not isinstance(inputs, dict):
+            raise InvalidInputsException(
+                'Inputs file {0} does not hold a mapping of inputs'
+                .format(inputs_file))
+    inputs.update(properties.get(INPUTS_PROPERTY) or {})
+    return inputs
+
+
+def describe_inputs(inputs):
+    """
+    A short description of inputs for the logs, which identifies them by
+    their digest rather than by their values.
+    """
+    digest = hashlib.sha256(
+        json.dumps(inputs, sort_keys=True, default=repr)).hexdigest()
+    return '{0} inputs (sha256 {1})'.format(len(inputs), digest[:12])
+
+
 def install_plugins(sources_dir, plugins_to_install, plugin_manager,
                     logger=None):
     if os.path.exists(sources_dir) and os.path.isdir(sources_dir):
@@ -100,6 +215,30 @@ def silent_remove(path):
         shutil.rmtree(path)
 
 
+def prune_entries(path, keep):
+    """
+    Removes all but the `keep` most recently modified entries of a directory.
+    """
+    if not os.path.isdir(path):
+        return
+    entries = sorted((os.path.join(path, entry) for entry in os.listdir(path)),
+                     key=os.path.getmtime,
+                     reverse=True)
+    for entry in entries[keep:]:
+        silent_remove(entry)
+
+
+def file_digest(path, prefix=b'', chunk_size=1024 * 1024):
+    """
+    The SHA-256 hex digest of the content of a file, preceded by `prefix`.
+    """
+    digest = hashlib.sha256(prefix)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def silent_create(path):
     try:
         os.makedirs(path)
@@ -107,3 +246,37 @@ def silent_create(path):
         if e.errno != errno.EEXIST:
             raise
     return path
+
+
+def atomic_write(path, content):
+    """
+    Replaces the content of a file, so that readers of the file would either
+    see its previous content or its new one.
+    """
+    directory, name = os.path.split(path)
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=directory,
+                                                 prefix='.' + name)
+    try:
+        with os.fdopen(file_descriptor, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except BaseException:
+        silent_remove(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on a lock file, shared by all the processes on
+    the host.
+    """
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,143 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+import os
+import posixpath
+import zipfile
+from collections import namedtuple
+
+from aria.cli import csar
+from aria.utils.yaml import yaml
+
+from . import utils
+from .exceptions import InvalidCSARException, MissingPluginsException
+
+CSAR_PLUGINS_DIR = 'plugins/'
+
+CSARIndex = namedtuple('CSARIndex', 'digest, entry_definitions, plugins')
+
+
+def validate_csar(csar_source, plugins_to_install, cache_dir):
+    """
+    Validates a CSAR using only its archive index and metadata file, without
+    extracting it.
+
+    The findings about each CSAR are cached in `cache_dir` by the digest of
+    the archive, so validating the same CSAR again only costs hashing it.
+    CSARs which are not local files are not validated here, since ARIA
+    validates them once they are downloaded.
+
+    :return: the `CSARIndex` of the CSAR, or None if it was not validated.
+    """
+    if '://' in csar_source:
+        return None
+    if not os.path.isfile(csar_source):
+        raise InvalidCSARException(
+            'CSAR {0} does not exist'.format(csar_source))
+
+    digest = utils.file_digest(csar_source)
+    cache_path = os.path.join(cache_dir, digest + '.json')
+    try:
+        with open(cache_path) as f:
+            findings = json.load(f)
+    except (IOError, ValueError):
+        findings = _inspect(csar_source)
+        utils.silent_create(cache_dir)
+        utils.atomic_write(cache_path, json.dumps(findings))
+
+    if findings['error']:
+        raise InvalidCSARException(
+            'Invalid CSAR {0}: {1}'.format(csar_source, findings['error']))
+
+    index = CSARIndex(digest=digest,
+                      entry_definitions=findings['entry_definitions'],
+                      plugins=findings['plugins'])
+    _validate_plugins(index, plugins_to_install)
+    return index
+
+
+def _inspect(csar_source):
+    findings = dict(error=None, entry_definitions=None, plugins=None)
+    try:
+        with zipfile.ZipFile(csar_source) as archive:
+            names = set(archive.namelist())
+            findings['entry_definitions'] = _read_entry_definitions(
+                archive, names)
+    except zipfile.BadZipfile:
+        findings['error'] = 'the archive is not a valid zip file'
+    except ValueError as e:
+        findings['error'] = str(e)
+    else:
+        if any(name.startswith(CSAR_PLUGINS_DIR) for name in names):
+            findings['plugins'] = sorted(
+                name[len(CSAR_PLUGINS_DIR):] for name in names
+                if name.startswith(CSAR_PLUGINS_DIR) and
+                '/' not in name[len(CSAR_PLUGINS_DIR):] and
+                name != CSAR_PLUGINS_DIR)
+    return findings
+
+
+def _read_entry_definitions(archive, names):
+    if csar.META_FILE not in names:
+        raise ValueError('metadata file {0} is missing'.format(csar.META_FILE))
+    try:
+        metadata = yaml.load(archive.read(csar.META_FILE),
+                             Loader=yaml.SafeLoader)
+    except yaml.YAMLError as e:
+        raise ValueError('metadata file {0} is not valid YAML: {1}'
+                         .format(csar.META_FILE, e))
+    if not isinstance(metadata, dict):
+        raise ValueError('metadata file {0} is not a mapping'
+                         .format(csar.META_FILE))
+
+    for key, expected in ((csar.META_FILE_VERSION_KEY,
+                           csar.META_FILE_VERSION_VALUE),
+                          (csar.META_CSAR_VERSION_KEY,
+                           csar.META_CSAR_VERSION_VALUE),
+                          (csar.META_CREATED_BY_KEY, None),
+                          (csar.META_ENTRY_DEFINITIONS_KEY, None)):
+        if not metadata.get(key):
+            raise ValueError('{0} is missing from the metadata file'
+                             .format(key))
+        if expected and str(metadata[key]) != expected:
+            raise ValueError('{0} is expected to be {1} in the metadata file '
+                             'while it is in fact {2}'
+                             .format(key, expected, metadata[key]))
+
+    # Archive member names are normalized, while the entry may be e.g.
+    # ./service.yaml
+    entry_definitions = posixpath.normpath(
+        metadata[csar.META_ENTRY_DEFINITIONS_KEY])
+    if entry_definitions not in names:
+        raise ValueError('the entry definitions {0} referenced by the '
+                         'metadata file do not exist'
+                         .format(entry_definitions))
+    return entry_definitions
+
+
+def _validate_plugins(index, plugins_to_install):
+    if not plugins_to_install:
+        return
+    if index.plugins is None:
+        raise MissingPluginsException(
+            'Plugins to install were supplied under the "plugins" '
+            'property of the Service node, but the referenced CSAR does '
+            'not have a "plugins" directory')
+    missing_plugins = set(plugins_to_install) - set(index.plugins)
+    if missing_plugins:
+        raise MissingPluginsException('Requested plugins {0} is not in the'
+                                      ' csar `plugins` directory'
+                                      .format(', '.join(missing_plugins)))
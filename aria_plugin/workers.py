@@ -0,0 +1,179 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import threading
+import time
+from collections import deque
+
+from aria.orchestrator.workflows.executor import process
+
+from . import profiling
+
+# Directory holding the `sitecustomize` module which hooks ARIA task worker
+# processes. It is prepended to the python path of the workers only when
+# there is something to hook.
+BOOTSTRAP_DIR = os.path.join(os.path.dirname(__file__), 'bootstrap')
+
+
+class WorkerProcessExecutor(process.ProcessExecutor):
+    """
+    ARIA's process executor, with task worker processes that can be
+    instrumented by the plugin.
+
+    `worker_env` holds environment variables which are passed to every task
+    worker process. When it is not empty, the worker processes also run
+    `bootstrap` on startup, which acts upon these variables.
+
+    Given a `log_level`, the task logs below it are dropped by the worker
+    processes, rather than stored in the model store.
+
+    Given a `concurrency` limit, the tasks beyond it are queued until running
+    ones end, rather than all started at once.
+
+    Given a `trace`, the attempts of the tasks are recorded in it.
+    """
+
+    def __init__(self, worker_env=None, log_level=None, concurrency=None,
+                 trace=None, *args, **kwargs):
+        self._worker_env = worker_env or {}
+        self._log_level = log_level
+        self._concurrency = concurrency
+        self._trace = trace
+        self._dispatch_lock = threading.Lock()
+        # The id, context and operation of the tasks waiting to be started
+        self._queued = deque()
+        # Start times and operations of the running tasks, by id
+        self._dispatched = {}
+        if self._worker_env:
+            kwargs['python_path'] = \
+                [BOOTSTRAP_DIR] + (kwargs.get('python_path') or [])
+        super(WorkerProcessExecutor, self).__init__(*args, **kwargs)
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
+    @property
+    def trace(self):
+        return self._trace
+
+    def close(self):
+        with self._dispatch_lock:
+            self._queued.clear()
+        super(WorkerProcessExecutor, self).close()
+
+    def terminate(self, task_id):
+        with self._dispatch_lock:
+            self._queued = deque(
+                task for task in self._queued if task[0] != task_id)
+            self._dispatched.pop(task_id, None)
+        super(WorkerProcessExecutor, self).terminate(task_id)
+
+    def _execute(self, ctx):
+        task_id = ctx.task.id
+        if self._trace is not None:
+            self._trace.queued(task_id)
+        if self._concurrency is None:
+            return self._start(task_id, ctx)
+        with self._dispatch_lock:
+            self._queued.append((task_id, ctx, _operation(ctx.task)))
+        self._dispatch()
+
+    def _start(self, task_id, ctx):
+        super(WorkerProcessExecutor, self)._execute(ctx)
+        if self._trace is not None:
+            # The task is gone if its worker already ended
+            task = self._tasks.get(task_id)
+            self._trace.started(task_id, task.proc.pid if task else None)
+
+    def _dispatch(self):
+        """
+        Starts queued tasks while the running ones are within the limit. Runs
+        in the engine thread as tasks are sent, and in the listener thread as
+        they end.
+        """
+        while True:
+            with self._dispatch_lock:
+                if self._stopped or not self._queued or \
+                        len(self._dispatched) >= self._concurrency.limit:
+                    return
+                task_id, ctx, operation = self._queued.popleft()
+                self._dispatched[task_id] = (time.time(), operation)
+            try:
+                self._start(task_id, ctx)
+            except BaseException as e:
+                with self._dispatch_lock:
+                    self._dispatched.pop(task_id, None)
+                self._task_failed(ctx, exception=e)
+
+    def _handle_task_succeeded_request(self, task_id, **kwargs):
+        self._task_ended(
+            super(WorkerProcessExecutor, self)._handle_task_succeeded_request,
+            task_id, succeeded=True, **kwargs)
+
+    def _handle_task_failed_request(self, task_id, **kwargs):
+        self._task_ended(
+            super(WorkerProcessExecutor, self)._handle_task_failed_request,
+            task_id, succeeded=False, **kwargs)
+
+    def _task_ended(self, handle_request, task_id, succeeded, **kwargs):
+        ended = time.time()
+        if self._trace is not None:
+            self._trace.ended(task_id, succeeded)
+        # Stores the status of the task
+        handle_request(task_id=task_id, **kwargs)
+        if self._concurrency is None:
+            return
+        store_wait = time.time() - ended
+        with self._dispatch_lock:
+            dispatched = self._dispatched.pop(task_id, None)
+        if dispatched is not None:
+            started, operation = dispatched
+            self._concurrency.task_ended(operation, ended - started,
+                                         store_wait)
+        self._dispatch()
+
+    def _construct_subprocess_env(self, task):
+        env = super(WorkerProcessExecutor, self)._construct_subprocess_env(
+            task)
+        env.update(self._worker_env)
+        return env
+
+    def _create_arguments_dict(self, ctx):
+        arguments = super(WorkerProcessExecutor, self)._create_arguments_dict(
+            ctx)
+        if self._log_level is not None:
+            # The level of the logger of the operation context in the worker
+            arguments['context']['context']['logger_level'] = self._log_level
+        return arguments
+
+
+def bootstrap():
+    """
+    Runs at the startup of every instrumented task worker process.
+    """
+    profile_dir = os.environ.get(profiling.WORKER_PROFILE_DIR_ENV)
+    if profile_dir:
+        profiling.profile_worker(profile_dir)
+
+
+def _operation(task):
+    # The tasks of an operation of a type are expected to take alike times.
+    # Resolved in the engine thread, which the models of the task belong to.
+    actor = task.node or task.relationship
+    actor_type = actor.type if actor is not None else None
+    return (actor_type.name if actor_type is not None else None,
+            task.interface_name, task.operation_name)
@@ -0,0 +1,114 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from datetime import datetime
+
+from aria import workflow
+from aria.modeling import models
+from aria.orchestrator import execution_preparer
+from aria.orchestrator.workflows.api import task as api_task
+from aria.orchestrator.workflows.builtin import workflows
+
+INSTALL_NODES = 'aria_plugin.install_nodes'
+UNINSTALL_NODES = 'aria_plugin.uninstall_nodes'
+
+
+@workflow
+def install_nodes(ctx, graph, node_names):
+    """
+    Installs the named nodes of the service, by their dependency order.
+    """
+    _add_node_workflows(ctx, graph, workflows.install_node, node_names)
+
+
+@workflow
+def uninstall_nodes(ctx, graph, node_names):
+    """
+    Uninstalls the named nodes of the service, by their reverse dependency
+    order.
+    """
+    _add_node_workflows(ctx, graph, workflows.uninstall_node, node_names,
+                        reverse=True)
+
+
+def _add_node_workflows(ctx, graph, node_workflow, node_names, reverse=False):
+    tasks_and_nodes = [
+        (api_task.WorkflowTask(node_workflow, node=node), node)
+        for node in ctx.nodes if node.name in node_names]
+    graph.add_tasks([task for task, _ in tasks_and_nodes])
+    workflows.create_node_task_dependencies(graph, tasks_and_nodes,
+                                            reverse=reverse)
+
+
+PLUGIN_WORKFLOWS = {
+    INSTALL_NODES: install_nodes,
+    UNINSTALL_NODES: uninstall_nodes,
+}
+
+# The states of the nodes of a service once installed, and once uninstalled
+INSTALLED_STATES = (models.Node.STARTED,)
+UNINSTALLED_STATES = (models.Node.INITIAL, models.Node.DELETED)
+
+
+def remaining_nodes(service, states):
+    """
+    The names of the nodes of the service which are not in any of the states,
+    along with those of the nodes whose tasks failed in the latest execution
+    of the service, if it did not succeed: a node is started before the
+    relationships it is the source of are established.
+    """
+    names = set(node.name for node in service.nodes.values()
+                if node.state not in states)
+    executions = list(service.executions)
+    latest = max(executions, key=lambda execution: execution.created_at) \
+        if executions else None
+    if latest is not None and latest.status in (latest.FAILED,
+                                                latest.CANCELLED):
+        for task in latest.tasks:
+            if task.status != task.FAILED:
+                continue
+            if task.node:
+                names.add(task.node.name)
+            elif task.relationship:
+                names.add(task.relationship.source_node.name)
+    return sorted(names)
+
+
+class ExecutionPreparer(execution_preparer.ExecutionPreparer):
+    """
+    Prepares executions of both the service workflows and the workflows of
+    this plugin.
+
+    ARIA only knows of the built-in workflows, which take no inputs, and of
+    the workflows declared by the service. The workflows of this plugin are
+    resolved here, and take their inputs as is.
+    """
+
+    def _create_execution_model(self, inputs=None):
+        if self._workflow_name not in PLUGIN_WORKFLOWS:
+            return super(ExecutionPreparer, self)._create_execution_model(
+                inputs)
+        self._validate_no_active_executions()
+        return models.Execution(
+            created_at=datetime.utcnow(),
+            service_fk=self._service.id,
+            workflow_name=self._workflow_name,
+            inputs=dict((name, models.Input.wrap(name, value))
+                        for name, value in (inputs or {}).items()))
+
+    def _get_workflow_fn(self, workflow_name):
+        if workflow_name in PLUGIN_WORKFLOWS:
+            return PLUGIN_WORKFLOWS[workflow_name]
+        return super(ExecutionPreparer, self)._get_workflow_fn(workflow_name)
@@ -25,6 +25,7 @@ setup(
     description='Cloudify plugin for ARIA.',
 
     packages=['aria_plugin'],
+    package_data={'aria_plugin': ['bootstrap/sitecustomize.py']},
     license='LICENSE',
     install_requires=[
         'apache-ariatosca[ssh]==0.2.0',
@@ -0,0 +1,95 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import pytest
+
+from aria_plugin import concurrency
+
+
+@pytest.fixture
+def load(mocker):
+    return mocker.MagicMock(return_value=0.1)
+
+
+def _end_tasks(limit, count, latency=1.0, store_wait=0.01,
+               operation='create'):
+    for _ in range(count):
+        limit.task_ended(operation, latency, store_wait)
+    return limit.limit
+
+
+def test_raised_on_idle_manager(load):
+    limit = concurrency.ConcurrencyLimit(minimum=2, maximum=10, load=load)
+
+    # Doubled once every window of as many tasks as the limit
+    assert _end_tasks(limit, 1) == 2
+    assert _end_tasks(limit, 1) == 4
+    assert _end_tasks(limit, 4) == 8
+    # Within the bounds
+    assert _end_tasks(limit, 8) == 10
+    assert _end_tasks(limit, 10) == 10
+    assert limit.picked == [2, 4, 8, 10]
+
+
+def test_lowered_on_load(load):
+    limit = concurrency.ConcurrencyLimit(minimum=2, maximum=10, load=load)
+    _end_tasks(limit, 6)
+    load.return_value = 1.5
+
+    assert _end_tasks(limit, 8) == 4
+    assert _end_tasks(limit, 4) == 2
+    assert _end_tasks(limit, 2) == 2
+
+    # Raised by one after the first congestion
+    load.return_value = 0.1
+    assert _end_tasks(limit, 2) == 3
+    assert limit.picked == [2, 4, 8, 4, 2, 3]
+
+
+def test_lowered_on_store_wait(load):
+    limit = concurrency.ConcurrencyLimit(minimum=1, maximum=10,
+                                         max_store_wait=0.2, load=load)
+    _end_tasks(limit, 3)
+
+    assert _end_tasks(limit, 4, store_wait=0.5) == 2
+
+
+def test_lowered_on_latency(load):
+    limit = concurrency.ConcurrencyLimit(minimum=1, maximum=10,
+                                         latency_tolerance=2.0, load=load)
+    _end_tasks(limit, 3)
+
+    assert _end_tasks(limit, 4, latency=10.0) == 2
+
+
+def test_mixed_operations(load):
+    limit = concurrency.ConcurrencyLimit(minimum=2, maximum=16,
+                                         latency_tolerance=2.0, load=load)
+
+    # Slow operations are no congestion, as long as they are not slower
+    # than they used to be
+    for _ in range(5):
+        for operation, latency in (('configure', 0.5), ('create', 1.0),
+                                   ('start', 5.0), ('delete', 30.0)):
+            limit.task_ended(operation, latency, 0.01)
+    assert limit.limit == 16
+    assert limit.picked == [2, 4, 8, 16]
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        concurrency.ConcurrencyLimit(minimum=0)
+    with pytest.raises(ValueError):
+        concurrency.ConcurrencyLimit(minimum=4, maximum=2)
@@ -0,0 +1,34 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from aria_plugin.context import LocalContext
+
+
+def test_local_context(mocker):
+    ctx = mocker.MagicMock()
+    ctx.tenant_name = 'tenant'
+    ctx.blueprint.id = 'blueprint'
+    ctx.deployment.id = 'deployment'
+    ctx.node.properties = {'csar_path': 'service.csar'}
+    ctx.instance.runtime_properties = {'output': 'value'}
+
+    local_ctx = LocalContext.from_dict(LocalContext.from_ctx(ctx).to_dict())
+
+    assert local_ctx.tenant_name == 'tenant'
+    assert local_ctx.blueprint.id == 'blueprint'
+    assert local_ctx.deployment.id == 'deployment'
+    assert local_ctx.node.properties == {'csar_path': 'service.csar'}
+    assert local_ctx.instance.runtime_properties == {'output': 'value'}
+    assert local_ctx.logger.name == 'aria_plugin.deployment'
@@ -0,0 +1,192 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import threading
+
+import pytest
+from cloudify import ctx as current_ctx
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+
+from aria_plugin import constants, daemon, environment, exceptions
+
+
+@pytest.fixture
+def socket_path(tmpdir):
+    path = str(tmpdir.join('daemon.sock'))
+    server = daemon._Server(path, daemon._RequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mocked_ctx(mocker, socket_path):
+    mocked_ctx = mocker.MagicMock()
+    mocked_ctx.tenant_name = 'tenant'
+    mocked_ctx.blueprint.id = 'blueprint'
+    mocked_ctx.deployment.id = 'deployment'
+    mocked_ctx.node.properties = {
+        constants.DAEMON_PROPERTY: {'socket': socket_path}}
+    mocked_ctx.instance.runtime_properties = {'existing': 'value'}
+    mocked_ctx.logger.getEffectiveLevel.return_value = logging.DEBUG
+    return mocked_ctx
+
+
+@pytest.fixture
+def other_ctx(mocker, mocked_ctx):
+    other_ctx = mocker.MagicMock()
+    other_ctx.tenant_name = 'tenant'
+    other_ctx.blueprint.id = 'blueprint'
+    other_ctx.deployment.id = 'other'
+    other_ctx.node.properties = mocked_ctx.node.properties
+    other_ctx.instance.runtime_properties = {}
+    other_ctx.logger.getEffectiveLevel.return_value = logging.DEBUG
+    return other_ctx
+
+
+def test_socket_path():
+    assert daemon.socket_path({}) is None
+    assert daemon.socket_path({constants.DAEMON_PROPERTY: {'socket': ''}}) \
+        is None
+    assert daemon.socket_path(
+        {constants.DAEMON_PROPERTY: {'socket': 'daemon.sock'}}) == \
+        'daemon.sock'
+
+
+def test_request(mocker, socket_path, mocked_ctx):
+    seen = {}
+
+    def start():
+        seen['properties'] = current_ctx.node.properties
+        seen['deployment'] = current_ctx.deployment.id
+        current_ctx.logger.info('starting')
+        current_ctx.instance.runtime_properties['output'] = 'value'
+    mocker.patch('aria_plugin.operations.start', side_effect=start)
+
+    daemon.request(socket_path, 'start', mocked_ctx)
+
+    assert seen == {'properties': {}, 'deployment': 'deployment'}
+    mocked_ctx.logger.info.assert_called_once_with('starting')
+    assert mocked_ctx.instance.runtime_properties == {'existing': 'value',
+                                                      'output': 'value'}
+
+
+def test_request_log_level(mocker, socket_path, mocked_ctx):
+    def start():
+        current_ctx.logger.debug('starting')
+        current_ctx.logger.info('started')
+    mocker.patch('aria_plugin.operations.start', side_effect=start)
+    mocked_ctx.logger.getEffectiveLevel.return_value = logging.INFO
+
+    daemon.request(socket_path, 'start', mocked_ctx)
+
+    mocked_ctx.logger.debug.assert_not_called()
+    mocked_ctx.logger.info.assert_called_once_with('started')
+
+
+def test_request_inputs(mocker, socket_path, mocked_ctx):
+    mocked_teardown = mocker.patch('aria_plugin.operations.teardown_tenant')
+
+    daemon.request(socket_path, 'teardown_tenant', mocked_ctx, parallelism=2)
+
+    mocked_teardown.assert_called_once_with(parallelism=2)
+
+
+@pytest.mark.parametrize('error, expected_error', [
+    (NonRecoverableError('failed'), NonRecoverableError),
+    (RuntimeError('failed'), RecoverableError),
+])
+def test_request_error(mocker, socket_path, mocked_ctx, error,
+                       expected_error):
+    mocker.patch('aria_plugin.operations.stop', side_effect=error)
+
+    with pytest.raises(expected_error) as e:
+        daemon.request(socket_path, 'stop', mocked_ctx)
+
+    assert 'failed' in str(e.value)
+    assert mocked_ctx.instance.runtime_properties == {'existing': 'value'}
+
+
+def test_deployments_served_concurrently(mocker, socket_path, mocked_ctx,
+                                         other_ctx):
+    install_started = threading.Event()
+    install_released = threading.Event()
+    seen = {}
+
+    def start():
+        install_started.set()
+        seen['released'] = install_released.wait(2)
+    mocker.patch('aria_plugin.operations.start', side_effect=start)
+    mocker.patch('aria_plugin.operations.stop')
+
+    install = threading.Thread(target=daemon.request,
+                               args=(socket_path, 'start', mocked_ctx))
+    install.start()
+    try:
+        assert install_started.wait(2)
+        # Not held up by the workflow of another deployment of the tenant
+        daemon.request(socket_path, 'stop', other_ctx)
+    finally:
+        install_released.set()
+        install.join(2)
+    assert seen['released']
+
+
+def test_deployment_sessions(mocker, tmpdir, socket_path, mocked_ctx,
+                             other_ctx):
+    mocker.patch.object(environment.Environment, 'CLOUDIFY_PLUGINS_DIR',
+                        tmpdir.strpath)
+    mocker.patch.object(environment.Environment, 'resident', {})
+    started = dict(deployment=threading.Event(), other=threading.Event())
+    seen = {}
+
+    def prune(env):
+        deployment_id = current_ctx.deployment.id
+        other_id = 'other' if deployment_id == 'deployment' else 'deployment'
+        started[deployment_id].set()
+        # Both deployments use the storage at once
+        concurrent = started[other_id].wait(2)
+        seen[deployment_id] = (concurrent, env.model_storage,
+                               env.model_storage.service._session())
+    mocker.patch('aria_plugin.operations._prune', side_effect=prune)
+
+    prune_thread = threading.Thread(target=daemon.request,
+                                    args=(socket_path, 'prune', mocked_ctx))
+    prune_thread.start()
+    try:
+        daemon.request(socket_path, 'prune', other_ctx)
+    finally:
+        prune_thread.join(2)
+
+    concurrent, storage, session = seen['deployment']
+    other_concurrent, other_storage, other_session = seen['other']
+    assert concurrent and other_concurrent
+    # The resident storage of the tenant, with a session per thread
+    assert storage is other_storage
+    assert session is not other_session
+
+
+def test_request_unknown_operation(socket_path, mocked_ctx):
+    with pytest.raises(NonRecoverableError):
+        daemon.request(socket_path, 'execute', mocked_ctx)
+
+
+def test_daemon_unavailable(tmpdir, mocked_ctx):
+    with pytest.raises(exceptions.DaemonUnavailableException):
+        daemon.request(str(tmpdir.join('missing.sock')), 'start', mocked_ctx)
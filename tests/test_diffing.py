@@ -0,0 +1,112 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from aria_plugin import diffing
+
+
+def _node(mocker, name, targets=(), **raw):
+    node = mocker.MagicMock()
+    node.name = name
+    node.as_raw = dict(name=name, **raw)
+    node.outbound_relationships = []
+    for target in targets:
+        relationship = mocker.MagicMock()
+        relationship.target_node.name = target
+        node.outbound_relationships.append(relationship)
+    return node
+
+
+def _service(mocker, *nodes):
+    service = mocker.MagicMock()
+    service.nodes = dict((node.name, node) for node in nodes)
+    return service
+
+
+def test_diff_services(mocker):
+    old = _service(mocker,
+                   _node(mocker, 'a', type_name='t1'),
+                   _node(mocker, 'b', type_name='t1'),
+                   _node(mocker, 'c', type_name='t1'))
+    new = _service(mocker,
+                   _node(mocker, 'a', type_name='t1'),
+                   _node(mocker, 'b', type_name='t2'),
+                   _node(mocker, 'd', type_name='t1'))
+
+    assert diffing.diff_services(old, new) == diffing.ServiceDiff(
+        added=['d'], removed=['c'], changed=['b'], unchanged=['a'])
+
+
+def test_diff_services_ignores_named_items_order(mocker):
+    operations = [{'name': 'create', 'implementation': 'create.sh'},
+                  {'name': 'start', 'implementation': None}]
+    old = _service(mocker, _node(mocker, 'a', operations=operations))
+    new = _service(mocker, _node(mocker, 'a', operations=operations[::-1]))
+
+    assert diffing.diff_services(old, new).unchanged == ['a']
+
+
+def test_diff_services_changes_dependents(mocker):
+    old = _service(mocker,
+                   _node(mocker, 'a', type_name='t1'),
+                   _node(mocker, 'b', targets=['a']),
+                   _node(mocker, 'c', targets=['b']),
+                   _node(mocker, 'd'))
+    new = _service(mocker,
+                   _node(mocker, 'a', type_name='t2'),
+                   _node(mocker, 'b', targets=['a']),
+                   _node(mocker, 'c', targets=['b']),
+                   _node(mocker, 'd'))
+
+    diff = diffing.diff_services(old, new)
+
+    assert diff.changed == ['a', 'b', 'c']
+    assert diff.unchanged == ['d']
+
+
+def test_installed_changes(mocker):
+    old = _service(mocker,
+                   _node(mocker, 'a', type_name='t1'),
+                   _node(mocker, 'b', type_name='t1'))
+    new = _service(mocker,
+                   _node(mocker, 'a', type_name='t1'),
+                   _node(mocker, 'b', type_name='t2'),
+                   _node(mocker, 'c', type_name='t1'))
+    new.executions = []
+    for node, state in zip(sorted(new.nodes.values(),
+                                  key=lambda node: node.name),
+                           ('started', 'initial', 'started')):
+        node.state = state
+
+    # a only holds the state of the node of the old service
+    assert diffing.installed_changes(old, new) == ['c']
+
+
+def test_copy_node_states(mocker):
+    old_node = _node(mocker, 'a')
+    old_node.state = 'started'
+    old_node.attributes = {'ip': mocker.MagicMock(value='1.1.1.1')}
+    new_node = _node(mocker, 'a')
+    new_node.state = 'initial'
+    new_node.attributes = {'ip': mocker.MagicMock(value=None)}
+    model_storage = mocker.MagicMock()
+
+    diffing.copy_node_states(_service(mocker, old_node),
+                             _service(mocker, new_node),
+                             ['a'],
+                             model_storage)
+
+    assert new_node.state == 'started'
+    assert new_node.attributes['ip'].value == '1.1.1.1'
+    model_storage.node.update.assert_called_once_with(new_node)
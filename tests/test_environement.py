@@ -13,14 +13,15 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import logging
 import os
 
 import pytest
 
 import aria
-from aria.storage.filesystem_rapi import FileSystemResourceAPI
 from aria.storage.sql_mapi import SQLAlchemyModelAPI
-from aria_plugin import environment, constants, utils, exceptions
+from aria_plugin import (concurrency, environment, constants, ephemeral,
+                         parsing, plugin_store, resources, utils, exceptions)
 
 
 class TestEnvironment(object):
@@ -31,12 +32,54 @@ class TestEnvironment(object):
         mocker.patch('aria_plugin.utils.silent_create',
                      return_value=self._workdir)
         mocked_ctx = mocker.MagicMock()
+        mocked_ctx.node.properties = {}
         return environment.Environment(mocked_ctx)
 
     def test_ctx_logger(self, env):
         env.ctx_logger.info('some info')
         env._ctx.logger.info.assert_called_once_with('some info')
 
+    def test_log_level(self, env):
+        env._ctx.logger.getEffectiveLevel.return_value = logging.DEBUG
+        assert env.log_level == logging.DEBUG
+
+        env._ctx.node.properties[constants.LOGGING_PROPERTY] = {
+            'level': 'info'}
+        assert env.log_level == logging.INFO
+
+        env._ctx.logger.getEffectiveLevel.return_value = logging.ERROR
+        assert env.log_level == logging.ERROR
+
+        env._ctx.node.properties[constants.LOGGING_PROPERTY] = {
+            'level': 'verbose'}
+        with pytest.raises(ValueError):
+            env.log_level
+
+    def test_task_concurrency(self, env):
+        # Opt-in
+        assert env.task_concurrency is None
+
+        env._ctx.node.properties[constants.CONCURRENCY_PROPERTY] = {
+            'enabled': True}
+        limit = env.task_concurrency
+        assert (limit.minimum, limit.maximum) == (concurrency.DEFAULT_MIN,
+                                                  concurrency.DEFAULT_MAX)
+        # Every workflow adapts a limit of its own
+        assert env.task_concurrency is not limit
+
+        env._ctx.node.properties[constants.CONCURRENCY_PROPERTY] = {
+            'enabled': True, 'min': 1, 'max': 4}
+        assert env.task_concurrency.maximum == 4
+
+        env._ctx.node.properties[constants.CONCURRENCY_PROPERTY] = {
+            'enabled': True, 'min': 4, 'max': 1}
+        with pytest.raises(ValueError):
+            env.task_concurrency
+
+        env._ctx.node.properties[constants.CONCURRENCY_PROPERTY] = {
+            'enabled': False}
+        assert env.task_concurrency is None
+
     def test_workdir(self, env):
         assert env.workdir == self._workdir
 
@@ -51,6 +94,10 @@ class TestEnvironment(object):
     def test_model_storage_dir(self, env):
         assert env.model_storage_dir == os.path.join(self._workdir, 'models')
 
+    def test_model_storage_path(self, env):
+        assert env.model_storage_path == os.path.join(
+            self._workdir, 'models', 'db.sqlite')
+
     def test_model_resource_storage_dir(self, env):
         assert env.resource_storage_dir == os.path.join(
             self._workdir, 'resources')
@@ -73,14 +120,27 @@ class TestEnvironment(object):
         # Check that the same model storage is being returned
         assert model_storage == env.model_storage
 
+    def test_registry(self, env, mocker):
+        mocker.patch.object(env, '_model_storage')
+
+        assert env.registry.path == os.path.join(self._workdir,
+                                                 constants.REGISTRY_FILENAME)
+        # No model store was created yet
+        assert env._registry_entries() == {}
+        env._model_storage.service_template.list.assert_not_called()
+
+        # Check that the same registry is being returned
+        assert env.registry == env.registry
+
     def test_resource_storage(self, env, mocker):
         mocker.patch('aria.application_resource_storage')
 
         resource_storage = env.resource_storage
 
         aria.application_resource_storage.assert_called_once_with(
-            api=FileSystemResourceAPI,
-            api_kwargs={'directory': os.path.join(self._workdir, 'resources')}
+            api=resources.ResourceAPI,
+            api_kwargs={'directory': os.path.join(self._workdir, 'resources'),
+                        'blobs_dir': constants.ARIA_RESOURCE_BLOBS_DIR}
         )
 
         # Check that the same resource storage is being returned
@@ -99,9 +159,28 @@ class TestEnvironment(object):
 
         # Check that the same core is being returned
         assert core == env.core
+        assert not isinstance(core, parsing.CachingCore)
+
+        # Parses through the parse cache, when it is enabled
+        env._core = None
+        env._parse_cache = 'parse_cache'
+        assert isinstance(env.core, parsing.CachingCore)
+
+    def test_shared_plugin_manager(self, env):
+        env._model_storage = 'model_storage'
+
+        plugin_manager = env.plugin_manager
+
+        assert isinstance(plugin_manager, plugin_store.SharedPluginManager)
+        assert plugin_manager._store == env.plugin_store
+        assert plugin_manager._workdir == self._workdir
+        utils.silent_create.assert_called_with(os.path.join(
+            env.CLOUDIFY_PLUGINS_DIR, '.aria-plugin-store'))
 
     def test_plugin_manager(self, env):
         env._model_storage = 'model_storage'
+        env._ctx.node.properties = {
+            constants.PLUGIN_STORE_PROPERTY: {'enabled': False}}
 
         plugin_manager = env.plugin_manager
 
@@ -112,6 +191,104 @@ class TestEnvironment(object):
         # Check that the same plugin manager is being returned
         assert plugin_manager == env.plugin_manager
 
+    def test_profiler(self, env):
+        env._ctx.tenant_name = 'tenant_name'
+        env._ctx.deployment.id = 'deployment_id'
+        env._ctx.node.properties = {}
+
+        assert env.profiler is None
+
+        env._ctx.node.properties = {
+            constants.PROFILING_PROPERTY: {'enabled': True, 'retain': 3}}
+        profiler = env.profiler
+
+        assert profiler._directory == os.path.join(
+            self._workdir, 'profiles', env.service_template_name)
+        assert profiler._retain == 3
+
+        # Check that the same profiler is being returned
+        assert profiler == env.profiler
+
+    def test_tracer(self, env):
+        env._ctx.tenant_name = 'tenant_name'
+        env._ctx.deployment.id = 'deployment_id'
+        assert env.tracer is None
+
+        env._ctx.node.properties = {
+            constants.TRACING_PROPERTY: {'enabled': True, 'retain': 3}}
+        tracer = env.tracer
+
+        assert tracer._directory == os.path.join(
+            self._workdir, 'traces', env.service_template_name)
+        assert tracer._retain == 3
+
+        # Check that the same tracer is being returned
+        assert tracer == env.tracer
+
+    def test_metrics(self, env):
+        env._ctx.tenant_name = 'tenant_name'
+        env._ctx.node.properties = {
+            constants.METRICS_PROPERTY: {'textfile': 'aria.prom'}}
+
+        metrics = env.metrics
+
+        assert metrics._textfile == 'aria.prom'
+        assert metrics._tenant == 'tenant_name'
+
+        # Check that the same metrics are being returned
+        assert metrics == env.metrics
+
+    def test_resident_storages(self, env, mocker):
+        mocker.patch('aria.application_model_storage')
+        mocker.patch.object(environment.Environment, 'resident', {})
+        other_env = environment.Environment(env._ctx)
+
+        assert env.model_storage == other_env.model_storage
+        aria.application_model_storage.assert_called_once()
+
+        env._plugin_store = mocker.MagicMock()
+        env.rm_working_dir()
+        assert environment.Environment.resident == {}
+
+    def test_parse_cache(self, env, mocker):
+        # Opt-in
+        assert env.parse_cache is None
+
+        env._ctx.node.properties = {
+            constants.PARSE_CACHE_PROPERTY: {'enabled': True,
+                                             'processes': 4}}
+        mocked_parse_cache = mocker.patch('aria_plugin.parsing.ParseCache')
+
+        parse_cache = env.parse_cache
+
+        mocked_parse_cache.assert_called_once_with(
+            directory=os.path.join(env.CLOUDIFY_PLUGINS_DIR,
+                                   '.aria-parse-cache'),
+            processes=4)
+        # Check that the same parse cache is being returned
+        assert parse_cache == env.parse_cache
+
+        env._parse_cache = None
+        env._ctx.node.properties = {
+            constants.PARSE_CACHE_PROPERTY: {'enabled': False}}
+        assert env.parse_cache is None
+
+    def test_model_storage_size(self, env, tmpdir):
+        env._workdir = tmpdir.strpath
+        assert env.model_storage_size == 0
+
+        tmpdir.mkdir('models').join('db.sqlite').write('content')
+        assert env.model_storage_size == len('content')
+
+    def test_model_storage_size_vanished_file(self, env, mocker, tmpdir):
+        env._workdir = tmpdir.strpath
+        models_dir = tmpdir.mkdir('models')
+        models_dir.join('db.sqlite').write('content')
+        mocker.patch('os.listdir',
+                     return_value=['db.sqlite', 'db.sqlite-journal'])
+
+        assert env.model_storage_size == len('content')
+
     def test_mk_working_dir(self, env):
         env._ctx.tenant_name = 'tenant_name'
 
@@ -123,11 +300,36 @@ class TestEnvironment(object):
         utils.silent_create.assert_called_with(expected_workdir_path)
         assert workdir == self._workdir
 
+    def test_ephemeral_storage(self, env, mocker):
+        env._ctx.tenant_name = 'tenant_name'
+        env._ctx.node.properties = {
+            constants.STORAGE_PROPERTY: {'ephemeral': True}}
+        mocker.patch('aria.application_model_storage')
+        env = environment.Environment(env._ctx)
+
+        utils.silent_create.assert_any_call(
+            os.path.join(ephemeral.memory_dir(), 'aria-tenant_name'))
+        env.model_storage
+        aria.application_model_storage.assert_called_once_with(
+            api=SQLAlchemyModelAPI,
+            initiator=ephemeral.init_storage,
+            initiator_kwargs={
+                'base_dir': os.path.join(self._workdir, 'models')
+            }
+        )
+        assert env.snapshots_dir == os.path.join(
+            env.CLOUDIFY_PLUGINS_DIR, 'aria-tenant_name-snapshots')
+
     def test_rm_working_dir(self, env, mocker):
         mocker.patch('aria_plugin.utils.silent_remove')
+        mocker.patch('aria_plugin.resources.collect_garbage')
+        env._plugin_store = mocker.MagicMock()
         env.rm_working_dir()
 
         utils.silent_remove.assert_called_once_with(self._workdir)
+        resources.collect_garbage.assert_called_once_with(
+            constants.ARIA_RESOURCE_BLOBS_DIR)
+        env.plugin_store.release.assert_called_once_with(self._workdir)
         assert env.workdir is None
 
     def test_service_template_name(self, env):
@@ -0,0 +1,68 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from aria_plugin import constants, ephemeral
+
+
+def test_storage_settings_from_properties():
+    settings = ephemeral.StorageSettings.from_properties({})
+    assert not settings.ephemeral
+    assert not settings.snapshot_due(failed=True)
+
+    settings = ephemeral.StorageSettings.from_properties(
+        {constants.STORAGE_PROPERTY: {'ephemeral': True,
+                                      'snapshot': 'on_failure'}})
+    assert settings.snapshot_due(failed=True)
+    assert not settings.snapshot_due(failed=False)
+
+    settings.snapshot = ephemeral.SNAPSHOT_ALWAYS
+    assert settings.snapshot_due(failed=False)
+
+    with pytest.raises(ValueError):
+        ephemeral.StorageSettings(snapshot='sometimes')
+
+
+def test_init_storage(tmpdir):
+    storage = ephemeral.init_storage(base_dir=tmpdir.strpath)
+
+    with storage['engine'].connect() as connection:
+        assert connection.execute('PRAGMA synchronous').scalar() == 0
+        assert connection.execute('PRAGMA journal_mode').scalar() == 'memory'
+
+
+def test_snapshot(tmpdir):
+    db_path = tmpdir.join('db.sqlite').strpath
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.execute('CREATE TABLE service (name VARCHAR)')
+        connection.execute("INSERT INTO service VALUES ('service')")
+    tmpdir.mkdir('resources').mkdir('service').join('script.sh').write('ls')
+    snapshot_dir = tmpdir.join('snapshots', 'snapshot').strpath
+
+    ephemeral.snapshot(db_path, tmpdir.join('resources').strpath,
+                       snapshot_dir)
+
+    with closing(sqlite3.connect(
+            os.path.join(snapshot_dir, 'db.sqlite'))) as connection:
+        assert connection.execute('SELECT name FROM service').fetchall() == \
+            [('service',)]
+    with open(os.path.join(snapshot_dir, 'resources', 'service',
+                           'script.sh')) as f:
+        assert f.read() == 'ls'
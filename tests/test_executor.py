@@ -13,13 +13,13 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import logging
 import time
 
 import pytest
 
-from aria.orchestrator import execution_preparer
-
-from aria_plugin import executor
+from aria import logger as aria_logger
+from aria_plugin import executor, resources, tracing, workflows
 from aria_plugin.exceptions import AriaWorkflowError
 
 
@@ -31,6 +31,12 @@ def mocked_env(mocker):
     mocked_env.plugin_manager = 'plugin_manager'
     mocked_env.service.id = 'service_id'
     mocked_env.ctx_logger = mocker.MagicMock()
+    mocked_env.profiler = None
+    mocked_env.log_level = logging.DEBUG
+    mocked_env.task_concurrency = None
+    mocked_env.tracer = None
+    mocker.patch('aria_plugin.resources.rehydrate_service',
+                 return_value=False)
 
     return mocked_env
 
@@ -44,9 +50,9 @@ def _patch_runner(mocker, success=True):
     mock_ctx.execution = mock_execution
 
     mock_preparer = mocker.MagicMock()
-    mock_preparer.prepare = lambda: mock_ctx
+    mock_preparer.prepare = lambda **_: mock_ctx
 
-    mocker.patch('aria.orchestrator.execution_preparer.ExecutionPreparer',
+    mocker.patch('aria_plugin.workflows.ExecutionPreparer',
                  return_value=mock_preparer)
 
     return mock_preparer, mock_ctx
@@ -60,7 +66,7 @@ def test_successful_execute(mocked_env, mocker):
 
     executor.execute(mocked_env, 'workflow_name')
 
-    execution_preparer.ExecutionPreparer.assert_called_once_with(
+    workflows.ExecutionPreparer.assert_called_once_with(
         'model_storage',
         'resource_storage',
         'plugin_manager',
@@ -80,7 +86,7 @@ def test_failed_execution(mocker, mocked_env):
     with pytest.raises(AriaWorkflowError):
         executor.execute(mocked_env, 'workflow_name')
 
-    execution_preparer.ExecutionPreparer.assert_called_once_with(
+    workflows.ExecutionPreparer.assert_called_once_with(
         'model_storage',
         'resource_storage',
         'plugin_manager',
@@ -111,3 +117,190 @@ def test_execution_logging(mocker, mocked_env):
     mocked_env.ctx_logger.info.assert_any_call(mocked_log)
     mocked_env.ctx_logger.info.assert_called_with('traceback')
     assert mocked_env.ctx_logger.info.call_count == 2
+
+
+def test_execution_logging_level(mocker, mocked_env):
+    _patch_runner(mocker)
+    mocked_executor_cls = mocker.patch(
+        'aria_plugin.executor.WorkerProcessExecutor')
+    mocked_handler = mocker.MagicMock(level=logging.DEBUG)
+    task_logger = logging.getLogger(aria_logger.TASK_LOGGER_NAME)
+    mocker.patch.object(task_logger, 'handlers', [mocked_handler])
+    mocker.patch.object(task_logger, 'level', logging.DEBUG)
+    mocker.patch.object(task_logger, 'propagate', False)
+
+    def execute(**_):
+        task_logger.debug('has no implementation')
+        task_logger.info('successful')
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute',
+                 side_effect=execute)
+    mocker.patch('aria.cli.logger.ModelLogIterator', return_value=[])
+    mocked_env.log_level = logging.INFO
+
+    executor.execute(mocked_env, 'workflow_name')
+    # Other threads log regardless of the level
+    task_logger.debug('other')
+
+    assert [call[0][0].getMessage() for call
+            in mocked_handler.handle.call_args_list] == ['successful', 'other']
+    assert mocked_executor_cls.call_args[1]['log_level'] == logging.INFO
+
+
+def test_logs_forwarded_after_execution(mocker, mocked_env):
+    _patch_runner(mocker)
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+    mocked_log = mocker.MagicMock(level='ERROR', traceback=None)
+    mocker.patch('aria.cli.logger.ModelLogIterator',
+                 return_value=iter([mocked_log]))
+
+    executor.execute(mocked_env, 'workflow_name')
+
+    # The workflow ended before the logs were read
+    mocked_env.ctx_logger.error.assert_called_once_with(mocked_log)
+
+
+def test_task_concurrency_reported(mocker, mocked_env):
+    _patch_runner(mocker)
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+    mocker.patch('aria.cli.logger.ModelLogIterator', return_value=[])
+    mocked_executor_cls = mocker.patch(
+        'aria_plugin.executor.WorkerProcessExecutor')
+    concurrency = mocked_executor_cls.return_value.concurrency
+    concurrency.minimum, concurrency.maximum = 2, 16
+    concurrency.picked = [2, 4, 8, 4]
+
+    executor.execute(mocked_env, 'workflow_name')
+
+    assert mocked_executor_cls.call_args[1]['concurrency'] == \
+        mocked_env.task_concurrency
+    mocked_env.ctx_logger.info.assert_called_once_with(
+        'Task concurrency limits picked for workflow workflow_name '
+        '(within 2..16): 2, 4, 8, 4')
+    mocked_env.metrics.task_concurrency.assert_called_once_with(
+        'workflow_name', concurrency)
+
+
+def test_traced_execution(mocker, mocked_env):
+    _patch_runner(mocker)
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+    mocker.patch('aria.cli.logger.ModelLogIterator', return_value=[])
+    mocked_executor_cls = mocker.patch(
+        'aria_plugin.executor.WorkerProcessExecutor')
+    mocked_env.tracer = mocker.MagicMock()
+    mocked_env.tracer.write.return_value = ('trace_path', [
+        tracing.CriticalStep(task_id=1, name='node.Standard.create',
+                             attempts=1, waited=0.0, duration=1.5),
+        tracing.CriticalStep(task_id=2, name='node.Standard.start',
+                             attempts=2, waited=0.5, duration=1.0)])
+
+    executor.execute(mocked_env, 'workflow_name')
+
+    trace = mocked_executor_cls.call_args[1]['trace']
+    assert isinstance(trace, tracing.TaskTrace)
+    mocked_env.tracer.write.assert_called_once_with(
+        mocked_executor_cls.return_value.trace, 'workflow_name',
+        mocker.ANY)
+    mocked_env.ctx_logger.info.assert_any_call(
+        'Critical path of workflow workflow_name (3.000s, trace in '
+        'trace_path): node.Standard.create (1.500s), node.Standard.start '
+        '(1.000s)')
+
+
+def test_archived_resources_rehydrated(mocker, mocked_env):
+    _patch_runner(mocker)
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+    mocker.patch('aria.cli.logger.ModelLogIterator', return_value=[])
+    mocker.patch('aria_plugin.executor.WorkerProcessExecutor')
+    resources.rehydrate_service.return_value = True
+
+    executor.execute(mocked_env, 'uninstall')
+
+    resources.rehydrate_service.assert_called_once_with(
+        'resource_storage', mocked_env.service)
+    workflows.ExecutionPreparer.assert_called_once_with(
+        'model_storage', 'resource_storage', 'plugin_manager',
+        mocked_env.service, 'uninstall')
+
+
+def test_profiled_execution(mocker, mocked_env):
+    mocker.patch('aria.cli.logger.ModelLogIterator', return_value=[])
+    mock_runner, mock_ctx = _patch_runner(mocker)
+    mock_execute = \
+        mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+    mocked_env.profiler = mocker.MagicMock()
+    mocked_env.profiler.worker_env = {'KEY': 'value'}
+    mocked_env.profiler.wrap.side_effect = lambda func: func
+    mocked_executor_cls = mocker.patch(
+        'aria_plugin.executor.WorkerProcessExecutor')
+
+    executor.execute(mocked_env, 'workflow_name')
+
+    mocked_executor_cls.assert_called_once_with(
+        plugin_manager='plugin_manager',
+        strict_loading=False,
+        worker_env={'KEY': 'value'},
+        log_level=logging.DEBUG,
+        concurrency=None,
+        trace=None)
+    mocked_env.profiler.wrap.assert_called_once()
+    mock_execute.assert_called_once_with(ctx=mock_ctx)
+    mocked_executor_cls.return_value.close.assert_called_once()
+
+
+def test_execute_with_inputs(mocker, mocked_env):
+    mocker.patch('aria.cli.logger.ModelLogIterator', return_value=[])
+    mock_runner, mock_ctx = _patch_runner(mocker)
+    mock_runner.prepare = mocker.MagicMock(return_value=mock_ctx)
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+
+    executor.execute(mocked_env, 'workflow_name',
+                     inputs={'key': 'value'}, service='other_service')
+
+    workflows.ExecutionPreparer.assert_called_once_with(
+        'model_storage',
+        'resource_storage',
+        'plugin_manager',
+        'other_service',
+        'workflow_name',
+    )
+    mock_runner.prepare.assert_called_once_with(
+        execution_inputs={'key': 'value'}, executor=mocker.ANY)
+
+
+def test_start(mocker, mocked_env):
+    mocked_log = mocker.MagicMock(level='INFO')
+    mocker.patch('aria.cli.logger.ModelLogIterator',
+                 return_value=iter([mocked_log]))
+    mock_runner, mock_ctx = _patch_runner(mocker)
+    mocker.patch('aria.orchestrator.workflows.core.engine.Engine.execute')
+    mocker.patch('aria_plugin.executor.WorkflowRun._read_progress',
+                 side_effect=[{'pending': 1}, {'pending': 1}, {'success': 1}])
+
+    run = executor.start(mocked_env, 'workflow_name')
+    assert run.wait(1)
+
+    assert list(run.events()) == [
+        executor.WorkflowEvent(executor.LOG_EVENT, mocked_log),
+        executor.WorkflowEvent(executor.PROGRESS_EVENT, {'pending': 1})]
+    # Unchanged progress is not an event
+    assert list(run.events()) == []
+    assert list(run.events()) == [
+        executor.WorkflowEvent(executor.PROGRESS_EVENT, {'success': 1})]
+    assert run.result() == mock_ctx.execution
+    mocked_env.ctx_logger.info.assert_not_called()
+
+
+def test_supervise(mocker):
+    def run(events_by_round):
+        run = mocker.MagicMock()
+        run.done.side_effect = [False] * (len(events_by_round) - 1) + [True]
+        run.events.side_effect = events_by_round
+        return run
+    first_run = run([['a1'], [], ['a2']])
+    second_run = run([['b1']])
+
+    events = list(executor.supervise([first_run, second_run], interval=0))
+
+    assert events == [(first_run, 'a1'), (second_run, 'b1'),
+                      (first_run, 'a2')]
+    assert first_run.wait.call_count == 2
@@ -0,0 +1,145 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import zipfile
+
+from aria.orchestrator.plugin import PluginManager
+from aria.storage.exceptions import StorageError
+from cloudify import ctx
+from sqlalchemy.exc import OperationalError
+from wagon import WagonError, show
+
+from aria_plugin import constants, environment, exceptions, loadtest, metrics
+
+
+def test_percentile():
+    assert loadtest.percentile([], 50) is None
+    values = range(100, 0, -1)
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile([3], 90) == 3
+
+
+def test_error_category():
+    assert loadtest._error_category(StorageError(
+        'SQL Storage error: (sqlite3.OperationalError) unable to open '
+        'database file')) == 'sqlite_missing'
+    assert loadtest._error_category(OperationalError(
+        'CREATE TABLE type', {}, Exception('table type already exists'))) \
+        == 'sqlite_schema'
+    assert loadtest._error_category(
+        exceptions.PluginsAlreadyExistException()) == 'plugin_install'
+    assert loadtest._error_category(
+        WagonError('Could not install package')) == 'plugin_install'
+    assert loadtest._error_category(IOError()) == 'IOError'
+
+
+def test_write_csar(tmpdir):
+    csar_path = loadtest.write_csar(tmpdir.strpath, nodes=3)
+
+    with zipfile.ZipFile(csar_path) as csar:
+        service_template = csar.read('service.yaml')
+        assert 'scripts/noop.sh' in csar.namelist()
+        assert 'plugins/{0}'.format(loadtest.WAGON_NAME) in csar.namelist()
+    assert service_template.count('tosca.nodes.Root') == 3
+
+
+def test_write_wagon(tmpdir):
+    wagon_path = tmpdir.join(loadtest.WAGON_NAME).strpath
+    loadtest.write_wagon(wagon_path)
+
+    PluginManager.validate_plugin(wagon_path)
+    metadata = show(wagon_path)
+    assert metadata['package_name'] == loadtest.PLUGIN_NAME
+    assert metadata['archive_name'] == loadtest.WAGON_NAME
+    with zipfile.ZipFile(wagon_path) as wagon:
+        wheel_path = '{0}/wheels/{1}'.format(loadtest.PLUGIN_NAME,
+                                             loadtest.WHEEL_NAME)
+        assert metadata['wheels'] == [loadtest.WHEEL_NAME]
+        wagon.extract(wheel_path, tmpdir.strpath)
+    with zipfile.ZipFile(tmpdir.join(wheel_path).strpath) as wheel:
+        assert '{0}/__init__.py'.format(loadtest.PLUGIN_NAME) in \
+            wheel.namelist()
+
+
+def test_run(mocker, tmpdir):
+    calls = []
+
+    def operation(name):
+        def run_operation():
+            calls.append((ctx.tenant_name, ctx.deployment.id, name))
+            # The deployments run under the root dir
+            assert environment.Environment.CLOUDIFY_PLUGINS_DIR == \
+                tmpdir.join('plugins').strpath
+            ctx.logger.info('running %s', name)
+            if name == 'create':
+                assert ctx.node.properties[constants.PLUGINS_PROPERTY] == \
+                    [loadtest.WAGON_NAME]
+                collected = metrics.Metrics(
+                    ctx.node.properties[constants.METRICS_PROPERTY]
+                    ['textfile'], ctx.tenant_name)
+                with collected.phase('create', 'install_plugins'):
+                    pass
+                collected.plugin_installs(installed=0, cached=1)
+                collected.flush()
+                if ctx.deployment.id == 'deployment-3':
+                    raise WagonError('Could not install package')
+            if name == 'start' and ctx.deployment.id == 'deployment-1':
+                raise exceptions.AriaWorkflowError('failed')
+            if name == 'start' and ctx.deployment.id == 'deployment-2':
+                raise OperationalError('INSERT', {},
+                                       Exception('database is locked'))
+        return run_operation
+    for name in loadtest.DEFAULT_OPERATIONS:
+        mocker.patch('aria_plugin.loadtest.operations.{0}'.format(name),
+                     side_effect=operation(name))
+    csar_path = tmpdir.join('service.csar')
+    csar_path.write('csar')
+
+    results = loadtest.run(tmpdir.strpath, csar_path.strpath, [1, 2],
+                           deployments=4, plugins=[loadtest.WAGON_NAME])
+
+    assert [result.concurrency for result in results] == [1, 2]
+    result = results[1]
+    assert result.deployments == 4
+    assert len(result.latencies['create']) == 3
+    assert len(result.latencies['start']) == 1
+    assert len(result.latencies['delete']) == 1
+    assert result.errors == {'workflow': 1, 'sqlite_locked': 1,
+                             'plugin_install': 1}
+    assert result.logs == 4 + 3 + 1 + 1
+    assert ('loadtest-2', 'deployment-0', 'delete') in calls
+    assert ('loadtest-2', 'deployment-3', 'start') not in calls
+    assert result.plugin_installs.attempts == 4
+    assert result.plugin_installs.seconds < 1
+    assert result.plugin_installs.installed == 0
+    assert result.plugin_installs.cached == 4
+    assert result.plugin_installs.failed == 1
+    assert os.path.isfile(tmpdir.join('blueprints', 'loadtest-2', 'loadtest',
+                                      'service.csar').strpath)
+    assert environment.Environment.CLOUDIFY_PLUGINS_DIR != \
+        tmpdir.join('plugins').strpath
+
+    summary = loadtest.summarize(result)
+    assert summary['errors'] == {'workflow': 1, 'sqlite_locked': 1,
+                                 'plugin_install': 1}
+    assert summary['plugin_installs']['failed'] == 1
+    assert set(summary['latencies']['create']) == {'p50', 'p90', 'p99'}
+    report = loadtest.format_report(results).splitlines()
+    assert len(report) == 3
+    assert 'install fails' in report[0]
+    assert report[2].endswith(
+        'plugin_install=1, sqlite_locked=1, workflow=1')
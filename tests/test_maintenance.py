@@ -0,0 +1,196 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import pytest
+
+from aria_plugin import maintenance
+
+NOW = datetime(2017, 10, 1)
+
+# The parts of the ARIA model store schema which retention deals with
+SCHEMA = """
+CREATE TABLE service (
+    id INTEGER PRIMARY KEY, created_at DATETIME NOT NULL,
+    updated_at DATETIME, service_template_fk INTEGER);
+CREATE TABLE execution (
+    id INTEGER PRIMARY KEY, created_at DATETIME, ended_at DATETIME,
+    status VARCHAR(10), service_fk INTEGER NOT NULL);
+CREATE TABLE task (
+    id INTEGER PRIMARY KEY,
+    execution_fk INTEGER REFERENCES execution (id) ON DELETE CASCADE);
+CREATE TABLE task_task (
+    task_id INTEGER REFERENCES task (id),
+    task_self_ref_id INTEGER REFERENCES task (id));
+CREATE TABLE log (
+    id INTEGER PRIMARY KEY, created_at DATETIME, msg VARCHAR,
+    task_fk INTEGER REFERENCES task (id) ON DELETE CASCADE,
+    execution_fk INTEGER NOT NULL
+        REFERENCES execution (id) ON DELETE CASCADE);
+"""
+
+
+def _timestamp(days_ago):
+    return (NOW - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+@pytest.fixture
+def db_path(tmpdir):
+    db_path = tmpdir.join('db.sqlite').strpath
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.executescript(SCHEMA)
+        # Executions of service 1 ended 1, 2, ... 4 days ago, and service 2
+        # has a single old execution and an active one.
+        executions = [(i, 1, 'succeeded', i) for i in range(1, 5)] + \
+            [(5, 2, 'failed', 10), (6, 2, 'started', None)]
+        # Services 3 and 4 have no executions, and service 4 was updated
+        services = [(1, 20, None), (2, 20, None), (3, 20, None), (4, 20, 1)]
+        for id_, created_days_ago, updated_days_ago in services:
+            connection.execute(
+                'INSERT INTO service VALUES (?, ?, ?, ?)',
+                (id_, _timestamp(created_days_ago),
+                 _timestamp(updated_days_ago) if updated_days_ago else None,
+                 id_ * 100))
+        for id_, service, status, days_ago in executions:
+            ended_at = _timestamp(days_ago) if days_ago else None
+            connection.execute(
+                'INSERT INTO execution VALUES (?, ?, ?, ?, ?)',
+                (id_, ended_at or _timestamp(0), ended_at, status, service))
+            connection.execute('INSERT INTO task VALUES (?, ?)',
+                               (id_ * 10, id_))
+            connection.execute('INSERT INTO task VALUES (?, ?)',
+                               (id_ * 10 + 1, id_))
+            connection.execute('INSERT INTO task_task VALUES (?, ?)',
+                               (id_ * 10 + 1, id_ * 10))
+            connection.execute('INSERT INTO log VALUES (?, ?, ?, ?, ?)',
+                               (id_, _timestamp(days_ago or 0), 'message',
+                                id_ * 10, id_))
+    return db_path
+
+
+def _ids(db_path, table, column='id'):
+    with closing(sqlite3.connect(db_path)) as connection:
+        return sorted(row[0] for row in connection.execute(
+            'SELECT {0} FROM {1}'.format(column, table)))
+
+
+def test_prune_nothing_by_default(db_path):
+    removed = maintenance.prune(db_path, maintenance.RetentionPolicy(), NOW)
+
+    assert removed == dict(executions=0, logs=0)
+    assert _ids(db_path, 'execution') == [1, 2, 3, 4, 5, 6]
+
+
+def test_prune_keep_executions(db_path):
+    removed = maintenance.prune(
+        db_path, maintenance.RetentionPolicy(keep_executions=2), NOW)
+
+    assert removed == dict(executions=2, logs=0)
+    assert _ids(db_path, 'execution') == [1, 2, 5, 6]
+    assert _ids(db_path, 'task') == [10, 11, 20, 21, 50, 51, 60, 61]
+    assert _ids(db_path, 'task_task', 'task_id') == [11, 21, 51, 61]
+    assert _ids(db_path, 'log') == [1, 2, 5, 6]
+
+
+def test_prune_max_execution_age(db_path):
+    removed = maintenance.prune(
+        db_path, maintenance.RetentionPolicy(max_execution_age_days=2.5), NOW)
+
+    # The most recent execution of service 2 is kept, even though it is old
+    assert removed == dict(executions=2, logs=0)
+    assert _ids(db_path, 'execution') == [1, 2, 5, 6]
+
+
+def test_prune_max_log_age(db_path):
+    removed = maintenance.prune(
+        db_path, maintenance.RetentionPolicy(max_log_age_days=3.5), NOW)
+
+    assert removed == dict(executions=0, logs=2)
+    assert _ids(db_path, 'log') == [1, 2, 3, 6]
+
+
+def test_compact(db_path):
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.executemany(
+            'INSERT INTO log (created_at, msg, execution_fk) '
+            'VALUES (?, ?, ?)',
+            [(_timestamp(2), 'message' * 100, 2)] * 100)
+    maintenance.prune(
+        db_path, maintenance.RetentionPolicy(keep_executions=1), NOW)
+    size = os.path.getsize(db_path)
+
+    reclaimed = maintenance.compact(db_path)
+
+    assert reclaimed > 0
+    assert os.path.getsize(db_path) <= size
+    assert _ids(db_path, 'execution') == [1, 5, 6]
+
+
+def test_idle_services(db_path):
+    assert maintenance.idle_services(
+        db_path, maintenance.RetentionPolicy(), NOW) == []
+
+    # Service 2 has an active execution, however old its last one ended
+    assert maintenance.idle_services(
+        db_path, maintenance.RetentionPolicy(archive_idle_days=3), NOW) == \
+        [(3, 300)]
+    assert maintenance.idle_services(
+        db_path, maintenance.RetentionPolicy(archive_idle_days=0.5), NOW) == \
+        [(1, 100), (3, 300), (4, 400)]
+
+
+@pytest.mark.parametrize('sqlite_version', [sqlite3.sqlite_version_info,
+                                            (3, 7, 17)])
+def test_snapshot(mocker, db_path, tmpdir, sqlite_version):
+    mocker.patch.object(maintenance.sqlite3, 'sqlite_version_info',
+                        sqlite_version)
+    snapshot_path = tmpdir.join('snapshot.sqlite').strpath
+    # The model store may be in use while it is copied
+    with closing(sqlite3.connect(db_path)) as connection:
+        connection.execute('BEGIN')
+        connection.execute('DELETE FROM log')
+
+        maintenance.snapshot(db_path, snapshot_path)
+
+    assert _ids(snapshot_path, 'execution') == [1, 2, 3, 4, 5, 6]
+    assert _ids(snapshot_path, 'log') == _ids(db_path, 'log')
+
+
+def test_retention_policy_from_properties():
+    policy = maintenance.RetentionPolicy.from_properties(
+        {'retention': {'keep_executions': 3}})
+    assert policy.keep_executions == 3
+    assert policy.max_log_age_days == 0
+
+    policy = maintenance.RetentionPolicy.from_properties({})
+    assert policy.keep_executions == 0
+
+
+def test_maintenance_due(tmpdir):
+    stamp_path = tmpdir.join('stamp').strpath
+    policy = maintenance.RetentionPolicy(maintenance_interval_hours=1)
+
+    assert not maintenance.maintenance_due(stamp_path,
+                                           maintenance.RetentionPolicy())
+    assert maintenance.maintenance_due(stamp_path, policy)
+
+    maintenance.mark_maintained(stamp_path)
+    assert not maintenance.maintenance_due(stamp_path, policy)
+    assert maintenance.maintenance_due(
+        stamp_path, policy, now=os.path.getmtime(stamp_path) + 3600)
@@ -0,0 +1,139 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+
+import pytest
+
+from aria_plugin import metrics
+
+
+@pytest.fixture
+def textfile(tmpdir):
+    return tmpdir.join('collector', 'aria.prom')
+
+
+def _samples(textfile):
+    return dict(line.rsplit(' ', 1) for line in textfile.read().splitlines()
+                if not line.startswith('#'))
+
+
+def test_flush(mocker, textfile):
+    collected = metrics.Metrics(textfile=textfile.strpath, tenant='tenant')
+    with collected.phase('create', 'extract_csar'):
+        pass
+    collected.workflow_tasks('install', [mocker.MagicMock(status='success'),
+                                         mocker.MagicMock(status='success'),
+                                         mocker.MagicMock(status='failed')])
+    collected.log_forwarded('INFO')
+    collected.plugin_installs(installed=1, cached=2)
+    collected.model_store_size(1024)
+    collected.task_concurrency('install',
+                               mocker.MagicMock(picked=[2, 4, 8, 4], limit=4))
+    collected.flush()
+
+    samples = _samples(textfile)
+    assert samples[
+        'aria_plugin_operation_duration_seconds_count{operation="create",'
+        'phase="extract_csar",tenant="tenant"}'] == '1'
+    assert samples['aria_plugin_workflow_tasks{status="success",'
+                   'tenant="tenant",workflow="install"}'] == '2'
+    assert samples['aria_plugin_workflow_tasks{status="failed",'
+                   'tenant="tenant",workflow="install"}'] == '1'
+    assert samples['aria_plugin_forwarded_log_lines_total{level="INFO",'
+                   'tenant="tenant"}'] == '1'
+    assert samples['aria_plugin_plugin_installs_total{result="cached",'
+                   'tenant="tenant"}'] == '2'
+    assert samples['aria_plugin_model_store_bytes{tenant="tenant"}'] == \
+        '1024'
+    assert samples['aria_plugin_task_concurrency_limit{picked="highest",'
+                   'tenant="tenant",workflow="install"}'] == '8'
+    assert samples['aria_plugin_task_concurrency_limit{picked="last",'
+                   'tenant="tenant",workflow="install"}'] == '4'
+    assert '# TYPE aria_plugin_workflow_tasks gauge' in textfile.read()
+
+
+def test_flush_merges_operations(textfile):
+    for tenant in ('tenant', 'tenant', 'other_tenant'):
+        collected = metrics.Metrics(textfile=textfile.strpath, tenant=tenant)
+        collected.log_forwarded('INFO')
+        collected.model_store_size(len(tenant))
+        collected.flush()
+
+    samples = _samples(textfile)
+    assert samples['aria_plugin_forwarded_log_lines_total{level="INFO",'
+                   'tenant="tenant"}'] == '2'
+    assert samples['aria_plugin_forwarded_log_lines_total{level="INFO",'
+                   'tenant="other_tenant"}'] == '1'
+    assert samples['aria_plugin_model_store_bytes{tenant="tenant"}'] == '6'
+
+    state = metrics.load_state(textfile.strpath)
+    assert len(state[metrics.COUNTERS]) == 2
+    assert json.loads(textfile.dirpath('aria.prom.json').read()) == state
+
+
+def test_load_state_without_flush(textfile):
+    assert metrics.load_state(textfile.strpath) == {metrics.COUNTERS: {},
+                                                    metrics.GAUGES: {}}
+
+
+def test_flush_without_textfile(tmpdir):
+    collected = metrics.Metrics(tenant='tenant')
+    collected.log_forwarded('INFO')
+    collected.flush()
+
+
+def test_label_escaping(textfile):
+    collected = metrics.Metrics(textfile=textfile.strpath,
+                                tenant='te"n\\ant')
+    collected.model_store_size(0)
+    collected.flush()
+
+    assert 'aria_plugin_model_store_bytes{tenant="te\\"n\\\\ant"} 0' in \
+        textfile.read()
+
+
+def test_non_ascii_labels(textfile):
+    for tenant in (u't\xe9nant', 't\xc3\xa9nant'):
+        collected = metrics.Metrics(textfile=textfile.strpath, tenant=tenant)
+        collected.log_forwarded('INFO')
+        collected.flush()
+
+    samples = _samples(textfile)
+    assert samples['aria_plugin_forwarded_log_lines_total{level="INFO",'
+                   'tenant="t\xc3\xa9nant"}'] == '2'
+
+
+def test_workflow_tasks_reset(mocker, textfile):
+    collected = metrics.Metrics(textfile=textfile.strpath, tenant='tenant')
+    collected.workflow_started('install')
+    collected.workflow_tasks('install', [mocker.MagicMock(status='failed')])
+    collected.workflow_started('uninstall')
+    collected.workflow_tasks('uninstall',
+                             [mocker.MagicMock(status='success')])
+    collected.flush()
+
+    collected = metrics.Metrics(textfile=textfile.strpath, tenant='tenant')
+    collected.workflow_started('install')
+    collected.workflow_tasks('install', [mocker.MagicMock(status='success')])
+    collected.flush()
+
+    samples = _samples(textfile)
+    assert samples['aria_plugin_workflow_tasks{status="success",'
+                   'tenant="tenant",workflow="install"}'] == '1'
+    assert 'aria_plugin_workflow_tasks{status="failed",tenant="tenant",' \
+           'workflow="install"}' not in samples
+    assert samples['aria_plugin_workflow_tasks{status="success",'
+                   'tenant="tenant",workflow="uninstall"}'] == '1'
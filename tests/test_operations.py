@@ -13,12 +13,18 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import errno
 import os
+import sqlite3
 
 import pytest
+from aria.modeling.exceptions import UndeclaredInputsException
+from aria.orchestrator.exceptions import UndeclaredWorkflowError
 
 from aria_plugin import constants
-from aria_plugin import operations, exceptions
+from aria_plugin import (diffing, ephemeral, operations, exceptions,
+                         registry, workflows)
+from aria_plugin.validation import CSARIndex
 
 CSAR_PATH = 'path'
 PLUGINS = ['plugin1']
@@ -28,20 +34,31 @@ ENTRY_DEFINITIONS = 'service_template.yaml'
 BLUEPRINT_DIR = 'blueprint_dir'
 PLUGIN_MANAGER = 'plugin_manager'
 SERVICE_TEMPLATE_NAME = 'name'
+CSAR_DIGEST = 'digest'
 
 
 @pytest.fixture
-def mocked_env(mocker):
+def mocked_env(mocker, tmpdir):
     mock_env = mocker.MagicMock()
     mock_env.blueprint_dir = BLUEPRINT_DIR
+    mock_env.csar_cache_dir = tmpdir.join('csar-cache').strpath
     mock_env.plugin_manager = PLUGIN_MANAGER
     mock_env.service_template_name = SERVICE_TEMPLATE_NAME
+    mock_env.parse_cache = None
+    mock_env.resource_storage.service_template.base_path = \
+        tmpdir.join('service_template').strpath
+    mock_env.storage_settings = ephemeral.StorageSettings()
     # Each create execution checks that there are no existing service
     # templates with the same name as the current service template.
     # This mock ensures that an empty list would
     # be returned when calling for a list of service templates.
     mock_env.model_storage.service_template.list.return_value = []
+    mock_env.registry.get.return_value = None
     mocker.patch('aria_plugin.operations.Environment', return_value=mock_env)
+    mocker.patch('aria_plugin.operations.validate_csar',
+                 return_value=CSARIndex(digest=CSAR_DIGEST,
+                                        entry_definitions=ENTRY_DEFINITIONS,
+                                        plugins=PLUGINS))
     return mock_env
 
 
@@ -70,9 +87,14 @@ def test_create_no_exception(mocker, mocked_env, mocked_csar, mocked_ctx):
         'aria_plugin.operations.install_plugins')
     mocked_cleanup_files = mocker.patch(
         'aria_plugin.operations.cleanup_files')
-    mocked_aria_module = mocker.patch('aria_plugin.operations.aria')
+    mocked_install_aria_extensions = mocker.patch(
+        'aria_plugin.operations.install_aria_extensions')
     operations.create()
 
+    operations.validate_csar.assert_called_once_with(
+        os.path.join(BLUEPRINT_DIR, CSAR_PATH), PLUGINS,
+        mocked_env.csar_cache_dir)
+
     mocked_extract_csar.assert_called_once_with(
         os.path.join(BLUEPRINT_DIR, CSAR_PATH), mocked_ctx.logger)
 
@@ -83,7 +105,7 @@ def test_create_no_exception(mocker, mocked_env, mocked_csar, mocked_ctx):
         mocked_ctx.logger
     )
 
-    mocked_aria_module.install_aria_extensions.assert_called_once()
+    mocked_install_aria_extensions.assert_called_once()
 
     mocked_env.core.create_service_template.assert_called_once_with(
         service_template_path=os.path.join(
@@ -99,10 +121,93 @@ def test_create_no_exception(mocker, mocked_env, mocked_csar, mocked_ctx):
     mocked_cleanup_files.assert_called_once()
 
 
+@pytest.mark.usefixtures('mocked_csar')
+def test_create_with_inputs_file(mocker, tmpdir, mocked_env, mocked_ctx):
+    mocker.patch('aria_plugin.operations.extract_csar')
+    mocker.patch('aria_plugin.operations.install_plugins')
+    mocker.patch('aria_plugin.operations.cleanup_files')
+    mocker.patch('aria_plugin.operations.install_aria_extensions')
+    mocked_env.core.model_storage.service_template.get_by_name.return_value \
+        .id = 1
+    tmpdir.join('service_template', '1', 'inputs', 'large.yaml').write(
+        'key1: from_file\nkey2: [1, 2]\n', ensure=True)
+    mocked_ctx.node.properties[constants.INPUTS_FILE_PROPERTY] = \
+        'inputs/large.yaml'
+
+    operations.create()
+
+    mocked_env.core.create_service.assert_called_once_with(
+        1, {'key1': 'value1', 'key2': [1, 2]})
+    logged = ' '.join(call[0][0] for call
+                      in mocked_ctx.logger.info.call_args_list)
+    assert '2 inputs (sha256 ' in logged
+    assert 'value1' not in logged
+
+
+@pytest.mark.usefixtures('mocked_ctx', 'mocked_csar')
+def test_create_with_undeclared_inputs(mocker, mocked_env):
+    mocker.patch('aria_plugin.operations.extract_csar')
+    mocker.patch('aria_plugin.operations.install_plugins')
+    mocker.patch('aria_plugin.operations.cleanup_files')
+    mocker.patch('aria_plugin.operations.install_aria_extensions')
+    mocked_env.core.create_service.side_effect = \
+        UndeclaredInputsException('Undeclared inputs have been provided')
+
+    with pytest.raises(exceptions.InvalidInputsException):
+        operations.create()
+
+
+@pytest.mark.usefixtures('mocked_ctx')
+def test_create_with_prewarmed_csar(mocker, mocked_env):
+    extracted_dir = os.path.join(mocked_env.csar_cache_dir,
+                                 constants.EXTRACTED_CSARS_DIR, CSAR_DIGEST)
+    os.makedirs(extracted_dir)
+    mocked_extract_csar = mocker.patch('aria_plugin.operations.extract_csar')
+    mocker.patch('aria_plugin.operations.install_plugins')
+    mocked_cleanup_files = mocker.patch(
+        'aria_plugin.operations.cleanup_files')
+    mocker.patch('aria_plugin.operations.install_aria_extensions')
+
+    operations.create()
+
+    mocked_extract_csar.assert_not_called()
+    mocked_env.core.create_service_template.assert_called_once_with(
+        service_template_path=os.path.join(extracted_dir, ENTRY_DEFINITIONS),
+        service_template_dir=extracted_dir,
+        service_template_name=SERVICE_TEMPLATE_NAME)
+    # The extracted CSAR is kept for the next deployments
+    mocked_cleanup_files.assert_called_once_with([])
+
+
+def test_prewarm_blueprint(mocker, mocked_env, mocked_ctx):
+    mocked_prewarm = mocker.patch('aria_plugin.operations.prewarm.prewarm')
+
+    operations.prewarm_blueprint()
+
+    mocked_prewarm.assert_called_once_with(mocked_env, CSAR_PATH, PLUGINS)
+    mocked_env.metrics.phase.assert_any_call('prewarm_blueprint', 'prewarm')
+
+
+@pytest.mark.usefixtures('mocked_ctx')
+def test_create_with_parse_cache(mocker, mocked_env, mocked_csar):
+    mocker.patch('aria_plugin.operations.extract_csar',
+                 return_value=mocked_csar)
+    mocker.patch('aria_plugin.operations.install_plugins')
+    mocker.patch('aria_plugin.operations.cleanup_files')
+    mocker.patch('aria_plugin.operations.install_aria_extensions')
+    mocked_cached_reads = mocker.patch('aria_plugin.operations.cached_reads')
+    mocked_env.parse_cache = mocker.MagicMock()
+
+    operations.create()
+
+    mocked_cached_reads.assert_called_once_with(mocked_env.parse_cache,
+                                                CSAR_DESTINATION)
+
+
 @pytest.mark.usefixtures('mocked_env', 'mocked_csar')
 def test_create_raises_existing_plugin_exception(mocker, mocked_ctx):
     mocker.patch('aria_plugin.operations.cleanup_files')
-    mocker.patch('aria_plugin.operations.aria')
+    mocker.patch('aria_plugin.operations.install_aria_extensions')
     mocker.patch('aria_plugin.operations.install_plugins',
                  side_effect=exceptions.PluginsAlreadyExistException)
 
@@ -112,8 +217,23 @@ def test_create_raises_existing_plugin_exception(mocker, mocked_ctx):
     mocked_ctx.logger.debug.assert_called_once()
 
 
+@pytest.mark.usefixtures('mocked_env', 'mocked_ctx')
+def test_create_invalid_csar(mocker):
+    operations.validate_csar.side_effect = \
+        exceptions.InvalidCSARException('invalid')
+    mocked_extract_csar = mocker.patch('aria_plugin.operations.extract_csar')
+
+    with pytest.raises(exceptions.InvalidCSARException):
+        operations.create()
+
+    mocked_extract_csar.assert_not_called()
+
+
 @pytest.mark.usefixtures('mocked_ctx')
 def test_create_existing_service_exception(mocked_env):
+    # A previous create of the deployment did not complete
+    mocked_env.registry.get.return_value = {
+        'status': registry.STATUS_CREATING}
     mocked_env.model_storage.service_template.list.return_value = \
         ['existing_service_template']
 
@@ -121,7 +241,49 @@ def test_create_existing_service_exception(mocked_env):
         operations.create()
 
 
-def test_start(mocker, mocked_env, mocked_ctx):
+@pytest.mark.usefixtures('mocked_ctx')
+def test_create_registered_service_exception(mocked_env):
+    mocked_env.registry.get.return_value = {'status': registry.STATUS_STARTED}
+
+    with pytest.raises(exceptions.ServiceTemplateAlreadyExistsException):
+        operations.create()
+
+    mocked_env.model_storage.service_template.list.assert_not_called()
+
+
+@pytest.mark.usefixtures('mocked_csar')
+def test_create_registers_deployment(mocker, mocked_env, mocked_ctx):
+    mocker.patch('aria_plugin.operations.extract_csar')
+    mocker.patch('aria_plugin.operations.install_plugins')
+    mocker.patch('aria_plugin.operations.cleanup_files')
+    mocker.patch('aria_plugin.operations.install_aria_extensions')
+    service_template = \
+        mocked_env.core.model_storage.service_template.get_by_name()
+    service = mocked_env.core.create_service.return_value
+
+    operations.create()
+
+    mocked_env.model_storage.service_template.list.assert_not_called()
+    assert mocked_env.registry.put.call_args_list == [
+        mocker.call(mocked_ctx.deployment.id,
+                    status=registry.STATUS_CREATING,
+                    service_template_id=None, service_id=None,
+                    csar_digest=None),
+        mocker.call(mocked_ctx.deployment.id,
+                    status=registry.STATUS_CREATED,
+                    service_template_id=service_template.id,
+                    service_id=service.id, csar_digest=CSAR_DIGEST)]
+
+
+@pytest.fixture
+def mocked_remaining_nodes(mocker, mocked_env):
+    mocked_env.service.nodes = {'a_1': mocker.MagicMock(),
+                                'b_1': mocker.MagicMock()}
+    return mocker.patch('aria_plugin.workflows.remaining_nodes',
+                        return_value=['a_1', 'b_1'])
+
+
+def test_start(mocker, mocked_env, mocked_ctx, mocked_remaining_nodes):
 
     mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
 
@@ -134,23 +296,407 @@ def test_start(mocker, mocked_env, mocked_ctx):
 
     operations.start()
 
+    mocked_remaining_nodes.assert_called_once_with(
+        mocked_env.service, workflows.INSTALLED_STATES)
     mocked_executor_module.execute.assert_called_once_with(mocked_env,
                                                            'install')
     assert mocked_ctx.instance.runtime_properties == {'output_name': 'value'}
 
 
-def test_stop(mocker, mocked_env):
+def test_start_installed(mocker, mocked_env, mocked_ctx,
+                         mocked_remaining_nodes):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_remaining_nodes.return_value = []
+    mocked_env.service.outputs = {'output_name': mocker.MagicMock(
+        value='value')}
+    mocked_ctx.instance.runtime_properties = {}
+
+    operations.start()
+
+    assert not mocked_executor_module.execute.called
+    mocked_env.registry.put.assert_called_once_with(
+        mocked_ctx.deployment.id, status=registry.STATUS_STARTED)
+    assert mocked_ctx.instance.runtime_properties == {'output_name': 'value'}
+
+
+def test_start_partially_installed(mocker, mocked_env, mocked_ctx,
+                                   mocked_remaining_nodes):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_remaining_nodes.return_value = ['b_1']
+
+    operations.start()
+
+    mocked_executor_module.execute.assert_called_once_with(
+        mocked_env, workflows.INSTALL_NODES, inputs={'node_names': ['b_1']})
+
+
+def test_execute_workflow(mocker, mocked_env, mocked_ctx):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_output = mocker.MagicMock(value='value')
+    mocked_env.service.outputs = {'output_name': mocked_output}
+    mocked_ctx.instance.runtime_properties = {}
+
+    operations.execute_workflow(workflow='heal',
+                                parameters={'node_id': 'node_1'})
+
+    mocked_executor_module.execute.assert_called_once_with(
+        mocked_env, 'heal', inputs={'node_id': 'node_1'})
+    assert mocked_ctx.instance.runtime_properties == {'output_name': 'value'}
+
+
+def test_execute_undeclared_workflow(mocker, mocked_env, mocked_ctx):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_executor_module.execute.side_effect = \
+        UndeclaredWorkflowError('No workflow policy scale declared')
+
+    with pytest.raises(exceptions.InvalidWorkflowException):
+        operations.execute_workflow(workflow='scale')
+
+
+@pytest.mark.usefixtures('mocked_remaining_nodes')
+def test_metrics_flushed_on_failure(mocker, mocked_env, mocked_ctx):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_executor_module.execute.side_effect = \
+        exceptions.AriaWorkflowError('failed')
+
+    with pytest.raises(exceptions.AriaWorkflowError):
+        operations.start()
+
+    mocked_env.metrics.phase.assert_any_call('start', 'total')
+    mocked_env.metrics.flush.assert_called_once()
+
+
+@pytest.mark.usefixtures('mocked_remaining_nodes')
+def test_metrics_failure_ignored(mocker, mocked_env, mocked_ctx):
+    mocker.patch('aria_plugin.operations.executor')
+    type(mocked_env).model_storage_size = mocker.PropertyMock(
+        side_effect=OSError(errno.EACCES, 'Permission denied'))
+
+    operations.start()
+
+    mocked_env.metrics.flush.assert_not_called()
+    mocked_ctx.logger.warning.assert_called_once()
+
+
+@pytest.mark.usefixtures('mocked_remaining_nodes')
+def test_snapshot_on_failure(mocker, mocked_env, mocked_ctx, tmpdir):
+    mocked_env.storage_settings = ephemeral.StorageSettings(
+        ephemeral=True, snapshot=ephemeral.SNAPSHOT_ON_FAILURE)
+    mocked_env.snapshots_dir = tmpdir.strpath
+    mocked_snapshot = mocker.patch('aria_plugin.operations.ephemeral.snapshot')
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+
+    operations.start()
+    mocked_snapshot.assert_not_called()
+
+    mocked_executor_module.execute.side_effect = RuntimeError('failed')
+    with pytest.raises(RuntimeError):
+        operations.start()
+
+    mocked_snapshot.assert_called_once()
+    snapshot_dir = mocked_snapshot.call_args[0][2]
+    assert os.path.dirname(snapshot_dir) == tmpdir.strpath
+    assert snapshot_dir.endswith('-{0}-start'.format(SERVICE_TEMPLATE_NAME))
+
+
+@pytest.mark.usefixtures('mocked_remaining_nodes')
+def test_operation_sent_to_daemon(mocker, mocked_env, mocked_ctx):
+    mocked_ctx.node.properties[constants.DAEMON_PROPERTY] = {
+        'socket': 'daemon.sock'}
+    mocked_request = mocker.patch('aria_plugin.operations.daemon.request')
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+
+    operations.start()
+
+    mocked_request.assert_called_once_with('daemon.sock', 'start',
+                                           mocked_ctx)
+    mocked_executor_module.execute.assert_not_called()
+
+    mocked_request.side_effect = \
+        exceptions.DaemonUnavailableException('unavailable')
+    operations.start()
+
+    mocked_ctx.logger.warning.assert_called_once()
+    mocked_executor_module.execute.assert_called_once_with(mocked_env,
+                                                           'install')
+
+
+def test_operation_sent_to_daemon_with_injected_ctx(mocker, mocked_ctx):
+    mocked_ctx.node.properties[constants.DAEMON_PROPERTY] = {
+        'socket': 'daemon.sock'}
+    mocked_request = mocker.patch('aria_plugin.operations.daemon.request')
+
+    # The dispatcher passes the context as a keyword argument
+    operations.execute_workflow(ctx=mocked_ctx, workflow='heal',
+                                parameters={'node_id': 'node_1'})
+
+    mocked_request.assert_called_once_with(
+        'daemon.sock', 'execute_workflow', mocked_ctx, workflow='heal',
+        parameters={'node_id': 'node_1'})
+
+
+@pytest.mark.usefixtures('mocked_ctx')
+def test_stop(mocker, mocked_env, mocked_remaining_nodes):
     mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
     operations.stop()
+    mocked_remaining_nodes.assert_called_once_with(
+        mocked_env.service, workflows.UNINSTALLED_STATES)
     mocked_executor_module.execute.assert_called_once_with(mocked_env,
                                                            'uninstall')
 
 
+@pytest.mark.usefixtures('mocked_ctx')
+def test_stop_partially_uninstalled(mocker, mocked_env,
+                                    mocked_remaining_nodes):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_remaining_nodes.return_value = ['a_1']
+
+    operations.stop()
+
+    mocked_executor_module.execute.assert_called_once_with(
+        mocked_env, workflows.UNINSTALL_NODES, inputs={'node_names': ['a_1']})
+
+
+def test_stop_uninstalled(mocker, mocked_env, mocked_ctx,
+                          mocked_remaining_nodes):
+    mocked_executor_module = mocker.patch('aria_plugin.operations.executor')
+    mocked_remaining_nodes.return_value = []
+
+    operations.stop()
+
+    assert not mocked_executor_module.execute.called
+    mocked_env.registry.put.assert_called_once_with(
+        mocked_ctx.deployment.id, status=registry.STATUS_STOPPED)
+
+
+class TestUpdate(object):
+
+    @pytest.fixture(autouse=True)
+    def mocked_update(self, mocker):
+        mocker.patch('aria_plugin.operations._store_service_template')
+        mocked_maintenance = mocker.patch(
+            'aria_plugin.operations.maintenance')
+        mocked_maintenance.maintenance_due.return_value = False
+        mocked_executor = mocker.patch('aria_plugin.operations.executor')
+        mocked_diffing = mocker.patch('aria_plugin.operations.diffing')
+        mocked_diffing.diff_services.return_value = diffing.ServiceDiff(
+            added=['c_1'], removed=['d_1'], changed=['b_1'],
+            unchanged=['a_1'])
+        mocked_diffing.installed_changes.return_value = []
+        # All the nodes are installed
+        mocker.patch('aria_plugin.workflows.remaining_nodes',
+                     return_value=['a_1', 'b_1', 'c_1', 'd_1'])
+        return mocked_executor, mocked_diffing
+
+    def test_update(self, mocker, mocked_env, mocked_ctx, mocked_update):
+        mocked_executor, mocked_diffing = mocked_update
+        staging_name = constants.STAGING_SERVICE_TEMPLATE_NAME_FORMAT.format(
+            name=SERVICE_TEMPLATE_NAME)
+        old_template, staging_template = \
+            mocker.MagicMock(), mocker.MagicMock()
+        old_template.services = {'old': mocked_env.service}
+        mocked_env.model_storage.service_template.list.side_effect = \
+            lambda filters: [] if filters['name'] == staging_name \
+            else [old_template]
+        mocked_env.model_storage.service_template.get_by_name.return_value = \
+            staging_template
+        staging_service = mocked_env.core.create_service.return_value
+        staging_service.id = 2
+        staging_service.outputs = {'output_name': mocker.MagicMock(value=1)}
+        mocked_ctx.instance.runtime_properties = {}
+
+        operations.update()
+
+        operations._store_service_template.assert_called_once_with(
+            mocked_env, 'update', staging_name)
+        mocked_env.core.create_service.assert_called_once_with(
+            staging_template.id, INPUTS, service_name=staging_name)
+        mocked_executor.execute.assert_has_calls([
+            mocker.call(mocked_env, workflows.UNINSTALL_NODES,
+                        inputs={'node_names': ['d_1', 'b_1']},
+                        service=mocked_env.service),
+            mocker.call(mocked_env, workflows.INSTALL_NODES,
+                        inputs={'node_names': ['c_1', 'b_1']},
+                        service=staging_service)])
+        mocked_diffing.copy_node_states.assert_called_once_with(
+            mocked_env.service, staging_service, ['a_1'],
+            mocked_env.model_storage)
+
+        mocked_env.core.delete_service.assert_called_once_with(
+            mocked_env.service.id, force=True)
+        mocked_env.core.delete_service_template.assert_called_once_with(
+            old_template.id)
+        assert staging_template.name == SERVICE_TEMPLATE_NAME
+        assert staging_service.name == SERVICE_TEMPLATE_NAME + '_2'
+        assert mocked_ctx.instance.runtime_properties == {'output_name': 1}
+
+    @pytest.mark.usefixtures('mocked_ctx')
+    def test_update_without_changes(self, mocked_env, mocked_update):
+        mocked_executor, mocked_diffing = mocked_update
+        mocked_diffing.diff_services.return_value = diffing.ServiceDiff(
+            added=[], removed=[], changed=[], unchanged=['a_1'])
+
+        operations.update()
+
+        mocked_executor.execute.assert_not_called()
+        mocked_diffing.copy_node_states.assert_called_once()
+
+    @pytest.mark.usefixtures('mocked_ctx')
+    def test_update_discards_staging_leftovers(self, mocker, mocked_env):
+        leftover_service = mocker.MagicMock()
+        leftover_template = mocker.MagicMock()
+        leftover_template.services = {'leftover': leftover_service}
+        mocked_env.model_storage.service_template.list.return_value = \
+            [leftover_template]
+
+        operations.update()
+
+        mocked_env.core.delete_service.assert_any_call(
+            leftover_service.id, force=True)
+        mocked_env.core.delete_service_template.assert_any_call(
+            leftover_template.id)
+
+    def test_update_retry(self, mocker, mocked_env, mocked_ctx,
+                          mocked_update):
+        # The previous update uninstalled the removed and changed nodes of
+        # the service, and failed installing the changed node b_1 of its
+        # staging service after installing the added node c_1
+        mocked_executor, mocked_diffing = mocked_update
+        mocked_diffing.installed_changes.return_value = ['c_1', 'b_1']
+        staging_name = constants.STAGING_SERVICE_TEMPLATE_NAME_FORMAT.format(
+            name=SERVICE_TEMPLATE_NAME)
+        old_template, leftover_template = \
+            mocker.MagicMock(), mocker.MagicMock()
+        old_template.services = {'old': mocked_env.service}
+        leftover_service = mocker.MagicMock()
+        leftover_template.services = {'leftover': leftover_service}
+        mocked_env.model_storage.service_template.list.side_effect = \
+            lambda filters: [leftover_template] \
+            if filters['name'] == staging_name else [old_template]
+        installed_nodes = {mocked_env.service: ['a_1']}
+        mocker.patch('aria_plugin.workflows.remaining_nodes',
+                     side_effect=lambda service, _: installed_nodes[service])
+        staging_service = mocked_env.core.create_service.return_value
+        installed_nodes[staging_service] = []
+        staging_service.outputs = {}
+        mocked_ctx.instance.runtime_properties = {}
+
+        operations.update()
+
+        mocked_diffing.installed_changes.assert_called_once_with(
+            mocked_env.service, leftover_service)
+        assert mocked_executor.execute.call_args_list == [
+            mocker.call(mocked_env, workflows.UNINSTALL_NODES,
+                        inputs={'node_names': ['c_1', 'b_1']},
+                        service=leftover_service),
+            mocker.call(mocked_env, workflows.INSTALL_NODES,
+                        inputs={'node_names': ['c_1', 'b_1']},
+                        service=staging_service)]
+        mocked_env.core.delete_service.assert_any_call(
+            leftover_service.id, force=True)
+
+
+class TestMaintenance(object):
+
+    @pytest.fixture(autouse=True)
+    def mocked_maintenance(self, mocker):
+        mocker.patch('aria_plugin.operations.executor')
+        mocked_maintenance = mocker.patch(
+            'aria_plugin.operations.maintenance')
+        mocked_maintenance.prune.return_value = dict(executions=1, logs=2)
+        mocked_maintenance.compact.return_value = 1024
+        mocked_maintenance.idle_services.return_value = [(1, 10), (2, 20)]
+        return mocked_maintenance
+
+    @pytest.mark.usefixtures('mocked_ctx')
+    def test_prune(self, mocked_env, mocked_maintenance):
+        operations.prune()
+        mocked_maintenance.prune.assert_called_once_with(
+            mocked_env.model_storage_path,
+            mocked_maintenance.RetentionPolicy.from_properties.return_value)
+
+    @pytest.mark.usefixtures('mocked_ctx')
+    def test_compact(self, mocked_env, mocked_maintenance):
+        operations.compact()
+        mocked_maintenance.compact.assert_called_once_with(
+            mocked_env.model_storage_path)
+
+    @pytest.mark.usefixtures('mocked_ctx')
+    def test_archive(self, mocker, mocked_env, mocked_maintenance):
+        mocked_archive_service = mocker.patch(
+            'aria_plugin.resources.archive_service', return_value=512)
+
+        operations.archive()
+
+        mocked_maintenance.idle_services.assert_called_once_with(
+            mocked_env.model_storage_path,
+            mocked_maintenance.RetentionPolicy.from_properties.return_value)
+        mocked_archive_service.assert_any_call(mocked_env.resource_storage,
+                                               10, 1)
+        mocked_archive_service.assert_any_call(mocked_env.resource_storage,
+                                               20, 2)
+
+    @pytest.mark.usefixtures('mocked_ctx', 'mocked_env')
+    def test_scheduled_maintenance(self, mocker, mocked_maintenance):
+        mocked_archive_service = mocker.patch(
+            'aria_plugin.resources.archive_service', return_value=0)
+        mocked_maintenance.maintenance_due.return_value = False
+        operations.stop()
+        mocked_maintenance.prune.assert_not_called()
+
+        mocked_maintenance.maintenance_due.return_value = True
+        operations.stop()
+        mocked_maintenance.prune.assert_called_once()
+        # Left to the compact operation, as it locks the model store
+        mocked_maintenance.compact.assert_not_called()
+        assert mocked_archive_service.call_count == 2
+        mocked_maintenance.mark_maintained.assert_called_once()
+
+    @pytest.mark.usefixtures('mocked_env')
+    def test_scheduled_maintenance_failure(self, mocked_ctx,
+                                           mocked_maintenance):
+        mocked_maintenance.maintenance_due.return_value = True
+        mocked_maintenance.prune.side_effect = sqlite3.OperationalError(
+            'database is locked')
+
+        operations.stop()
+
+        mocked_ctx.logger.warning.assert_called_once()
+        mocked_maintenance.mark_maintained.assert_not_called()
+
+
+class TestTeardownTenant(object):
+
+    @pytest.fixture(autouse=True)
+    def mocked_teardown(self, mocker):
+        mocked_ctx = mocker.patch('aria_plugin.operations.ctx')
+        mocked_ctx.node.properties = {}
+        return mocker.patch('aria_plugin.operations.teardown.teardown')
+
+    def test_teardown_tenant(self, mocked_env, mocked_teardown):
+        mocked_teardown.return_value = {'t-1': None, 't-2': None}
+
+        operations.teardown_tenant(parallelism=2)
+
+        mocked_teardown.assert_called_once_with(mocked_env, 2)
+
+    @pytest.mark.usefixtures('mocked_env')
+    def test_teardown_tenant_failures(self, mocked_teardown):
+        mocked_teardown.return_value = {'t-1': None, 't-2': 'error'}
+
+        with pytest.raises(exceptions.TenantTeardownException) as e:
+            operations.teardown_tenant()
+
+        assert 't-2: error' in str(e.value)
+        assert 't-1' not in str(e.value)
+
+
 class TestDelete(object):
 
     @pytest.fixture(autouse=True)
     def simple_ctx_mocking(self, mocker):
-        mocker.patch('aria_plugin.operations.ctx')
+        mocked_ctx = mocker.patch('aria_plugin.operations.ctx')
+        mocked_ctx.node.properties = {}
 
     def test_delete_models(self, mocker, mocked_env):
         mocked_env.service.id = 'service_id'
@@ -164,6 +710,7 @@ class TestDelete(object):
         mocked_env.core.delete_service.assert_called_once_with('service_id')
         mocked_env.core.delete_service_template.assert_called_once_with(
             'template_id')
+        mocked_env.registry.remove.assert_called_once()
 
     def test_delete_remove_working_dir(self, mocked_env):
         # we are expected to delete the working dir iff there are no more
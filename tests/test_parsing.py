@@ -0,0 +1,118 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+
+import pytest
+from aria.parser.loading import UriLocation
+from aria.parser.reading import source, yaml
+
+from aria_plugin import parsing
+
+DOCUMENT = 'node_types:\n  MyType:\n    derived_from: tosca.nodes.Root\n'
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return parsing.ParseCache(str(tmpdir.join('cache')), processes=2)
+
+
+def _document(tmpdir, name, content=DOCUMENT):
+    path = tmpdir.join(name)
+    path.write(content)
+    return str(path)
+
+
+def test_cache_entries(cache):
+    assert cache.get('digest') is None
+
+    cache.put('digest', {'key': 'value'})
+    assert cache.get('digest') == {'key': 'value'}
+
+    with open(os.path.join(cache.directory, 'corrupted.pickle'), 'w') as f:
+        f.write('corrupted')
+    assert cache.get('corrupted') is None
+
+
+def test_cached_read(tmpdir, cache, mocker):
+    first_path = _document(tmpdir, 'first.yaml')
+    second_path = _document(tmpdir, 'second.yaml')
+
+    parsing._warm_entry((first_path, cache.directory))
+    assert len(os.listdir(cache.directory)) == 1
+
+    mocker.spy(yaml.YamlReader, 'read')
+    reader = parsing.CachingYamlReader(
+        None, None, mocker.MagicMock(location='second'))
+    reader.cache = cache
+    reader._data = open(second_path).read().decode('utf-8')
+    raw = reader.read()
+
+    assert yaml.YamlReader.read.call_count == 0
+    assert raw['node_types']['MyType']['derived_from'] == 'tosca.nodes.Root'
+    assert raw._locator.location == 'second'
+    assert raw._locator.children['node_types'].location == 'second'
+
+
+def test_warm(tmpdir, cache, mocker):
+    paths = [_document(tmpdir, 'first.yaml'),
+             _document(tmpdir, 'second.yaml', 'other: document\n')]
+    mocked_pool = mocker.patch('multiprocessing.Pool')
+    mocked_pool.return_value.map.side_effect = map
+
+    assert cache.warm(paths) == paths
+    mocked_pool.assert_called_once_with(2)
+    assert len(os.listdir(cache.directory)) == 2
+
+    assert cache.warm(paths) == []
+
+
+def test_warm_from_daemonic_process(tmpdir, cache, mocker):
+    paths = [_document(tmpdir, 'first.yaml'),
+             _document(tmpdir, 'second.yaml', 'other: document\n')]
+    mocker.patch('multiprocessing.Pool', side_effect=AssertionError)
+
+    assert cache.warm(paths) == paths
+    assert os.listdir(cache.directory) == []
+
+
+def test_cached_reads(tmpdir, cache, mocker):
+    mocker.patch.object(cache, 'warm')
+    mocker.patch.object(cache, 'prune')
+    mocker.patch('aria_plugin.parsing._profiles_dir',
+                 return_value=str(tmpdir.join('profiles')))
+    path = _document(tmpdir, 'service.yaml')
+
+    with parsing.cached_reads(None, str(tmpdir)):
+        pass
+
+    with parsing.cached_reads(cache, str(tmpdir)):
+        # The readers of other parses are left alone
+        assert source.EXTENSIONS['.yaml'] is yaml.YamlReader
+
+    cache.warm.assert_called_once_with([path])
+    cache.prune.assert_called_once()
+
+
+def test_caching_reader_source(cache):
+    reader_source = parsing.CachingReaderSource(cache)
+
+    reader = reader_source.get_reader(None, UriLocation('service.yaml'), None)
+    assert isinstance(reader, parsing.CachingYamlReader)
+    assert reader.cache is cache
+    assert parsing.CachingYamlReader.cache is None
+    assert not isinstance(
+        reader_source.get_reader(None, UriLocation('inputs.json'), None),
+        parsing.CachingYamlReader)
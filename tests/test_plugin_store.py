@@ -0,0 +1,118 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+import os
+
+import pytest
+from aria.orchestrator.plugin import PluginManager
+
+from aria_plugin import plugin_store
+
+
+@pytest.fixture
+def store(tmpdir):
+    return plugin_store.PluginStore(tmpdir.join('store').strpath)
+
+
+@pytest.fixture
+def wagon(tmpdir):
+    wagon = tmpdir.join('plugin.wgn')
+    wagon.write('wagon')
+    return wagon.strpath
+
+
+def _install(install_dir):
+    with open(os.path.join(install_dir, 'module.py'), 'w') as f:
+        f.write('pass')
+
+
+def _refs(store):
+    with open(os.path.join(store.directory, 'refs.json')) as f:
+        return json.load(f)
+
+
+def test_acquire_and_release(mocker, tmpdir, store, wagon):
+    install = mocker.Mock(side_effect=_install)
+    tenant1 = tmpdir.mkdir('aria-tenant1').strpath
+    tenant2 = tmpdir.mkdir('aria-tenant2').strpath
+
+    path = store.acquire(wagon, install, tenant1)
+    assert store.acquire(wagon, install, tenant2) == path
+
+    install.assert_called_once()
+    assert os.path.isfile(os.path.join(path, 'module.py'))
+    assert _refs(store) == {os.path.basename(path): [tenant1, tenant2]}
+
+    store.release(tenant1)
+    assert os.path.isdir(path)
+    store.release(tenant2)
+    assert not os.path.exists(path)
+    assert _refs(store) == {}
+
+
+def test_release_removed_workdirs(tmpdir, store, wagon):
+    tenant1 = tmpdir.mkdir('aria-tenant1')
+    tenant2 = tmpdir.mkdir('aria-tenant2')
+    path = store.acquire(wagon, _install, tenant1.strpath)
+    store.acquire(wagon, _install, tenant2.strpath)
+    # e.g. removed by hand
+    tenant2.remove()
+
+    store.release(tenant1.strpath)
+
+    assert not os.path.exists(path)
+
+
+def test_acquire_failure(tmpdir, store, wagon):
+    def install(install_dir):
+        _install(install_dir)
+        raise RuntimeError('failed')
+
+    with pytest.raises(RuntimeError):
+        store.acquire(wagon, install, tmpdir.mkdir('aria-tenant').strpath)
+
+    assert _refs(store) == {}
+    # Neither the installed plugin nor its staging dir are left
+    assert [name for name in os.listdir(store.directory)
+            if not name.endswith('.lock') and name != 'refs.json'] == []
+
+
+def test_shared_plugin_manager(mocker, tmpdir, store, wagon):
+    mocker.patch.object(PluginManager, '_install_wagon',
+                        side_effect=lambda source, prefix: _install(prefix))
+    workdir = tmpdir.mkdir('aria-tenant')
+    plugin_manager = plugin_store.SharedPluginManager(
+        model=mocker.MagicMock(),
+        plugins_dir=workdir.join('plugins').strpath,
+        store=store,
+        workdir=workdir.strpath)
+    prefix = workdir.join('plugins', 'plugin-1.0').strpath
+
+    plugin_manager._install_wagon(wagon, prefix)
+
+    assert os.path.islink(prefix)
+    assert os.path.isfile(os.path.join(prefix, 'module.py'))
+    assert os.path.realpath(prefix).startswith(store.directory)
+
+
+def test_acquire_by_digest(mocker, tmpdir, store):
+    install = mocker.Mock(side_effect=_install)
+    tenant = tmpdir.mkdir('aria-tenant').strpath
+
+    path = store.acquire(None, install, tenant, digest='digest')
+
+    assert path == os.path.join(store.directory, 'digest')
+    assert _refs(store) == {'digest': [tenant]}
@@ -0,0 +1,106 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+
+import pytest
+
+from aria_plugin import (constants, environment, exceptions, loadtest,
+                         prewarm, utils)
+
+
+@pytest.fixture
+def mocked_env(mocker, tmpdir):
+    mocked_env = mocker.MagicMock()
+    mocked_env.blueprint_dir = tmpdir.mkdir('blueprint').strpath
+    mocked_env.csar_cache_dir = tmpdir.join('csar-cache').strpath
+    mocked_env.parse_cache = None
+    loadtest.write_csar(mocked_env.blueprint_dir)
+    mocker.patch('aria_plugin.utils.install_aria_extensions')
+    return mocked_env
+
+
+def test_prewarm(mocker, mocked_env):
+    mocked_env.parse_cache = mocker.MagicMock()
+    mocked_cached_reads = mocker.patch('aria_plugin.prewarm.cached_reads')
+    mocked_install_plugins = mocker.patch(
+        'aria_plugin.utils.install_plugins',
+        side_effect=exceptions.PluginsAlreadyExistException(['plugin']))
+
+    csar = prewarm.prewarm(mocked_env, loadtest.CSAR_NAME, [])
+
+    assert csar.destination == os.path.join(
+        mocked_env.csar_cache_dir, constants.EXTRACTED_CSARS_DIR,
+        os.listdir(os.path.dirname(csar.destination))[0])
+    mocked_install_plugins.assert_called_once_with(
+        os.path.join(csar.destination, 'plugins'), [],
+        mocked_env.plugin_manager, mocked_env.ctx_logger)
+    mocked_cached_reads.assert_called_once_with(mocked_env.parse_cache,
+                                                csar.destination)
+    mocked_env.core.validate_service_template.assert_called_once_with(
+        os.path.join(csar.destination, 'service.yaml'))
+    # Extracted once
+    assert prewarm.prewarm(mocked_env, loadtest.CSAR_NAME, []) == csar
+
+
+def test_prewarm_without_parse_cache(mocker, mocked_env):
+    mocker.patch('aria_plugin.utils.install_plugins')
+
+    assert prewarm.prewarm(mocked_env, loadtest.CSAR_NAME, [])
+    mocked_env.core.validate_service_template.assert_not_called()
+
+
+def test_prewarm_remote_csar(mocker, mocked_env):
+    mocker.patch('aria_plugin.utils.cache_csar')
+
+    assert prewarm.prewarm(mocked_env, 'http://host/service.csar', []) \
+        is None
+    utils.cache_csar.assert_not_called()
+
+
+def test_main(mocker):
+    mocked_run = mocker.patch('aria_plugin.daemon.run_operation')
+
+    assert prewarm.main(['--tenant', 'tenant', '--blueprint', 'blueprint',
+                         '--plugins', 'plugin1,plugin2']) == 0
+
+    operation_name, local_ctx = mocked_run.call_args[0]
+    assert operation_name == 'prewarm_blueprint'
+    assert local_ctx.blueprint.id == 'blueprint'
+    assert local_ctx.node.properties[constants.PLUGINS_PROPERTY] == \
+        ['plugin1', 'plugin2']
+    assert not local_ctx.node.properties[
+        constants.PARSE_CACHE_PROPERTY]['enabled']
+
+    mocked_run.side_effect = RuntimeError('failed')
+    assert prewarm.main(['--tenant', 'tenant', '--blueprint', 'blueprint']) \
+        == 1
+
+
+def test_main_fills_parse_cache(tmpdir):
+    root_dir = tmpdir.mkdir('root').strpath
+    with loadtest._rooted(root_dir):
+        blueprint_dir = os.path.join(
+            environment.Environment.BLUEPRINTS_DIR, 'tenant', 'blueprint')
+        os.makedirs(blueprint_dir)
+        loadtest.write_csar(blueprint_dir)
+        parse_cache_dir = os.path.join(
+            environment.Environment.CLOUDIFY_PLUGINS_DIR,
+            constants.ARIA_PARSE_CACHE_DIR)
+
+        assert prewarm.main(['--tenant', 'tenant', '--blueprint',
+                             'blueprint', '--parse-cache']) == 0
+
+        assert os.listdir(parse_cache_dir)
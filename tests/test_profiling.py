@@ -0,0 +1,66 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import pstats
+
+from aria_plugin import profiling
+
+
+def _busy():
+    return sum(range(1000))
+
+
+class TestProfiler(object):
+
+    def test_session(self, tmpdir):
+        profiler = profiling.Profiler(tmpdir.strpath)
+
+        with profiler.session('install') as run_dir:
+            profiler.wrap(_busy)()
+            assert profiler.worker_env == {
+                profiling.WORKER_PROFILE_DIR_ENV: run_dir}
+
+        assert os.path.basename(run_dir).endswith('-install')
+        assert sorted(os.listdir(run_dir)) == ['engine.pstats',
+                                               'operation.pstats']
+        pstats.Stats(os.path.join(run_dir, 'engine.pstats'))
+
+    def test_retention(self, tmpdir):
+        profiler = profiling.Profiler(tmpdir.strpath, retain=2)
+
+        for i in range(3):
+            with profiler.session('install'):
+                pass
+
+        assert len(os.listdir(tmpdir.strpath)) == 2
+
+    def test_removed_run_dir(self, tmpdir):
+        profiler = profiling.Profiler(tmpdir.join('profiles').strpath)
+
+        with profiler.session('delete'):
+            tmpdir.join('profiles').remove()
+
+
+def test_profiled_without_profiler():
+    with profiling.profiled(None, 'install'):
+        pass
+
+
+def test_profiled_with_profiler(mocker):
+    profiler = mocker.MagicMock()
+    with profiling.profiled(profiler, 'install'):
+        pass
+    profiler.session.assert_called_once_with('install')
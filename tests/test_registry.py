@@ -0,0 +1,89 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+
+import pytest
+
+from aria_plugin import registry
+
+
+@pytest.fixture
+def bootstrap(mocker):
+    return mocker.MagicMock(return_value={})
+
+
+@pytest.fixture
+def deployments(tmpdir, bootstrap):
+    return registry.Registry(tmpdir.join('registry.json').strpath, bootstrap)
+
+
+def test_put(tmpdir, deployments, bootstrap):
+    deployments.put('dep1', status=registry.STATUS_CREATING)
+    deployments.put('dep1', status=registry.STATUS_CREATED, service_id=1)
+    deployments.put('dep2', status=registry.STATUS_CREATING)
+
+    assert deployments.get('dep1') == {'status': registry.STATUS_CREATED,
+                                       'service_id': 1}
+    assert deployments.get('missing') is None
+    assert sorted(json.loads(tmpdir.join('registry.json').read())) == \
+        ['dep1', 'dep2']
+    bootstrap.assert_called_once_with()
+
+
+def test_remove(deployments):
+    deployments.put('dep1', status=registry.STATUS_CREATED)
+    deployments.put('dep2', status=registry.STATUS_CREATED)
+
+    assert deployments.remove('dep1') == 1
+    assert deployments.remove('dep1') == 1
+    assert deployments.deployments().keys() == ['dep2']
+
+
+def test_bootstrap(tmpdir, deployments, bootstrap):
+    bootstrap.return_value = {'dep1': {'status': registry.STATUS_CREATED}}
+
+    assert deployments.get('dep1') == {'status': registry.STATUS_CREATED}
+    assert tmpdir.join('registry.json').check()
+
+    # e.g. a torn write of an older version
+    tmpdir.join('registry.json').write('{"dep')
+    assert deployments.get('dep1') == {'status': registry.STATUS_CREATED}
+
+    deployments.reset()
+    assert not tmpdir.join('registry.json').check()
+    deployments.get('dep1')
+    assert bootstrap.call_count == 3
+
+
+def test_entries_from_model_storage(mocker):
+    def service_template(id, name, services):
+        template = mocker.MagicMock(id=id)
+        template.name = name
+        template.services = dict((service_id, mocker.MagicMock(id=service_id))
+                                 for service_id in services)
+        return template
+    model_storage = mocker.MagicMock()
+    model_storage.service_template.list.return_value = [
+        service_template(1, 'tenant-dep1', [10]),
+        service_template(2, 'tenant-dep1~update', [11]),
+        service_template(3, 'tenant-dep2', []),
+        service_template(4, 'other-dep3', [12])]
+
+    assert registry.entries_from_model_storage(model_storage, 'tenant') == {
+        'dep1': dict(service_template_id=1, service_id=10, csar_digest=None,
+                     status=registry.STATUS_CREATED),
+        'dep2': dict(service_template_id=3, service_id=None, csar_digest=None,
+                     status=registry.STATUS_CREATING)}
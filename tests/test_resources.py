@@ -0,0 +1,214 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+
+import pytest
+
+from aria_plugin import resources, utils
+
+
+@pytest.fixture
+def source(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('service.yaml').write('tosca')
+    scripts = source.mkdir('scripts')
+    scripts.join('script.sh').write('ls')
+    scripts.join('script.sh').chmod(0o755)
+    return source
+
+
+@pytest.fixture
+def api(tmpdir):
+    api = resources.ResourceAPI(directory=tmpdir.join('resources').strpath,
+                                blobs_dir=tmpdir.join('blobs').strpath,
+                                name='service_template')
+    api.create()
+    return api
+
+
+def _blobs(tmpdir):
+    return sorted(os.listdir(tmpdir.join('blobs').strpath))
+
+
+def test_upload_after_removal(tmpdir, source):
+    directory = tmpdir.join('resources').strpath
+    api = resources.ResourceAPI(directory=directory,
+                                name='service_template')
+    api.create()
+
+    api.upload('1', source.strpath)
+    # e.g. the working dir was removed with the last service of the tenant
+    utils.silent_remove(directory)
+    api.create()
+    api.upload('1', source.strpath)
+
+    assert tmpdir.join('resources', 'service_template', '1', 'scripts',
+                       'script.sh').read() == 'ls'
+
+
+def test_upload_links_identical_files(tmpdir, api, source):
+    api.upload('1', source.strpath)
+    api.upload('2', source.strpath)
+
+    first = tmpdir.join('resources', 'service_template', '1', 'scripts',
+                        'script.sh')
+    second = tmpdir.join('resources', 'service_template', '2', 'scripts',
+                         'script.sh')
+    assert first.read() == second.read() == 'ls'
+    assert os.path.samefile(first.strpath, second.strpath)
+    assert os.stat(first.strpath).st_nlink == 3
+    assert os.access(second.strpath, os.X_OK)
+    assert len(_blobs(tmpdir)) == 2
+
+
+def test_upload_file(tmpdir, api, source):
+    api.upload('1', source.join('service.yaml').strpath, path='main.yaml')
+    api.upload('1', source.join('service.yaml').strpath)
+
+    entry_dir = tmpdir.join('resources', 'service_template', '1')
+    assert entry_dir.join('main.yaml').read() == 'tosca'
+    assert entry_dir.join('service.yaml').read() == 'tosca'
+    assert len(_blobs(tmpdir)) == 1
+
+
+def test_upload_replaces_linked_files(tmpdir, api, source):
+    api.upload('1', source.strpath)
+    api.upload('2', source.strpath)
+    source.join('scripts', 'script.sh').write('pwd')
+
+    api.upload('2', source.strpath)
+
+    assert tmpdir.join('resources', 'service_template', '1', 'scripts',
+                       'script.sh').read() == 'ls'
+    assert tmpdir.join('resources', 'service_template', '2', 'scripts',
+                       'script.sh').read() == 'pwd'
+
+
+def test_delete_collects_garbage(tmpdir, api, source):
+    api.upload('1', source.strpath)
+    api.upload('2', source.strpath)
+
+    api.delete('1')
+    assert len(_blobs(tmpdir)) == 2
+
+    api.delete('2')
+    assert _blobs(tmpdir) == []
+
+
+def test_upload_after_collection(tmpdir, api, source):
+    api.upload('1', source.strpath)
+    api.delete('1')
+
+    api.upload('1', source.strpath)
+
+    assert tmpdir.join('resources', 'service_template', '1',
+                       'service.yaml').read() == 'tosca'
+    assert len(_blobs(tmpdir)) == 2
+
+
+def test_collect_garbage(tmpdir):
+    blobs = tmpdir.mkdir('blobs')
+    blobs.join('unlinked').write('')
+    blobs.join('linked').write('')
+    os.link(blobs.join('linked').strpath, tmpdir.join('resource').strpath)
+    blobs.join('.staging').write('')
+
+    assert resources.collect_garbage(blobs.strpath) == 1
+    assert _blobs(tmpdir) == ['.staging', 'linked']
+    assert resources.collect_garbage(tmpdir.join('missing').strpath) == 0
+
+
+@pytest.mark.parametrize('blobs', [True, False])
+def test_archive(tmpdir, source, blobs):
+    api = resources.ResourceAPI(
+        directory=tmpdir.join('resources').strpath,
+        blobs_dir=tmpdir.join('blobs').strpath if blobs else None,
+        name='service_template')
+    api.create()
+    source.join('large.bin').write('x' * 100000)
+    api.upload('1', source.strpath)
+    entry_dir = tmpdir.join('resources', 'service_template', '1')
+
+    assert api.archive('1') > 90000
+    assert not entry_dir.check()
+    assert tmpdir.join('resources', 'service_template', '1.tar.gz').check()
+    if blobs:
+        assert _blobs(tmpdir) == []
+    # Nothing left to archive
+    assert api.archive('1') == 0
+
+    # Rehydrated once read
+    assert api.read('1', 'scripts/script.sh') == 'ls'
+    assert os.access(entry_dir.join('scripts', 'script.sh').strpath, os.X_OK)
+    assert not tmpdir.join('resources', 'service_template',
+                           '1.tar.gz').check()
+    assert not api.rehydrate('1')
+    if blobs:
+        assert len(_blobs(tmpdir)) == 3
+
+
+def test_archive_shared_files(tmpdir, api, source):
+    source.join('large.bin').write('x' * 100000)
+    for entry_id in ('1', '2', '3'):
+        api.upload(entry_id, source.strpath)
+
+    # Not worth it, as the files are still linked by the other entries
+    assert api.archive('1') == 0
+    assert api.archive('2') == 0
+    assert tmpdir.join('resources', 'service_template', '1').check(dir=1)
+    assert not tmpdir.join('resources', 'service_template',
+                           '1.tar.gz').check()
+    assert len(_blobs(tmpdir)) == 3
+
+    # Unique files are worth it, the shared ones are not counted
+    source.join('large.bin').write('y' * 100000)
+    api.upload('3', source.strpath)
+    reclaimed = api.archive('3')
+    assert 90000 < reclaimed < 100000
+    assert len(_blobs(tmpdir)) == 3
+
+    api.download('3', tmpdir.join('download').strpath)
+    assert tmpdir.join('download', 'service.yaml').read() == 'tosca'
+    assert tmpdir.join('download', 'large.bin').read() == 'y' * 100000
+
+
+def test_delete_archived(tmpdir, api, source):
+    source.join('large.bin').write('x' * 100000)
+    api.upload('1', source.strpath)
+    assert api.archive('1') > 0
+
+    assert api.delete('1')
+    assert os.listdir(tmpdir.join('resources', 'service_template').strpath) \
+        == []
+    assert not api.delete('1')
+
+
+def test_service_archive(mocker):
+    resource_storage = mocker.MagicMock()
+    resource_storage.service_template.archive.return_value = 100
+    resource_storage.service.archive.return_value = 10
+    resource_storage.service_template.rehydrate.return_value = True
+    resource_storage.service.rehydrate.return_value = False
+    service = mocker.MagicMock(id=2)
+    service.service_template.id = 1
+
+    assert resources.archive_service(resource_storage, 1, 2) == 110
+    resource_storage.service_template.archive.assert_called_once_with('1')
+    resource_storage.service.archive.assert_called_once_with('2')
+
+    assert resources.rehydrate_service(resource_storage, service)
+    resource_storage.service_template.rehydrate.assert_called_once_with('1')
+    resource_storage.service.rehydrate.assert_called_once_with('2')
@@ -0,0 +1,146 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import pytest
+from cloudify.state import current_ctx
+
+from aria_plugin import teardown, workflows
+
+SERVICE_TEMPLATE_NAMES = ['tenant-dep1', 'tenant-dep2', 'tenant-dep3']
+
+
+@pytest.fixture
+def service_templates(mocker):
+    service_templates = []
+    for name in SERVICE_TEMPLATE_NAMES:
+        service_template = mocker.MagicMock()
+        service_template.name = name
+        service_templates.append(service_template)
+    return service_templates
+
+
+@pytest.fixture
+def mocked_env(mocker, service_templates):
+    mocked_env = mocker.MagicMock()
+
+    def list_service_templates(filters=None):
+        return [service_template for service_template in service_templates
+                if not filters or service_template.name == filters['name']]
+    mocked_env.model_storage.service_template.list.side_effect = \
+        list_service_templates
+
+    def list_services(filters):
+        service = mocker.MagicMock()
+        service.name = filters['service_template_name'] + '_1'
+        return [service]
+    mocked_env.model_storage.service.list.side_effect = list_services
+    return mocked_env
+
+
+@pytest.fixture
+def mocked_execute(mocker):
+    mocked_execute = mocker.patch('aria_plugin.teardown.executor.execute')
+    with current_ctx.push(mocker.MagicMock()):
+        yield mocked_execute
+
+
+def _uninstalled(mocked_execute):
+    return sorted(call[1]['service'].name
+                  for call in mocked_execute.call_args_list)
+
+
+def test_teardown(mocked_env, mocked_execute):
+    report = teardown.teardown(mocked_env, parallelism=2)
+
+    assert report == dict((name, None) for name in SERVICE_TEMPLATE_NAMES)
+    assert _uninstalled(mocked_execute) == \
+        [name + '_1' for name in SERVICE_TEMPLATE_NAMES]
+    mocked_env.rm_working_dir.assert_called_once()
+    mocked_env.core.delete_service.assert_not_called()
+    mocked_env.core.delete_service_template.assert_not_called()
+
+
+def test_teardown_failure(mocker, mocked_env, mocked_execute):
+    def execute(env, workflow_name, service):
+        if service.name == 'tenant-dep2_1':
+            raise RuntimeError('failed')
+    mocked_execute.side_effect = execute
+    service_template = mocker.MagicMock()
+    service_template.services = {'service': mocker.MagicMock(id=1)}
+    mocked_env.model_storage.service_template.get_by_name.return_value = \
+        service_template
+
+    report = teardown.teardown(mocked_env)
+
+    assert report == {'tenant-dep1': None,
+                      'tenant-dep2': 'RuntimeError: failed',
+                      'tenant-dep3': None}
+    mocked_env.rm_working_dir.assert_not_called()
+    mocked_env.registry.reset.assert_called_once()
+    assert mocked_env.model_storage.service_template.get_by_name \
+        .call_args_list == [mocker.call('tenant-dep1'),
+                            mocker.call('tenant-dep3')]
+    # The threads of the teardown may miss updates of call_count
+    assert len(mocked_env.core.delete_service.call_args_list) == 2
+    assert len(mocked_env.core.delete_service_template.call_args_list) == 2
+
+
+def test_teardown_staging_leftovers(mocker, mocked_env, mocked_execute,
+                                    service_templates):
+    # A failed update of tenant-dep1 left a staging service, which installed
+    # its added node c_1
+    staging_template = mocker.MagicMock()
+    staging_template.name = 'tenant-dep1~update'
+    staging_service = mocker.MagicMock()
+    staging_template.services = {'staging': staging_service}
+    service_templates.append(staging_template)
+    mocked_installed_changes = mocker.patch(
+        'aria_plugin.teardown.diffing.installed_changes',
+        return_value=['c_1'])
+
+    report = teardown.teardown(mocked_env)
+
+    assert sorted(report) == SERVICE_TEMPLATE_NAMES
+    # Not uninstalled as a service, as its unchanged nodes hold the states
+    # of those of the service
+    assert len(mocked_env.model_storage.service.list.call_args_list) == 3
+    mocked_installed_changes.assert_called_once()
+    assert mocked_installed_changes.call_args[0][1] is staging_service
+    mocked_execute.assert_any_call(
+        mocked_env, workflows.UNINSTALL_NODES,
+        inputs={'node_names': ['c_1']}, service=staging_service)
+    assert len(mocked_execute.call_args_list) == 4
+
+
+def test_teardown_empty_tenant(mocked_env, mocked_execute):
+    mocked_env.model_storage.service_template.list.side_effect = None
+    mocked_env.model_storage.service_template.list.return_value = []
+
+    assert teardown.teardown(mocked_env) == {}
+    mocked_env.rm_working_dir.assert_called_once()
+
+
+def test_main(mocker):
+    mocked_run = mocker.patch('aria_plugin.teardown.daemon.run_operation')
+
+    assert teardown.main(['--tenant', 'tenant', '--parallelism', '8']) == 0
+
+    local_ctx = mocked_run.call_args[0][1]
+    assert local_ctx.tenant_name == 'tenant'
+    mocked_run.assert_called_once_with('teardown_tenant', local_ctx,
+                                       {'parallelism': 8})
+
+    mocked_run.side_effect = RuntimeError('failed')
+    assert teardown.main(['--tenant', 'tenant']) == 1
@@ -0,0 +1,121 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+
+import pytest
+
+from aria_plugin import tracing
+
+
+def _task(mocker, task_id, node_name=None, dependencies=()):
+    task = mocker.MagicMock(id=task_id, interface_name=None,
+                            operation_name=None, relationship=None,
+                            dependencies=list(dependencies))
+    if node_name:
+        task.node.name = node_name
+        task.interface_name = 'Standard'
+        task.operation_name = 'create'
+    else:
+        task.node = None
+    return task
+
+
+def _attempt(queued, started, ended, pid=100, succeeded=True):
+    return dict(queued=queued, started=started, ended=ended, pid=pid,
+                succeeded=succeeded)
+
+
+@pytest.fixture
+def trace(mocker):
+    # node_a and node_b run in parallel, node_c waits for both through a stub
+    # task, and node_b was retried once
+    trace = tracing.TaskTrace()
+    trace._attempts = {
+        1: [_attempt(0.0, 0.5, 2.0)],
+        2: [_attempt(0.0, 0.5, 1.0, succeeded=False),
+            _attempt(4.0, 4.0, 5.0, pid=101)],
+        4: [_attempt(5.0, 6.0, 7.0, pid=102)]}
+    return trace
+
+
+@pytest.fixture
+def tasks(mocker):
+    node_a = _task(mocker, 1, 'node_a')
+    node_b = _task(mocker, 2, 'node_b')
+    stub = _task(mocker, 3, dependencies=[node_a, node_b])
+    node_c = _task(mocker, 4, 'node_c', dependencies=[stub])
+    end = _task(mocker, 5, dependencies=[node_c])
+    return [node_a, node_b, stub, node_c, end]
+
+
+def test_task_trace(mocker):
+    mocker.patch('time.time', return_value=1.0)
+    trace = tracing.TaskTrace()
+
+    trace.queued(1)
+    trace.started(1, pid=100)
+    trace.ended(1, succeeded=False)
+    trace.queued(1)
+    # Ignored, as the task was never queued
+    trace.ended(2, succeeded=True)
+
+    assert trace.attempts(1) == [
+        _attempt(1.0, 1.0, 1.0, succeeded=False),
+        _attempt(1.0, None, None, pid=None, succeeded=None)]
+    assert trace.attempts(2) == []
+
+
+def test_critical_path(trace, tasks):
+    path_steps = tracing.critical_path(trace, tasks)
+
+    assert path_steps == [
+        tracing.CriticalStep(task_id=2, name='node_b.Standard.create',
+                             attempts=2, waited=0.0, duration=4.5),
+        tracing.CriticalStep(task_id=4, name='node_c.Standard.create',
+                             attempts=1, waited=1.0, duration=1.0)]
+
+
+def test_critical_path_without_tasks(mocker):
+    assert tracing.critical_path(tracing.TaskTrace(),
+                                 [_task(mocker, 1)]) == []
+
+
+def test_write(tmpdir, trace, tasks):
+    tracer = tracing.Tracer(tmpdir.join('traces').strpath, retain=1)
+
+    trace_path, path_steps = tracer.write(trace, 'install', tasks)
+    document = json.loads(open(trace_path).read())
+
+    assert trace_path.endswith('-install.json')
+    assert [step['task_id'] for step in document['criticalPath']] == [2, 4]
+    task_events = [event for event in document['traceEvents']
+                   if event['ph'] == 'X' and
+                   event['cat'] != tracing.QUEUE_CATEGORY]
+    assert [(event['args']['task_id'], event['cat'], event['ts'],
+             event['dur']) for event in task_events] == [
+        (1, 'task', 500000, 1500000),
+        (2, 'task,critical', 500000, 500000),
+        (2, 'task,critical', 4000000, 1000000),
+        (4, 'task,critical', 6000000, 1000000)]
+    assert task_events[2]['args']['attempt'] == 2
+    assert task_events[2]['args']['worker_pid'] == 101
+    assert set(event['tid'] for event in document['traceEvents']
+               if event['ph'] == 'M') == set([100, 101, 102])
+
+    # Only the most recent trace is kept
+    other_trace_path, _ = tracer.write(trace, 'uninstall', tasks)
+    assert [path.strpath for path in tmpdir.join('traces').listdir()] == \
+        [other_trace_path]
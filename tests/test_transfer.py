@@ -0,0 +1,261 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import io
+import json
+import os
+import sqlite3
+import tarfile
+from contextlib import closing
+
+import pytest
+
+from aria_plugin import constants, environment, exceptions, transfer, utils
+from aria_plugin.context import LocalContext
+
+
+@pytest.fixture
+def plugins_dir(mocker, tmpdir):
+    plugins_dir = tmpdir.mkdir('plugins')
+    mocker.patch.object(environment.Environment, 'CLOUDIFY_PLUGINS_DIR',
+                        plugins_dir.strpath)
+    return plugins_dir
+
+
+def _env(tenant_name, properties=None):
+    return environment.Environment(
+        LocalContext(tenant_name, None, None, properties=properties or {}))
+
+
+def _populate(env):
+    with closing(sqlite3.connect(env.model_storage_path)) as connection, \
+            connection:
+        connection.execute('CREATE TABLE service (name VARCHAR)')
+        connection.execute("INSERT INTO service VALUES ('service')")
+    script_dir = os.path.join(env.resource_storage_dir, 'service', '1')
+    os.makedirs(script_dir)
+    with open(os.path.join(script_dir, 'script.sh'), 'w') as f:
+        f.write('ls')
+    os.chmod(os.path.join(script_dir, 'script.sh'), 0o755)
+    plugin_dir = os.path.join(env.aria_plugins_dir, 'plugin-1.0')
+    os.makedirs(plugin_dir)
+    with open(os.path.join(plugin_dir, 'module.py'), 'w') as f:
+        f.write('pass')
+
+
+def _install_stored_plugin(env, tmpdir):
+    # As the shared plugin manager installs it
+    wagon = tmpdir.join('plugin.wgn')
+    wagon.write('wagon')
+
+    def install(install_dir):
+        with open(os.path.join(install_dir, 'module.py'), 'w') as f:
+            f.write('pass')
+    installed_dir = env.plugin_store.acquire(wagon.strpath, install,
+                                             env.workdir)
+    utils.silent_create(env.aria_plugins_dir)
+    os.symlink(installed_dir,
+               os.path.join(env.aria_plugins_dir, 'plugin-1.0'))
+    return installed_dir
+
+
+def _export(env):
+    stream = io.BytesIO()
+    transfer.export_tenant(env, stream)
+    stream.seek(0)
+    return stream
+
+
+def test_export_import(plugins_dir):
+    source_env = _env('source')
+    _populate(source_env)
+    stream = _export(source_env)
+    # As if the tenant is imported on another manager
+    source_env.rm_working_dir()
+
+    stats = transfer.import_tenant(_env('target'), stream)
+
+    assert stats == dict(files=3, stored_plugins=0)
+    workdir = plugins_dir.join('aria-target')
+    with closing(sqlite3.connect(
+            workdir.join('models', 'db.sqlite').strpath)) as connection:
+        assert connection.execute('SELECT name FROM service').fetchall() == \
+            [('service',)]
+    script = workdir.join('resources', 'service', '1', 'script.sh')
+    assert script.read() == 'ls'
+    assert os.access(script.strpath, os.X_OK)
+    assert workdir.join('plugins', 'plugin-1.0', 'module.py').read() == \
+        'pass'
+    # No leftovers of the import
+    assert not [name for name in os.listdir(plugins_dir.strpath)
+                if 'import' in name]
+
+
+def test_export_import_shared_resources(plugins_dir, tmpdir):
+    source_env = _env('source')
+    source = tmpdir.mkdir('source')
+    source.join('script.sh').write('ls')
+    # Both entries are linked to the same blob
+    for entry_id in ('1', '2'):
+        source_env.resource_storage.service.upload(entry_id, source.strpath)
+    stream = _export(source_env)
+    source_env.rm_working_dir()
+
+    stats = transfer.import_tenant(_env('target'), stream)
+
+    assert stats == dict(files=2, stored_plugins=0)
+    for entry_id in ('1', '2'):
+        assert plugins_dir.join('aria-target', 'resources', 'service',
+                                entry_id, 'script.sh').read() == 'ls'
+
+
+def test_import_stored_plugins(plugins_dir, tmpdir):
+    source_env = _env('source')
+    installed_dir = _install_stored_plugin(source_env, tmpdir)
+    stream = _export(source_env)
+    target_env = _env('target')
+
+    stats = transfer.import_tenant(target_env, stream)
+
+    assert stats == dict(files=1, stored_plugins=1)
+    imported_plugin_dir = plugins_dir.join('aria-target', 'plugins',
+                                           'plugin-1.0')
+    assert os.path.realpath(imported_plugin_dir.strpath) == installed_dir
+    # Referenced by the imported tenant as well
+    source_env.rm_working_dir()
+    assert imported_plugin_dir.join('module.py').read() == 'pass'
+    # Not installed again
+    assert [name for name in os.listdir(target_env.plugin_store.directory)
+            if os.path.isdir(os.path.join(target_env.plugin_store.directory,
+                                          name))] == \
+        [os.path.basename(installed_dir)]
+    _env('target').rm_working_dir()
+    assert not os.path.exists(installed_dir)
+
+
+def test_import_stored_plugins_into_other_store(plugins_dir, tmpdir):
+    source_env = _env('source')
+    installed_dir = _install_stored_plugin(source_env, tmpdir)
+    stream = _export(source_env)
+    # As if the tenant is imported on another manager
+    source_env.rm_working_dir()
+    assert not os.path.exists(installed_dir)
+
+    stats = transfer.import_tenant(_env('target'), stream)
+
+    assert stats == dict(files=1, stored_plugins=1)
+    imported_plugin_dir = plugins_dir.join('aria-target', 'plugins',
+                                           'plugin-1.0')
+    assert os.path.realpath(imported_plugin_dir.strpath) == installed_dir
+    assert imported_plugin_dir.join('module.py').read() == 'pass'
+
+
+def test_import_stored_plugins_without_store(plugins_dir, tmpdir):
+    source_env = _env('source')
+    _install_stored_plugin(source_env, tmpdir)
+    stream = _export(source_env)
+    target_env = _env('target', {
+        constants.PLUGIN_STORE_PROPERTY: {'enabled': False}})
+
+    stats = transfer.import_tenant(target_env, stream)
+
+    assert stats == dict(files=1, stored_plugins=0)
+    imported_plugin_dir = plugins_dir.join('aria-target', 'plugins',
+                                           'plugin-1.0')
+    assert not imported_plugin_dir.islink()
+    assert imported_plugin_dir.join('module.py').read() == 'pass'
+
+
+def test_import_invalid_stored_plugin(plugins_dir, tmpdir):
+    source_env = _env('source')
+    _install_stored_plugin(source_env, tmpdir)
+
+    def tamper(name, content):
+        if name == transfer.MANIFEST_NAME:
+            manifest = json.loads(content)
+            manifest['plugins'] = {'../aria-other': 'digest'}
+            content = json.dumps(manifest)
+        return content
+
+    with pytest.raises(exceptions.InvalidTenantArchiveException):
+        transfer.import_tenant(_env('target'),
+                               _tampered(_export(source_env), tamper))
+
+
+def test_import_digest_mismatch(plugins_dir):
+    source_env = _env('source')
+    _populate(source_env)
+    stream = _export(source_env)
+    # The state of a tenant without services is kept on failures
+    target_env = _env('target')
+    _populate(target_env)
+    os.remove(target_env.model_storage_path)
+
+    with pytest.raises(exceptions.InvalidTenantArchiveException):
+        transfer.import_tenant(target_env, _tampered(stream, _tamper_script))
+
+    assert plugins_dir.join('aria-target', 'resources', 'service', '1',
+                            'script.sh').read() == 'ls'
+    assert not [name for name in os.listdir(plugins_dir.strpath)
+                if 'import' in name]
+
+
+def _tamper_script(name, content):
+    return 'rm' if name.endswith('script.sh') else content
+
+
+def _tampered(stream, tamper):
+    tampered = io.BytesIO()
+    with closing(tarfile.open(fileobj=stream, mode='r|gz')) as source, \
+            closing(tarfile.open(fileobj=tampered, mode='w|gz')) as target:
+        for member in source:
+            content = tamper(member.name,
+                             source.extractfile(member).read())
+            member.size = len(content)
+            target.addfile(member, io.BytesIO(content))
+    tampered.seek(0)
+    return tampered
+
+
+def test_import_corrupt_archive(plugins_dir):
+    with pytest.raises(exceptions.InvalidTenantArchiveException):
+        transfer.import_tenant(_env('target'), io.BytesIO('not an archive'))
+
+
+def test_import_into_tenant_with_services(mocker, plugins_dir):
+    source_env = _env('source')
+    _populate(source_env)
+    source_env._model_storage = mocker.MagicMock()
+    source_env.model_storage.service_template.list.return_value = ['st']
+
+    with pytest.raises(exceptions.TenantNotEmptyException):
+        transfer.import_tenant(source_env, _export(source_env))
+
+
+def test_main(plugins_dir, tmpdir):
+    _populate(_env('source'))
+    archive_path = tmpdir.join('source.tar.gz').strpath
+
+    assert transfer.main(['export', '--tenant', 'source',
+                          '--file', archive_path]) == 0
+    assert transfer.main(['import', '--tenant', 'target',
+                          '--file', archive_path]) == 0
+    assert plugins_dir.join('aria-target', 'plugins', 'plugin-1.0',
+                            'module.py').read() == 'pass'
+
+    with open(archive_path, 'wb') as f:
+        f.write('not an archive')
+    assert transfer.main(['import', '--tenant', 'other',
+                          '--file', archive_path]) == 1
@@ -14,12 +14,14 @@
 #    * limitations under the License.
 
 import os
+import time
 
 import pytest
 from aria.orchestrator import exceptions as aria_exceptions
 from aria.cli import csar
 
-from aria_plugin import utils, exceptions
+from aria_plugin import constants, utils, exceptions
+from aria_plugin.validation import CSARIndex
 
 
 class TestInstallPlugins(object):
@@ -108,6 +110,54 @@ def test_extract_csar(mocker):
                                  destination=mocker.ANY)
 
 
+def test_cache_csar(mocker, tmpdir):
+    def read(source, destination, logger):
+        with open(os.path.join(destination, 'service.yaml'), 'w') as f:
+            f.write(source)
+    mocker.patch('aria.cli.csar.read', side_effect=read)
+    cache_dir = tmpdir.join('csar-cache').strpath
+    index = CSARIndex(digest='digest', entry_definitions='service.yaml',
+                      plugins=None)
+
+    assert utils.cached_csar(cache_dir, index) is None
+    assert utils.cached_csar(cache_dir, None) is None
+    extracted_csar = utils.cache_csar('tosca', cache_dir, index, 'logger')
+    assert utils.cache_csar('tosca', cache_dir, index, 'logger') == \
+        extracted_csar
+
+    csar.read.assert_called_once()
+    assert extracted_csar == utils.cached_csar(cache_dir, index)
+    assert extracted_csar.entry_definitions == 'service.yaml'
+    assert os.listdir(os.path.dirname(extracted_csar.destination)) == \
+        ['digest']
+    with open(os.path.join(extracted_csar.destination, 'service.yaml')) as f:
+        assert f.read() == 'tosca'
+
+
+def test_cache_csar_prunes(mocker, tmpdir):
+    mocker.patch('aria.cli.csar.read')
+    cache_dir = tmpdir.join('csar-cache').strpath
+    for digest in ('digest1', 'digest2', 'digest3'):
+        utils.cache_csar('source', cache_dir,
+                         CSARIndex(digest=digest, entry_definitions=None,
+                                   plugins=None),
+                         'logger', keep=2)
+        time.sleep(0.01)
+
+    assert sorted(os.listdir(os.path.join(cache_dir, 'extracted'))) == \
+        ['digest2', 'digest3']
+
+
+def test_install_aria_extensions(mocker):
+    mocker.patch('aria_plugin.utils._aria_extensions_installed', [])
+    mocked_install = mocker.patch('aria.install_aria_extensions')
+
+    utils.install_aria_extensions()
+    utils.install_aria_extensions()
+
+    mocked_install.assert_called_once_with(strict=False)
+
+
 def test_generate_resource_path():
     local_resource = os.path.join('dir', 'some_path')
     assert local_resource == utils.generate_resource_path('some_path', 'dir')
@@ -116,6 +166,49 @@ def test_generate_resource_path():
     assert utils.generate_resource_path(url_resource, 'dir') == url_resource
 
 
+def test_load_inputs(tmpdir):
+    csar_dir = tmpdir.mkdir('csar')
+    blueprint_dir = tmpdir.mkdir('blueprint')
+    blueprint_dir.join('inputs.yaml').write('key1: blueprint\nkey2: 2\n')
+    properties = {constants.INPUTS_FILE_PROPERTY: 'inputs.yaml',
+                  constants.INPUTS_PROPERTY: {'key2': 'inline'}}
+
+    assert utils.load_inputs(properties, csar_dir.strpath,
+                             blueprint_dir.strpath) == {
+        'key1': 'blueprint', 'key2': 'inline'}
+
+    # The inputs file of the CSAR comes first
+    csar_dir.join('inputs.yaml').write('{"key1": "csar"}')
+    assert utils.load_inputs(properties, csar_dir.strpath,
+                             blueprint_dir.strpath)['key1'] == 'csar'
+
+    assert utils.load_inputs({constants.INPUTS_PROPERTY: {'key': 'value'}},
+                             csar_dir.strpath, blueprint_dir.strpath) == {
+        'key': 'value'}
+
+
+@pytest.mark.parametrize('content', [None, '- not\n- a mapping\n',
+                                     'key: [unclosed\n'])
+def test_load_invalid_inputs(tmpdir, content):
+    if content is not None:
+        tmpdir.join('inputs.yaml').write(content)
+
+    with pytest.raises(exceptions.InvalidInputsException):
+        utils.load_inputs({constants.INPUTS_FILE_PROPERTY: 'inputs.yaml'},
+                          tmpdir.strpath, tmpdir.strpath)
+
+
+def test_describe_inputs():
+    description = utils.describe_inputs({'key1': 'secret', 'key2': [1, 2]})
+
+    assert description.startswith('2 inputs (sha256 ')
+    assert 'secret' not in description
+    assert description == utils.describe_inputs({'key2': [1, 2],
+                                                 'key1': 'secret'})
+    assert description != utils.describe_inputs({'key1': 'other',
+                                                 'key2': [1, 2]})
+
+
 def test_cleanup_files(tmpdir):
 
     def _touch_files(files):
@@ -188,3 +281,31 @@ def test_silent_create(tmpdir):
     created_path = utils.silent_create(file_path)
     assert file_path == created_path
     assert os.path.exists(file_path)
+
+
+def test_prune_entries(tmpdir):
+    for i, name in enumerate(('oldest', 'older', 'newest')):
+        entry = tmpdir.join(name)
+        entry.write('content')
+        entry.setmtime(1000 + i)
+
+    utils.prune_entries(tmpdir.strpath, 2)
+    assert sorted(os.listdir(tmpdir.strpath)) == ['newest', 'older']
+
+    utils.prune_entries(tmpdir.join('non_existing_dir').strpath, 2)
+
+
+def test_atomic_write(tmpdir):
+    path = tmpdir.join('file')
+    path.write('old content')
+
+    utils.atomic_write(path.strpath, 'new content')
+
+    assert path.read() == 'new content'
+    assert tmpdir.listdir() == [path]
+
+
+def test_file_lock(tmpdir):
+    lock_path = tmpdir.join('lock').strpath
+    with utils.file_lock(lock_path):
+        assert os.path.exists(lock_path)
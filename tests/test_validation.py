@@ -0,0 +1,131 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import zipfile
+
+import pytest
+from aria.cli import csar
+
+from aria_plugin import exceptions, utils, validation
+
+METADATA = """TOSCA-Meta-File-Version: 1.0
+CSAR-Version: 1.1
+Created-By: ARIA
+Entry-Definitions: service_template.yaml
+"""
+
+
+def _write_csar(path, files):
+    with zipfile.ZipFile(path.strpath, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return path.strpath
+
+
+@pytest.fixture
+def cache_dir(tmpdir):
+    return tmpdir.join('cache').strpath
+
+
+@pytest.fixture
+def valid_csar(tmpdir):
+    return _write_csar(tmpdir.join('valid.csar'), {
+        csar.META_FILE: METADATA,
+        'service_template.yaml': 'tosca_definitions_version: ...',
+        'plugins/plugin1.wgn': 'wagon',
+        'plugins/plugin2.wgn': 'wagon',
+    })
+
+
+def test_valid_csar(valid_csar, cache_dir):
+    index = validation.validate_csar(valid_csar, ['plugin1.wgn'], cache_dir)
+
+    assert index.digest == utils.file_digest(valid_csar)
+    assert index.entry_definitions == 'service_template.yaml'
+    assert index.plugins == ['plugin1.wgn', 'plugin2.wgn']
+    assert os.listdir(cache_dir) == [index.digest + '.json']
+
+
+@pytest.mark.parametrize('entry_definitions', [
+    './service_template.yaml', 'definitions/../service_template.yaml'])
+def test_unnormalized_entry_definitions(tmpdir, cache_dir,
+                                        entry_definitions):
+    csar_path = _write_csar(tmpdir.join('valid.csar'), {
+        csar.META_FILE: METADATA.replace('service_template.yaml',
+                                         entry_definitions),
+        'service_template.yaml': 'tosca_definitions_version: ...',
+    })
+
+    index = validation.validate_csar(csar_path, [], cache_dir)
+
+    assert index.entry_definitions == 'service_template.yaml'
+
+
+def test_cached_findings(mocker, valid_csar, cache_dir):
+    index = validation.validate_csar(valid_csar, [], cache_dir)
+    mocker.spy(validation, '_inspect')
+
+    assert validation.validate_csar(valid_csar, [], cache_dir) == index
+    validation._inspect.assert_not_called()
+
+
+def test_url_csar(cache_dir):
+    assert validation.validate_csar('http://csar', [], cache_dir) is None
+
+
+def test_missing_csar(tmpdir, cache_dir):
+    with pytest.raises(exceptions.InvalidCSARException):
+        validation.validate_csar(tmpdir.join('missing').strpath, [],
+                                 cache_dir)
+
+
+@pytest.mark.parametrize('files, error', [
+    ({'service_template.yaml': ''}, 'metadata file'),
+    ({csar.META_FILE: '[]'}, 'not a mapping'),
+    ({csar.META_FILE: METADATA.replace('1.1', '1.0')}, 'CSAR-Version'),
+    ({csar.META_FILE: METADATA.replace('Created-By', 'Author')},
+     'Created-By is missing'),
+    ({csar.META_FILE: METADATA}, 'service_template.yaml'),
+])
+def test_invalid_csar(tmpdir, cache_dir, files, error):
+    csar_path = _write_csar(tmpdir.join('invalid.csar'), files)
+
+    for _ in range(2):
+        # The second time, the error is taken from the cache
+        with pytest.raises(exceptions.InvalidCSARException) as e:
+            validation.validate_csar(csar_path, [], cache_dir)
+        assert error in str(e.value)
+
+
+def test_not_a_zip(tmpdir, cache_dir):
+    csar_path = tmpdir.join('not_a_zip.csar')
+    csar_path.write('content')
+
+    with pytest.raises(exceptions.InvalidCSARException):
+        validation.validate_csar(csar_path.strpath, [], cache_dir)
+
+
+def test_missing_plugins(tmpdir, valid_csar, cache_dir):
+    with pytest.raises(exceptions.MissingPluginsException):
+        validation.validate_csar(valid_csar, ['plugin3.wgn'], cache_dir)
+
+    no_plugins_csar = _write_csar(tmpdir.join('no_plugins.csar'), {
+        csar.META_FILE: METADATA,
+        'service_template.yaml': 'tosca_definitions_version: ...',
+    })
+    validation.validate_csar(no_plugins_csar, [], cache_dir)
+    with pytest.raises(exceptions.MissingPluginsException):
+        validation.validate_csar(no_plugins_csar, ['plugin1.wgn'], cache_dir)
@@ -0,0 +1,135 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+
+import pytest
+
+from aria_plugin import concurrency, profiling, tracing, workers
+
+
+@pytest.fixture
+def task(mocker):
+    task = mocker.MagicMock()
+    task.plugin_fk = None
+    return task
+
+
+def test_uninstrumented_workers(task):
+    task_executor = workers.WorkerProcessExecutor()
+    try:
+        env = task_executor._construct_subprocess_env(task)
+    finally:
+        task_executor.close()
+
+    assert task_executor._python_path == []
+    assert profiling.WORKER_PROFILE_DIR_ENV not in env
+
+
+def test_instrumented_workers(task):
+    worker_env = {profiling.WORKER_PROFILE_DIR_ENV: 'profile_dir'}
+    task_executor = workers.WorkerProcessExecutor(worker_env=worker_env)
+    try:
+        env = task_executor._construct_subprocess_env(task)
+    finally:
+        task_executor.close()
+
+    assert task_executor._python_path == [workers.BOOTSTRAP_DIR]
+    assert env[profiling.WORKER_PROFILE_DIR_ENV] == 'profile_dir'
+    assert workers.BOOTSTRAP_DIR in env['PYTHONPATH']
+
+
+def test_bootstrap(mocker):
+    mocker.patch('aria_plugin.profiling.profile_worker')
+    mocker.patch.dict('os.environ', {}, clear=True)
+    workers.bootstrap()
+    profiling.profile_worker.assert_not_called()
+
+    mocker.patch.dict('os.environ',
+                      {profiling.WORKER_PROFILE_DIR_ENV: 'profile_dir'})
+    workers.bootstrap()
+    profiling.profile_worker.assert_called_once_with('profile_dir')
+
+
+@pytest.mark.parametrize('log_level, expected_level', [
+    (None, logging.DEBUG),
+    (logging.WARNING, logging.WARNING),
+])
+def test_workers_log_level(mocker, log_level, expected_level):
+    mocker.patch('aria.orchestrator.workflows.executor.process.ProcessExecutor'
+                 '._create_arguments_dict',
+                 return_value={'context': {'context': {
+                     'logger_level': logging.DEBUG}}})
+    task_executor = workers.WorkerProcessExecutor(log_level=log_level)
+    try:
+        arguments = task_executor._create_arguments_dict('ctx')
+    finally:
+        task_executor.close()
+
+    assert arguments['context']['context']['logger_level'] == expected_level
+
+
+def test_workers_concurrency(mocker):
+    started = []
+    mocker.patch('aria.orchestrator.workflows.executor.process.ProcessExecutor'
+                 '._execute', side_effect=lambda ctx: started.append(ctx))
+    mocker.patch('aria.orchestrator.workflows.executor.process.ProcessExecutor'
+                 '._handle_task_succeeded_request')
+    limit = concurrency.ConcurrencyLimit(
+        minimum=2, maximum=4, load=mocker.MagicMock(return_value=0.1))
+    task_executor = workers.WorkerProcessExecutor(concurrency=limit)
+    ctxs = [mocker.MagicMock() for _ in range(5)]
+    for task_id, ctx in enumerate(ctxs):
+        ctx.task.id = task_id
+    try:
+        for ctx in ctxs:
+            task_executor._execute(ctx)
+        assert started == ctxs[:2]
+
+        task_executor._handle_task_succeeded_request(task_id=0)
+        assert started == ctxs[:3]
+
+        # The limit is doubled once as many tasks as the limit ended
+        task_executor._handle_task_succeeded_request(task_id=1)
+        assert limit.limit == 4
+        assert started == ctxs
+
+        task_executor.terminate(task_id=2)
+        assert len(task_executor._dispatched) == 2
+    finally:
+        task_executor.close()
+
+
+def test_workers_trace(mocker):
+    mocker.patch('aria.orchestrator.workflows.executor.process.ProcessExecutor'
+                 '._execute')
+    mocker.patch('aria.orchestrator.workflows.executor.process.ProcessExecutor'
+                 '._handle_task_failed_request')
+    trace = tracing.TaskTrace()
+    task_executor = workers.WorkerProcessExecutor(trace=trace)
+    ctx = mocker.MagicMock()
+    ctx.task.id = 1
+    try:
+        task_executor._tasks[1] = mocker.MagicMock()
+        task_executor._tasks[1].proc.pid = 100
+        task_executor._execute(ctx)
+        task_executor._handle_task_failed_request(task_id=1, request={})
+    finally:
+        task_executor.close()
+
+    attempt, = trace.attempts(1)
+    assert attempt['pid'] == 100
+    assert attempt['succeeded'] is False
+    assert attempt['queued'] <= attempt['started'] <= attempt['ended']
@@ -0,0 +1,109 @@
+########
+# Copyright (c) 2017 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import pytest
+
+from aria.modeling import exceptions as modeling_exceptions
+from aria.orchestrator import exceptions as aria_exceptions
+
+from aria_plugin import workflows
+
+
+@pytest.fixture
+def service(mocker):
+    service = mocker.MagicMock()
+    service.id = 1
+    service.executions = []
+    service.workflows = {}
+    return service
+
+
+def _preparer(service, workflow_name):
+    return workflows.ExecutionPreparer(
+        'model_storage', 'resource_storage', 'plugin_manager', service,
+        workflow_name)
+
+
+def test_plugin_workflow_execution(service):
+    preparer = _preparer(service, workflows.INSTALL_NODES)
+
+    execution = preparer._create_execution_model({'node_names': ['a_1']})
+
+    assert execution.workflow_name == workflows.INSTALL_NODES
+    assert execution.inputs['node_names'].value == ['a_1']
+    assert preparer._get_workflow_fn(workflows.INSTALL_NODES) is \
+        workflows.install_nodes
+
+
+def test_plugin_workflow_active_execution(mocker, service):
+    active_execution = mocker.MagicMock()
+    active_execution.is_active.return_value = True
+    service.executions = [active_execution]
+
+    with pytest.raises(aria_exceptions.ActiveExecutionsError):
+        _preparer(service, workflows.UNINSTALL_NODES)._create_execution_model()
+
+
+def test_builtin_workflow_execution(service):
+    preparer = _preparer(service, 'install')
+
+    with pytest.raises(modeling_exceptions.UndeclaredInputsException):
+        preparer._create_execution_model({'node_names': ['a_1']})
+    assert preparer._create_execution_model().workflow_name == 'install'
+
+
+def _node(mocker, name, state):
+    node = mocker.MagicMock(state=state)
+    node.name = name
+    return node
+
+
+def _execution(mocker, status, created_at=0, tasks=()):
+    return mocker.MagicMock(status=status, created_at=created_at,
+                            tasks=list(tasks), FAILED='failed',
+                            CANCELLED='cancelled')
+
+
+def test_remaining_nodes(mocker, service):
+    service.nodes = dict((node.name, node) for node in (
+        _node(mocker, 'a_1', 'started'), _node(mocker, 'b_1', 'created'),
+        _node(mocker, 'c_1', 'initial')))
+    service.executions = [_execution(mocker, 'succeeded')]
+
+    assert workflows.remaining_nodes(
+        service, workflows.INSTALLED_STATES) == ['b_1', 'c_1']
+    assert workflows.remaining_nodes(
+        service, workflows.UNINSTALLED_STATES) == ['a_1', 'b_1']
+
+
+def test_remaining_nodes_failed_tasks(mocker, service):
+    service.nodes = dict((node.name, node) for node in (
+        _node(mocker, 'a_1', 'started'), _node(mocker, 'b_1', 'started'),
+        _node(mocker, 'c_1', 'started')))
+    failed_task = mocker.MagicMock(status='failed', FAILED='failed',
+                                   node=None)
+    failed_task.relationship.source_node.name = 'b_1'
+    succeeded_task = mocker.MagicMock(status='succeeded', FAILED='failed')
+    service.executions = [
+        _execution(mocker, 'succeeded', created_at=1),
+        _execution(mocker, 'failed', created_at=2,
+                   tasks=[failed_task, succeeded_task])]
+
+    assert workflows.remaining_nodes(
+        service, workflows.INSTALLED_STATES) == ['b_1']
+
+    service.executions.append(_execution(mocker, 'succeeded', created_at=3))
+    assert workflows.remaining_nodes(service,
+                                     workflows.INSTALLED_STATES) == []